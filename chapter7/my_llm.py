@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import urllib.request
 from typing import Iterator, Optional
 from openai import OpenAI
@@ -17,6 +18,11 @@ class MyLLM(HelloAgentsLLM):
             provider:Optional[str] = "auto",
             **kwargs
     ):
+        # echo=False 时不回显模型输出(服务端模式); 回显时合并小片段后再写, 避免每个token一次系统调用
+        self.echo = kwargs.pop("echo", True)
+        self.echo_buffer_size = kwargs.pop("echo_buffer_size", 64)
+        self._echo_buffer = []
+        self._echo_pending = 0
         if provider in {"modelscope", "ollama"}:
             print(f"使用自定义的 {provider} provider")
             self.provider = provider
@@ -55,6 +61,24 @@ class MyLLM(HelloAgentsLLM):
         else:
             super().__init__(model, api_key, base_url, provider, **kwargs)
 
+    def _echo(self, content: str) -> None:
+        """缓冲回显的文本片段, 攒够echo_buffer_size个字符或遇到换行时才写出"""
+        if not self.echo:
+            return
+        self._echo_buffer.append(content)
+        self._echo_pending += len(content)
+        if self._echo_pending >= self.echo_buffer_size or "\n" in content:
+            self._echo_flush()
+
+    def _echo_flush(self, end: str = "") -> None:
+        """写出缓冲中的内容"""
+        if not self.echo:
+            return
+        sys.stdout.write("".join(self._echo_buffer) + end)
+        sys.stdout.flush()
+        self._echo_buffer.clear()
+        self._echo_pending = 0
+
     def think(self, messages: list[dict[str, str]], temperature: Optional[float] = None) -> Iterator[str]:
             """
             [修复版] 调用大语言模型进行思考，并增加对空响应包的安全检查。
@@ -102,9 +126,9 @@ class MyLLM(HelloAgentsLLM):
                         content = choices[0]["message"].get("content") or ""
 
                     if content:
-                        print(content, end="", flush=True)
+                        self._echo(content)
                         yield content
-                        print()
+                        self._echo_flush("\n")
                     return
                 except Exception as e:
                     print(f"调用LLM API时发生错误: {e}")
@@ -141,16 +165,16 @@ class MyLLM(HelloAgentsLLM):
                         content = getattr(delta, 'content', "") or ""
                         
                         if content:
-                            print(content, end="", flush=True)
+                            self._echo(content)
                             yield content
                 else:
                     if response.choices:
                         content = response.choices[0].message.content or ""
                         if content:
-                            print(content, end="", flush=True)
+                            self._echo(content)
                             yield content
 
-                print()  # 在流式输出结束后换行
+                self._echo_flush("\n")  # 在流式输出结束后换行
 
             except Exception as e:
                 if getattr(self, "provider", None) == "ollama" and stream_mode:
@@ -161,9 +185,9 @@ class MyLLM(HelloAgentsLLM):
                         if fallback_response.choices:
                             content = fallback_response.choices[0].message.content or ""
                             if content:
-                                print(content, end="", flush=True)
+                                self._echo(content)
                                 yield content
-                                print()
+                                self._echo_flush("\n")
                                 return
                     except Exception:
                         pass
@@ -26,7 +26,13 @@ Action: 你决定采取的行动，必须是以下格式之一：
 现在开始你的推理和行动：
 """
 
+# 原生工具调用模式的系统提示词: 工具定义通过tools参数传给模型, 不再需要约定Action格式
+MY_REACT_NATIVE_PROMPT = """你是一个具备推理和行动能力的AI助手。请先思考分析问题，需要外部信息时调用合适的工具，
+可以一次调用多个互不依赖的工具。工具结果不够时继续调用其他工具或换用不同参数；
+当你确信有足够信息时，直接给出最终答案，不要再调用工具。"""
+
 import re
+import sys
 from typing import Optional, List, Tuple
 from hello_agents import ReActAgent, HelloAgentsLLM, Config, Message, ToolRegistry
 
@@ -43,17 +49,75 @@ class MyReActAgent(ReActAgent):
         system_prompt: Optional[str] = None,
         config: Optional[Config] = None,
         max_steps: int = 5,
-        custom_prompt: Optional[str] = None
+        custom_prompt: Optional[str] = None,
+        use_native_tools: Optional[bool] = None,
+        timeout: Optional[float] = None
     ):
         super().__init__(name, llm, system_prompt, config)
         self.tool_registry = tool_registry
         self.max_steps = max_steps
         self.current_history: List[str] = []
         self.prompt_template = custom_prompt if custom_prompt else MY_REACT_PROMPT
-        print(f"✅ {name} 初始化完成，最大步数: {max_steps}")
+        # LLM支持原生工具调用时(如my_agent的AgentsLLM)默认使用, 省去Thought/Action文本的格式解析与重试
+        if use_native_tools is None:
+            use_native_tools = getattr(llm, "supports_native_tools", False) and custom_prompt is None
+        self.use_native_tools = use_native_tools
+        # 整个run的时间预算(秒): 每一步的LLM调用、工具调用与重试共享同一个截止时间, 到期后返回已获得的信息
+        self.timeout = timeout
+        print(f"✅ {name} 初始化完成，最大步数: {max_steps}{'，原生工具调用' if use_native_tools else ''}")
 
     def run(self, input_text: str, **kwargs) -> str:
         """运行ReAct Agent"""
+        runtime = self._runtime()
+        if runtime is None:
+            return self._run_steps(input_text, **kwargs)
+        with runtime.deadline(self.timeout):
+            try:
+                return self._run_steps(input_text, **kwargs)
+            except runtime.DeadlineExceeded as e:
+                print(f"⏰ 运行超时: {e}")
+                final_answer = self._partial_answer()
+                self.add_message(Message(input_text, "user"))
+                self.add_message(Message(final_answer, "assistant"))
+                return final_answer
+
+    def _runtime(self):
+        """
+        my_agent的运行上下文模块。设置了timeout时导入它以建立截止时间;
+        否则只有调用方已经在my_agent的运行中(模块已被导入)时才需要继承外层的截止时间。
+        """
+        if self.timeout is not None:
+            import my_agent.core.runtime as runtime
+            return runtime
+        return sys.modules.get("my_agent.core.runtime")
+
+    def _check_deadline(self) -> None:
+        """每一步开始前检查截止时间, 兼容不感知截止时间的LLM(如HelloAgentsLLM)"""
+        runtime = self._runtime()
+        if runtime is not None:
+            runtime.check_deadline()
+
+    def _call_tool(self, fn, *args):
+        """在剩余时间内执行工具, 超时抛出DeadlineExceeded"""
+        runtime = self._runtime()
+        if runtime is None:
+            return fn(*args)
+        return runtime.call_with_deadline(fn, *args)
+
+    def _is_deadline_error(self, error: Exception) -> bool:
+        runtime = self._runtime()
+        return runtime is not None and isinstance(error, runtime.DeadlineExceeded)
+
+    def _partial_answer(self) -> str:
+        """超时时的部分结果: 已经获得的观察"""
+        observations = [line for line in self.current_history if line.startswith("Observation:")]
+        if not observations:
+            return "抱歉，我无法在限定时间内完成这个任务。"
+        return "抱歉，我无法在限定时间内完成这个任务。以下是目前已获得的信息：\n" + "\n".join(observations)
+
+    def _run_steps(self, input_text: str, **kwargs) -> str:
+        if self.use_native_tools:
+            return self._run_native(input_text, **kwargs)
         self.current_history = []
         current_step = 0
 
@@ -61,6 +125,7 @@ class MyReActAgent(ReActAgent):
 
         while current_step < self.max_steps:
             current_step += 1
+            self._check_deadline()
             print(f"\n--- 第 {current_step} 步 ---")
 
             # 1. 构建提示词
@@ -74,7 +139,7 @@ class MyReActAgent(ReActAgent):
 
             # 2. 调用LLM
             messages = [{"role": "user", "content": prompt}]
-            response_text = self.llm.invoke(messages, **kwargs)
+            response_text = self._complete_until_observation(messages, **kwargs)
 
             # 3. 解析输出
             thought, action = self._parse_output(response_text)
@@ -89,7 +154,7 @@ class MyReActAgent(ReActAgent):
             # 5. 执行工具调用
             if action:
                 tool_name, tool_input = self._parse_action(action)
-                observation = self.tool_registry.execute_tool(tool_name, tool_input)
+                observation = self._call_tool(self.tool_registry.execute_tool, tool_name, tool_input)
                 self.current_history.append(f"Action: {action}")
                 self.current_history.append(f"Observation: {observation}")
 
@@ -97,4 +162,67 @@ class MyReActAgent(ReActAgent):
         final_answer = "抱歉，我无法在限定步数内完成这个任务。"
         self.add_message(Message(input_text, "user"))
         self.add_message(Message(final_answer, "assistant"))
-        return final_answer
\ No newline at end of file
+        return final_answer
+
+    def _complete_until_observation(self, messages: list, **kwargs) -> str:
+        """
+        Observation由工具执行产生, 模型自己续写的Observation会被丢弃, 用stop让它在这里停下。
+        支持流式事件的LLM(AgentsLLM)走流式请求, 客户端命中stop后立即断开, 之后的输出不再生成;
+        其他LLM客户端退回invoke, 只能由服务端处理stop。
+        """
+        kwargs = {"stop": ["Observation:"], **kwargs}
+        if hasattr(self.llm, "think_events"):
+            from my_agent.core.events import ContentEvent
+
+            events = self.llm.think_events(messages, **kwargs)
+            return "".join(event.text for event in events if isinstance(event, ContentEvent))
+        return self.llm.invoke(messages, **kwargs)
+
+    def _run_native(self, input_text: str, **kwargs) -> str:
+        """原生工具调用版本的ReAct循环: 每一步模型要么发起(可能并行的)工具调用, 要么直接给出最终答案"""
+        from my_agent.core.tools import tools_from_registry, tool_result_message
+
+        self.current_history = []
+        tools = tools_from_registry(self.tool_registry)
+        messages = [
+            {"role": "system", "content": self.system_prompt or MY_REACT_NATIVE_PROMPT},
+            {"role": "user", "content": input_text},
+        ]
+        print(f"\n🤖 {self.name} 开始处理问题: {input_text}")
+
+        for current_step in range(1, self.max_steps + 1):
+            self._check_deadline()
+            print(f"\n--- 第 {current_step} 步 ---")
+            response = self.llm.invoke(messages, tools=tools, **kwargs)
+
+            if not response.tool_calls:
+                final_answer = response.content or ""
+                self.add_message(Message(input_text, "user"))
+                self.add_message(Message(final_answer, "assistant"))
+                return final_answer
+
+            if response.content:
+                print(f"🤔 思考: {response.content}")
+            messages.append(response.to_message())
+            for call in response.tool_calls:
+                try:
+                    args = call.args
+                    tool = self.tool_registry.get_tool(call.name)
+                    if tool is not None:
+                        observation = self._call_tool(tool.run, args)
+                    else:
+                        observation = self._call_tool(self.tool_registry.execute_tool, call.name, args.get("input", ""))
+                except Exception as e:
+                    if self._is_deadline_error(e):
+                        raise
+                    observation = f"工具调用失败: {e}"
+                print(f"🎬 行动: {call.name}({call.arguments})\n👀 观察: {observation}")
+                self.current_history.append(f"Action: {call.name}[{call.arguments}]")
+                self.current_history.append(f"Observation: {observation}")
+                messages.append(tool_result_message(call, str(observation)))
+
+        # 达到最大步数
+        final_answer = "抱歉，我无法在限定步数内完成这个任务。"
+        self.add_message(Message(input_text, "user"))
+        self.add_message(Message(final_answer, "assistant"))
+        return final_answer
@@ -16,12 +16,19 @@ class MySimpleAgent(SimpleAgent):
         system_prompt: Optional[str] = None,
         config: Optional[Config] = None,
         tool_registry: Optional['ToolRegistry'] = None,
-        enable_tool_calling: bool = True
+        enable_tool_calling: bool = True,
+        use_native_tools: Optional[bool] = None
     ):
         super().__init__(name, llm, system_prompt, config)
         self.tool_registry = tool_registry
         self.enable_tool_calling = enable_tool_calling and tool_registry is not None
-        print(f" {name} 初始化完成，工具调用: {'启用' if self.enable_tool_calling else '禁用'}")
+        # 原生工具调用: 工具定义通过tools参数传给模型, 不再写进提示词并用正则解析[TOOL_CALL:...]
+        # 默认在LLM支持时启用(如my_agent的AgentsLLM)
+        if use_native_tools is None:
+            use_native_tools = getattr(llm, "supports_native_tools", False)
+        self.use_native_tools = use_native_tools
+        print(f" {name} 初始化完成，工具调用: {'启用' if self.enable_tool_calling else '禁用'}"
+              f"{'(原生)' if self.enable_tool_calling and self.use_native_tools else ''}")
     
     def run(self, input_text: str, max_tool_iterations: int = 3, **kwargs) -> str:
         """
@@ -51,13 +58,15 @@ class MySimpleAgent(SimpleAgent):
             return response
 
         # 支持多轮工具调用的逻辑
+        if self.use_native_tools:
+            return self._run_with_native_tools(messages, input_text, max_tool_iterations, **kwargs)
         return self._run_with_tools(messages, input_text, max_tool_iterations, **kwargs)
 
     def _get_enhanced_system_prompt(self) -> str:
         """构建增强的系统提示词，包含工具信息"""
         base_prompt = self.system_prompt or "你是一个有用的AI助手。"
 
-        if not self.enable_tool_calling or not self.tool_registry:
+        if not self.enable_tool_calling or not self.tool_registry or self.use_native_tools:
             return base_prompt
 
         # 获取工具描述
@@ -126,6 +135,46 @@ class MySimpleAgent(SimpleAgent):
 
         return final_response
 
+    def _run_with_native_tools(self, messages: list, input_text: str, max_tool_iterations: int, **kwargs) -> str:
+        """原生工具调用的运行逻辑: 模型返回结构化的(可能并行的)工具调用, 结果以tool消息回传"""
+        from my_agent.core.tools import tools_from_registry, tool_result_message
+
+        tools = tools_from_registry(self.tool_registry)
+        final_response = None
+
+        for _ in range(max_tool_iterations):
+            response = self.llm.invoke(messages, tools=tools, **kwargs)
+            if not response.tool_calls:
+                final_response = response.content or ""
+                break
+
+            print(f" 检测到 {len(response.tool_calls)} 个工具调用")
+            messages.append(response.to_message())
+            for call in response.tool_calls:
+                messages.append(tool_result_message(call, self._execute_native_tool_call(call)))
+
+        # 达到最大迭代次数时禁止继续调用工具, 让模型基于已有结果作答
+        if final_response is None:
+            final_response = self.llm.invoke(messages, tools=tools, tool_choice="none", **kwargs).content or ""
+
+        self.add_message(Message(input_text, "user"))
+        self.add_message(Message(final_response, "assistant"))
+        print(f" {self.name} 响应完成")
+
+        return final_response
+
+    def _execute_native_tool_call(self, call) -> str:
+        """执行一个原生工具调用, 参数已是模型生成的JSON, 无需再做字符串解析"""
+        try:
+            args = call.args
+            tool = self.tool_registry.get_tool(call.name)
+            if tool is not None:
+                return str(tool.run(args))
+            # 以函数形式注册的工具只接收一个字符串参数
+            return str(self.tool_registry.execute_tool(call.name, args.get("input", "")))
+        except Exception as e:
+            return f" 工具调用失败：{str(e)}"
+
     def _parse_tool_calls(self, text: str) -> list:
         """解析文本中的工具调用"""
         pattern = r'\[TOOL_CALL:([^:]+):([^\]]+)\]'
@@ -209,14 +258,12 @@ class MySimpleAgent(SimpleAgent):
         messages.append({"role": "user", "content": input_text})
 
         # 流式调用LLM
-        full_response = ""
-        print("📝 实时响应: ", end="")
+        # LLM客户端自身已经负责回显输出, 这里不再逐块打印, 避免重复输出
+        chunks = []
         for chunk in self.llm.stream_invoke(messages, **kwargs):
-            full_response += chunk
-            print(chunk, end="", flush=True)
+            chunks.append(chunk)
             yield chunk
-
-        print()  # 换行
+        full_response = "".join(chunks)
 
         # 保存完整对话到历史记录
         self.add_message(Message(input_text, "user"))
@@ -0,0 +1 @@
+"""压测工具: 本地OpenAI兼容桩服务(stub_server)与负载生成器(loadgen)"""
@@ -0,0 +1,128 @@
+"""
+导入耗时基准: 在干净的子进程中用 python -X importtime 导入目标模块,
+汇总总耗时与最慢的模块, 超出预算或导入了不该提前导入的模块(默认openai)时以非零状态退出, 可直接用于CI:
+
+    python -m my_agent.bench.import_time --budget-ms 250
+    python -m my_agent.bench.import_time --module my_agent.core.agent --forbid openai --forbid httpx
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from typing import Optional
+
+# 默认预算(毫秒), 可通过环境变量IMPORT_TIME_BUDGET_MS覆盖
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", 300))
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportReport:
+    """一次导入的耗时明细"""
+    target: str
+    records: list[ImportRecord] = field(default_factory=list)
+
+    @property
+    def total_ms(self) -> float:
+        """目标模块的累计导入耗时(含其导入的所有模块)"""
+        for record in self.records:
+            if record.module == self.target:
+                return record.cumulative_us / 1000
+        return sum(r.self_us for r in self.records) / 1000
+
+    @property
+    def modules(self) -> set[str]:
+        return {record.module for record in self.records}
+
+    def slowest(self, n: int = 10) -> list[ImportRecord]:
+        """按自身耗时排序的最慢模块"""
+        return sorted(self.records, key=lambda r: r.self_us, reverse=True)[:n]
+
+    def top_level(self, n: int = 10) -> list[ImportRecord]:
+        """按累计耗时排序的顶层依赖(如openai、pydantic), 更容易看出是谁拖慢了启动"""
+        roots: dict[str, int] = {}
+        for record in self.records:
+            root = record.module.split(".")[0]
+            roots[root] = roots.get(root, 0) + record.self_us
+        ordered = sorted(roots.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [ImportRecord(name, us, us, 0) for name, us in ordered]
+
+
+def parse_importtime(stderr: str) -> list[ImportRecord]:
+    """解析 -X importtime 的输出行: 'import time: self [us] | cumulative | imported package'"""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # 表头行
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        records.append(ImportRecord(name.strip(), self_us, cumulative_us, depth))
+    return records
+
+
+def measure(module: str, python: Optional[str] = None) -> ImportReport:
+    """在新的解释器中导入module并返回耗时明细(不受当前进程已导入模块的影响)"""
+    result = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入{module}失败:\n{result.stderr[-2000:]}")
+    return ImportReport(module, parse_importtime(result.stderr))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="my_agent导入耗时基准")
+    parser.add_argument("--module", action="append", help="要测量的模块, 可重复; 默认my_agent.core.agent与my_agent.core.llm")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="单个模块的导入预算(毫秒)")
+    parser.add_argument("--forbid", action="append", help="导入时不应被加载的模块, 可重复; 默认openai")
+    parser.add_argument("--repeat", type=int, default=3, help="重复测量次数, 取最小值以降低抖动")
+    parser.add_argument("--top", type=int, default=8, help="展示最慢的模块数")
+    parser.add_argument("--json", action="store_true", help="以JSON输出")
+    args = parser.parse_args(argv)
+    modules = args.module or ["my_agent.core.agent", "my_agent.core.llm"]
+    forbidden = args.forbid or ["openai"]
+
+    ok = True
+    summary = {}
+    for module in modules:
+        reports = [measure(module) for _ in range(max(1, args.repeat))]
+        report = min(reports, key=lambda r: r.total_ms)
+        leaked = sorted(name for name in forbidden if name in report.modules)
+        passed = report.total_ms <= args.budget_ms and not leaked
+        ok = ok and passed
+        summary[module] = {
+            "total_ms": round(report.total_ms, 1),
+            "budget_ms": args.budget_ms,
+            "forbidden_imported": leaked,
+            "passed": passed,
+            "top_level": {r.module: round(r.self_us / 1000, 1) for r in report.top_level(args.top)},
+            "slowest": {r.module: round(r.self_us / 1000, 1) for r in report.slowest(args.top)},
+        }
+        if not args.json:
+            mark = "✅" if passed else "❌"
+            print(f"{mark} {module}: {report.total_ms:.1f}ms (预算 {args.budget_ms:.0f}ms)")
+            if leaked:
+                print(f"   提前导入了: {', '.join(leaked)}")
+            print("   顶层依赖: " + ", ".join(f"{k}={v}ms" for k, v in summary[module]["top_level"].items()))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
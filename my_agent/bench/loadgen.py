@@ -0,0 +1,184 @@
+"""
+负载生成器: 以目标并发驱动AgentsLLM, 报告吞吐、首token延迟(TTFT)与p50/p95/p99。
+
+    # 另开终端启动桩服务后压测
+    python -m my_agent.bench.loadgen --base-url http://127.0.0.1:8000/v1 --concurrency 64 --requests 2000
+    # 或在同一进程内拉起桩服务
+    python -m my_agent.bench.loadgen --stub --concurrency 64 --duration 30
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Optional
+
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.events import ContentEvent
+from my_agent.core.usage import UsageTracker
+from my_agent.bench.stub_server import StubServer, StubSettings
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近秩法分位数, 空列表返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+@dataclass
+class LoadResult:
+    """一次压测的原始样本与汇总"""
+    duration: float = 0.0
+    ttft: list[float] = field(default_factory=list)
+    latency: list[float] = field(default_factory=list)
+    chunks: int = 0
+    errors: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def completed(self) -> int:
+        return len(self.latency)
+
+    def summary(self) -> dict:
+        def dist(values: list[float]) -> dict:
+            return {f"p{p}": round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)}
+
+        duration = self.duration or 1e-9
+        return {
+            "requests": self.completed + sum(self.errors.values()),
+            "completed": self.completed,
+            "errors": dict(self.errors),
+            "duration_s": round(self.duration, 3),
+            "throughput_rps": round(self.completed / duration, 2),
+            "chunks_per_s": round(self.chunks / duration, 1),
+            "ttft_ms": dist(self.ttft),
+            "latency_ms": dist(self.latency),
+        }
+
+
+async def run_load(
+    llm: AgentsLLM,
+    concurrency: int,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    stream: bool = True,
+    max_tokens: Optional[int] = None,
+    prompt: str = "压测请求",
+) -> LoadResult:
+    """
+    以固定并发持续发请求, 直到发满requests个或运行满duration秒。
+
+    Args:
+        llm: 被压测的客户端
+        concurrency: 同时在途的请求数
+        requests: 总请求数
+        duration: 运行秒数, 与requests同时给出时先到者为准
+        stream: 是否使用流式接口(流式才能测到TTFT)
+        max_tokens: 每个请求的max_tokens
+        prompt: 请求内容, 每个请求附带序号以避开缓存与请求合并
+    """
+    if requests is None and duration is None:
+        raise ValueError("requests与duration至少指定一个")
+    result = LoadResult()
+    issued = 0
+    start = time.monotonic()
+    deadline = start + duration if duration else None
+
+    def next_index() -> Optional[int]:
+        nonlocal issued
+        if requests is not None and issued >= requests:
+            return None
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        issued += 1
+        return issued
+
+    async def one(index: int) -> None:
+        messages = [{"role": "user", "content": f"{prompt} #{index}"}]
+        sent = time.monotonic()
+        if stream:
+            first = None
+            async for event in llm.athink_events(messages, max_tokens=max_tokens):
+                if not isinstance(event, ContentEvent):
+                    continue
+                if first is None:
+                    first = time.monotonic()
+                result.chunks += 1
+            result.ttft.append((first or time.monotonic()) - sent)
+        else:
+            await llm.ainvoke(messages, max_tokens=max_tokens)
+            result.ttft.append(time.monotonic() - sent)
+            result.chunks += 1
+        result.latency.append(time.monotonic() - sent)
+
+    async def worker() -> None:
+        while (index := next_index()) is not None:
+            try:
+                await one(index)
+            except Exception as e:
+                name = type(e).__name__
+                result.errors[name] = result.errors.get(name, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.duration = time.monotonic() - start
+    return result
+
+
+def format_summary(summary: dict) -> str:
+    lines = [
+        f"请求: {summary['requests']} (成功 {summary['completed']}, 失败 {sum(summary['errors'].values())} {summary['errors'] or ''})",
+        f"耗时: {summary['duration_s']}s  吞吐: {summary['throughput_rps']} req/s  片段: {summary['chunks_per_s']}/s",
+        "TTFT(ms):  " + "  ".join(f"{k}={v}" for k, v in summary["ttft_ms"].items()),
+        "延迟(ms):  " + "  ".join(f"{k}={v}" for k, v in summary["latency_ms"].items()),
+    ]
+    return "\n".join(lines)
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    server = None
+    base_url = args.base_url
+    if args.stub:
+        settings = StubSettings(latency=args.stub_latency, token_rate=args.stub_token_rate,
+                                error_rate=args.stub_error_rate)
+        server = await StubServer(settings, port=0).start()
+        base_url = server.base_url
+    llm = AgentsLLM(
+        model=args.model, provider="local", base_url=base_url,
+        max_concurrency=args.concurrency, sink="null", usage_tracker=UsageTracker(),
+    )
+    try:
+        result = await run_load(llm, args.concurrency, args.requests, args.duration,
+                                stream=not args.no_stream, max_tokens=args.max_tokens)
+    finally:
+        if server is not None:
+            await server.stop()
+    return result.summary()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="AgentsLLM负载生成器")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/v1", help="服务地址, 逗号分隔多个时启用端点池")
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=None, help="总请求数")
+    parser.add_argument("--duration", type=float, default=None, help="运行秒数")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式接口")
+    parser.add_argument("--json", action="store_true", help="以JSON输出汇总")
+    parser.add_argument("--stub", action="store_true", help="在本进程内启动桩服务(与负载共用事件循环)")
+    parser.add_argument("--stub-latency", type=float, default=0.1)
+    parser.add_argument("--stub-token-rate", type=float, default=200.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    if args.requests is None and args.duration is None:
+        args.requests = 200
+
+    summary = asyncio.run(_main(args))
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+本地OpenAI兼容桩服务, 只依赖标准库asyncio。
+
+实现 POST /v1/chat/completions(流式SSE与非流式) 和 GET /v1/models,
+可配置首token延迟、生成速度与错误注入, 用于在笔记本上压测客户端、重试和连接池逻辑:
+
+    python -m my_agent.bench.stub_server --port 8000 --latency 0.2 --token-rate 100 --error-rate 0.05
+"""
+
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class StubSettings:
+    """桩服务的行为参数"""
+    latency: float = 0.1            # 首token(或非流式响应)前的等待秒数
+    token_rate: float = 200.0       # 每秒生成的token数, 0表示不限速
+    tokens: int = 64                # 请求未指定max_tokens时生成的token数
+    error_rate: float = 0.0         # 按概率返回错误响应
+    error_status: int = 503         # 注入错误使用的HTTP状态码
+    retry_after: Optional[float] = None  # 注入错误时附带的Retry-After秒数
+    model: str = "stub-model"
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+class StubServer:
+    """
+    极简的HTTP/1.1服务, 支持keep-alive, 流式响应使用chunked编码发送SSE。
+    统计请求数与注入的错误数, 便于与客户端侧的指标对照。
+    """
+
+    def __init__(self, settings: Optional[StubSettings] = None, host: str = "127.0.0.1", port: int = 8000):
+        """
+        Args:
+            settings: 行为参数, 默认StubSettings()
+            host: 监听地址
+            port: 监听端口, 传0时由系统分配(启动后从self.port读取)
+        """
+        self.settings = settings or StubSettings()
+        self.host = host
+        self.port = port
+        self.stats = {"requests": 0, "errors": 0, "streams": 0}
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._connections: set[asyncio.StreamWriter] = set()
+        self._handlers: set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        print(f"🧪 桩服务已启动: {self.base_url}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        """停止监听并关闭所有keep-alive连接, 等待连接处理协程退出"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in list(self._connections):
+            writer.close()
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=1.0)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个连接上的多个请求(keep-alive), 客户端断开时退出"""
+        self._connections.add(writer)
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                length = int(headers.get("content-length", 0))
+                if length:
+                    body = await reader.readexactly(length)
+                await self._route(method, path, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        path = path.split("?", 1)[0].rstrip("/")
+        if method == "GET" and path.endswith("/models"):
+            await self._send_json(writer, 200, {"object": "list", "data": [{"id": self.settings.model, "object": "model"}]})
+        elif method == "POST" and path.endswith("/chat/completions"):
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                await self._send_json(writer, 400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+                return
+            await self._chat(payload, writer)
+        else:
+            await self._send_json(writer, 404, {"error": {"message": f"unknown route {path}", "type": "not_found"}})
+
+    async def _chat(self, payload: dict, writer: asyncio.StreamWriter) -> None:
+        settings = self.settings
+        self.stats["requests"] += 1
+        if settings.error_rate and random.random() < settings.error_rate:
+            self.stats["errors"] += 1
+            headers = {"retry-after": str(settings.retry_after)} if settings.retry_after is not None else {}
+            await self._send_json(writer, settings.error_status,
+                                  {"error": {"message": "injected error", "type": "server_error"}}, headers)
+            return
+
+        n_tokens = payload.get("max_tokens") or settings.tokens
+        prompt_tokens = sum(len(str(m.get("content") or "")) // 4 + 4 for m in payload.get("messages", []))
+        model = payload.get("model") or settings.model
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens}
+        interval = 1.0 / settings.token_rate if settings.token_rate else 0.0
+        # 与真实服务一致: 输出被请求的max_tokens截断时为length, 否则视为自然结束
+        finish_reason = "length" if payload.get("max_tokens") else "stop"
+
+        await asyncio.sleep(settings.latency)
+        if not payload.get("stream"):
+            await asyncio.sleep(interval * n_tokens)
+            await self._send_json(writer, 200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": self._text(n_tokens)}}],
+                "usage": usage,
+            })
+            return
+
+        self.stats["streams"] += 1
+        writer.write(self._head(200, {"content-type": "text/event-stream", "transfer-encoding": "chunked"}))
+
+        def chunk(delta: dict, finish: Optional[str] = None, chunk_usage: Optional[dict] = None) -> dict:
+            choices = [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish}]
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": choices}
+            if chunk_usage:
+                data["usage"] = chunk_usage
+            return data
+
+        await self._send_event(writer, chunk({"role": "assistant", "content": ""}))
+        start = time.monotonic()
+        for i in range(n_tokens):
+            # 按绝对时间对齐发送节奏, 避免sleep误差累积
+            delay = start + i * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._send_event(writer, chunk({"content": f"tok{i} "}))
+        await self._send_event(writer, chunk({}, finish_reason))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            await self._send_event(writer, chunk({}, chunk_usage=usage))
+        await self._send_raw(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _text(n_tokens: int) -> str:
+        return "".join(f"tok{i} " for i in range(n_tokens))
+
+    @staticmethod
+    def _head(status: int, headers: dict) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, data: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        head = {"content-type": "application/json", "content-length": str(len(body)), **(headers or {})}
+        writer.write(self._head(status, head) + body)
+        await writer.drain()
+
+    async def _send_event(self, writer: asyncio.StreamWriter, data: dict) -> None:
+        await self._send_raw(writer, f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    @staticmethod
+    async def _send_raw(writer: asyncio.StreamWriter, payload: bytes) -> None:
+        writer.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+        await writer.drain()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.1, help="首token延迟秒数")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="每秒生成token数, 0表示不限速")
+    parser.add_argument("--tokens", type=int, default=64, help="请求未指定max_tokens时生成的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="错误注入概率")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误的HTTP状态码")
+    parser.add_argument("--retry-after", type=float, default=None, help="注入错误时附带的Retry-After秒数")
+    args = parser.parse_args(argv)
+    settings = StubSettings(
+        latency=args.latency, token_rate=args.token_rate, tokens=args.tokens,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+    )
+    try:
+        asyncio.run(StubServer(settings, args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
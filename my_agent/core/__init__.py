@@ -1,6 +1,6 @@
 """核心框架模块 - 延迟导入以避免循环依赖"""
 
-__all__ = ["Agent", "AgentsLLM", "LLM", "Message", "Config", "AgentException"]
+__all__ = ["Agent", "AgentsLLM", "LLM", "Message", "Config", "AgentException", "LLMException", "ResponseCache", "Cassette", "ChatResponse", "ToolCall", "ModelRouter", "ModelRoute", "DeadlineExceeded", "deadline", "PriorityScheduler"]
 
 def __getattr__(name):
     if name == "Agent":
@@ -18,6 +18,30 @@ def __getattr__(name):
     if name == "AgentException":
         from .exceptions import AgentException
         return AgentException
+    if name == "LLMException":
+        from .exceptions import LLMException
+        return LLMException
+    if name == "DeadlineExceeded":
+        from .exceptions import DeadlineExceeded
+        return DeadlineExceeded
+    if name == "deadline":
+        from .runtime import deadline
+        return deadline
+    if name == "PriorityScheduler":
+        from .scheduler import PriorityScheduler
+        return PriorityScheduler
+    if name == "ResponseCache":
+        from .cache import ResponseCache
+        return ResponseCache
+    if name == "Cassette":
+        from .cassette import Cassette
+        return Cassette
+    if name in ("ChatResponse", "ToolCall"):
+        from . import tools
+        return getattr(tools, name)
+    if name in ("ModelRouter", "ModelRoute"):
+        from . import router
+        return getattr(router, name)
     raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def __dir__():
@@ -0,0 +1,152 @@
+"""自适应并发控制(AIMD): 延迟正常时线性放宽在途请求上限, 遇到429/5xx或延迟突增时成倍收紧, 按端点独立计算"""
+
+import time
+import asyncio
+import threading
+from typing import Optional
+
+from .metrics import MetricsRegistry, REGISTRY
+from .retry import is_retryable
+
+REGISTRY.describe("llm_concurrency_limit", "gauge", "自适应并发控制当前允许的在途请求数")
+REGISTRY.describe("llm_concurrency_inflight", "gauge", "自适应并发控制下的在途请求数")
+REGISTRY.describe("llm_concurrency_decrease_total", "counter", "并发上限被收紧的次数, 按原因(error/latency)区分")
+
+
+class AdaptiveLimiter:
+    """
+    单个端点的AIMD并发限制器。
+
+    每个成功的请求把上限增加increase/limit(即每一轮满载的请求约+increase);
+    请求因限流、5xx或连接错误失败, 或者延迟超过基线的latency_tolerance倍时, 上限乘以decrease。
+    基线取近期的最低延迟并缓慢上浮, 负载本身的长期变化不会让上限一直被压低;
+    一次拥塞往往让一批在途请求同时失败, 因此距上次收紧不足cooldown秒时不再重复收紧。
+    流式请求以拿到响应头的耗时作为延迟样本, 非流式请求按每个输出token的平均耗时计算, 两者各有基线。
+    """
+
+    def __init__(
+        self,
+        initial: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 256,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        cooldown: float = 1.0,
+        name: str = "default",
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            initial: 初始并发上限
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+            increase: 每轮满载后增加的并发数
+            decrease: 收紧时的乘数(0~1)
+            latency_tolerance: 延迟超过基线的倍数视为拥塞
+            cooldown: 两次收紧之间的最短间隔秒数
+            name: 端点标识, 用作指标标签
+            metrics: 指标注册表, 默认使用进程级的REGISTRY
+        """
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.name = name
+        self.metrics = metrics or REGISTRY
+        self.inflight = 0
+        self._baselines: dict[str, float] = {}
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+        self._publish()
+
+    def _publish(self) -> None:
+        self.metrics.set("llm_concurrency_limit", int(self.limit), endpoint=self.name)
+        self.metrics.set("llm_concurrency_inflight", self.inflight, endpoint=self.name)
+
+    def _try_acquire(self) -> bool:
+        """持锁调用。在途数未达上限时占用一个名额"""
+        if self.inflight >= int(self.limit):
+            return False
+        self.inflight += 1
+        self._publish()
+        return True
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到取得一个在途名额。
+
+        Returns:
+            bool: 是否取得名额, 等待超过timeout秒时返回False
+        """
+        with self._cond:
+            return self._cond.wait_for(self._try_acquire, timeout)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        """acquire的异步版本, 等待期间不阻塞事件循环"""
+        expires = None if timeout is None else time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return True
+            if expires is not None and time.monotonic() >= expires:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self, latency: Optional[float] = None, error: Optional[BaseException] = None, kind: str = "stream") -> None:
+        """
+        归还名额并根据结果调整上限。
+
+        Args:
+            latency: 延迟样本(秒), 为None时只按是否出错调整
+            error: 请求失败时的异常; 只有限流、5xx、连接类错误才视为拥塞
+            kind: 延迟样本的类别, 不同类别分别维护基线
+        """
+        with self._cond:
+            self.inflight = max(0, self.inflight - 1)
+            if error is not None:
+                if is_retryable(error):
+                    self._shrink("error")
+            elif latency is not None:
+                self._observe(latency, kind)
+            self._publish()
+            self._cond.notify_all()
+
+    def _observe(self, latency: float, kind: str) -> None:
+        baseline = self._baselines.get(kind)
+        if baseline is None or latency < baseline:
+            self._baselines[kind] = latency
+        else:
+            # 基线缓慢上浮, 跟上负载无关的长期变化(如换了更长的提示词)
+            self._baselines[kind] = baseline + (latency - baseline) * 0.01
+        if baseline is not None and latency > baseline * self.latency_tolerance:
+            self._shrink("latency")
+        elif self.inflight + 1 >= int(self.limit):
+            # 只有名额真正被用满时才放宽, 低负载下的成功不能说明端点还能承受更多
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def _shrink(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.metrics.inc("llm_concurrency_decrease_total", endpoint=self.name, reason=reason)
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_adaptive_limiter(endpoint: str, max_limit: float = 256) -> AdaptiveLimiter:
+    """获取端点对应的进程级自适应并发限制器, 同一端点的所有实例共享(以首次创建时的参数为准)"""
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            limiter = _limiters[endpoint] = AdaptiveLimiter(initial=min(8, max_limit), max_limit=max_limit, name=endpoint)
+        return limiter
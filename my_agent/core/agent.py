@@ -1,17 +1,56 @@
 """Agent 基类"""
 
+import functools
 from abc import ABC, abstractmethod
-from typing import Optional,Any
+from typing import TYPE_CHECKING,Optional,Any
 from .message import Message
 from .config import Config
-from .llm import LLM
+from .usage import Usage
+from .sinks import sink_from_config, diagnostic
+from .runtime import current_run, new_run_id, run_scope, deadline
+from .exceptions import DeadlineExceeded
+
+if TYPE_CHECKING:
+    # llm模块依赖较多, 只在需要创建默认LLM时导入, 让定义Agent子类的模块导入更快
+    from .llm import LLM
+
+
+def _scoped_run(run):
+    """
+    包装子类的run方法, 使其内部的LLM调用都归属于本Agent的一次运行;
+    配置了run_timeout时整个运行共享一个截止时间, 超时后返回已得到的部分结果(没有部分结果时抛出DeadlineExceeded)。
+    """
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        # 子类通过super().run()层层调用时只在最外层开启新的运行
+        if current_run().agent_id == self.agent_id:
+            return run(self, *args, **kwargs)
+        # 交互式的Agent运行默认走interactive通道, 调用方已指定优先级(如在批量任务中运行Agent)时沿用
+        priority = current_run().priority or "interactive"
+        with run_scope(agent=self.name, agent_type=type(self).__name__, agent_id=self.agent_id, run_id=new_run_id(), priority=priority):
+            with deadline(self.config.run_timeout):
+                try:
+                    return run(self, *args, **kwargs)
+                except DeadlineExceeded as e:
+                    if e.partial is None:
+                        raise
+                    sink = getattr(self.llm, "sink", None)
+                    (sink.info if sink is not None else diagnostic)(f"⏰ {self.name} 运行超时, 返回部分结果: {e}")
+                    return e.partial
+    return wrapper
 
 class Agent(ABC):
     """
     Agent 基类，定义智能体的核心接口和行为
     """
 
-    def __init__(self, name: str, llm: LLM, system_prompt: Optional[str] = None, config: Optional[Config] = None):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        run = cls.__dict__.get("run")
+        if run is not None and not getattr(run, "__isabstractmethod__", False):
+            cls.run = _scoped_run(run)
+
+    def __init__(self, name: str, llm: "LLM", system_prompt: Optional[str] = None, config: Optional[Config] = None):
         """
         初始化 Agent 实例。
 
@@ -22,12 +61,17 @@ class Agent(ABC):
             config: 可选的 Config 对象，包含可配置项。
         """
         self.name = name
-        # 如果未提供 llm，则创建一个默认 LLM 实例
-        self.llm = llm or LLM()
-        # 系统级别的提示，作为每次交互的上下文指令
-        self.system_prompt = system_prompt or "你是一个智能体，负责处理用户的请求并提供有用的响应。"
+        # 实例唯一ID: 同名的多个Agent分别统计用量; 不用id(), 它在实例被回收后会被复用
+        self.agent_id = new_run_id()
         # 使用提供的配置或默认配置
         self.config = config or Config()
+        # 如果未提供 llm，则创建一个默认 LLM 实例，流式输出方式取自配置
+        if llm is None:
+            from .llm import LLM
+            llm = LLM(sink=sink_from_config(self.config))
+        self.llm = llm
+        # 系统级别的提示，作为每次交互的上下文指令
+        self.system_prompt = system_prompt or "你是一个智能体，负责处理用户的请求并提供有用的响应。"
         # 历史消息列表，用于保存交互记录（按顺序保存 Message 对象）
         self.history: list[Message] = []
 
@@ -40,12 +84,15 @@ class Agent(ABC):
 
     def add_message(self, message: Message):
         """
-        将一条 `Message` 添加到历史记录末尾。
+        将一条 `Message` 添加到历史记录末尾，超过 `config.max_history_length` 时丢弃最早的消息。
 
         参数:
             message: 要添加的 `Message` 实例。
         """
         self.history.append(message)
+        overflow = len(self.history) - self.config.max_history_length
+        if overflow > 0:
+            del self.history[:overflow]
         
     def get_history(self) -> list[Message]:
         """
@@ -62,6 +109,12 @@ class Agent(ABC):
         """
         self.history.clear()
 
+    def get_usage(self) -> Usage:
+        """
+        返回本 Agent 实例累计的 token 用量与成本(同名的其他实例不计入)。
+        """
+        return self.llm.usage_tracker.by("agent_id").get(self.agent_id, Usage())
+
     def __str__(self) -> str:
         # 以字符串形式简单展示 Agent 的名称与 LLM 提供者信息，便于调试
         return f"Agent(name={self.name},provider={self.llm.provider})"    
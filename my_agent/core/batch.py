@@ -0,0 +1,118 @@
+"""批量调用工具: 有界并发、保序返回、逐条记录错误"""
+
+import queue
+import asyncio
+import threading
+import contextvars
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Awaitable
+
+
+@dataclass
+class BatchResult:
+    """批量调用中单个请求的结果"""
+
+    index: int  # 在输入列表中的位置
+    output: Optional[Any] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchChunk:
+    """批量流式调用产出的单个事件"""
+
+    index: int  # 所属请求在输入列表中的位置
+    content: str = ""
+    done: bool = False  # 该请求是否已结束
+    error: Optional[BaseException] = None  # 请求失败时的异常, 仅在done=True时出现
+
+
+def run_batch(fn: Callable[[Any], Any], items: Iterable[Any], max_concurrency: int) -> list[BatchResult]:
+    """
+    在有界线程池中对每个item调用fn, 按输入顺序返回结果。
+
+    Args:
+        fn: 处理单个item的函数
+        items: 输入序列
+        max_concurrency: 最大并发线程数
+    """
+    items = list(items)
+    results = [BatchResult(index=i) for i in range(len(items))]
+    if not items:
+        return results
+
+    def worker(i: int) -> None:
+        try:
+            results[i].output = fn(items[i])
+        except Exception as e:
+            results[i].error = e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as pool:
+        # 每个任务在调用方上下文的副本中运行, 保留Agent/运行信息; worker自身不抛异常
+        futures = [pool.submit(contextvars.copy_context().run, worker, i) for i in range(len(items))]
+        for future in futures:
+            future.result()
+    return results
+
+
+def stream_batch(fn: Callable[[Any], Iterable[str]], items: Iterable[Any], max_concurrency: int) -> Iterator[BatchChunk]:
+    """
+    在有界线程池中并发消费多个流, 按到达顺序产出BatchChunk。
+    调用方提前关闭生成器时, 未开始的任务被跳过, 进行中的流在下一个片段处停止。
+    """
+    items = list(items)
+    if not items:
+        return
+    events: "queue.Queue[BatchChunk]" = queue.Queue()
+    cancelled = threading.Event()
+
+    def worker(i: int) -> None:
+        if cancelled.is_set():
+            return
+        try:
+            for content in fn(items[i]):
+                if cancelled.is_set():
+                    return
+                events.put(BatchChunk(index=i, content=content))
+        except Exception as e:
+            events.put(BatchChunk(index=i, done=True, error=e))
+            return
+        events.put(BatchChunk(index=i, done=True))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items))))
+    try:
+        for i in range(len(items)):
+            pool.submit(contextvars.copy_context().run, worker, i)
+        remaining = len(items)
+        while remaining:
+            event = events.get()
+            if event.done:
+                remaining -= 1
+            yield event
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False)
+
+
+async def arun_batch(fn: Callable[[Any], Awaitable[Any]], items: Iterable[Any], max_concurrency: int) -> list[BatchResult]:
+    """
+    run_batch的异步版本, 用信号量限制同时执行的协程数。
+    """
+    items = list(items)
+    results = [BatchResult(index=i) for i in range(len(items))]
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def worker(i: int) -> None:
+        async with semaphore:
+            try:
+                results[i].output = await fn(items[i])
+            except Exception as e:
+                results[i].error = e
+
+    await asyncio.gather(*(worker(i) for i in range(len(items))))
+    return results
@@ -0,0 +1,141 @@
+"""LLM响应缓存: 内存LRU + 可选的SQLite持久化两级缓存"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def make_cache_key(provider: str, request: dict[str, Any]) -> str:
+    """
+    根据provider与请求参数生成缓存键。
+    忽略stream相关字段, 使流式与非流式的相同请求共享同一条缓存。
+    """
+    payload = {k: v for k, v in request.items() if k not in ("stream", "stream_options")}
+    payload["provider"] = provider
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存。值统一保存为文本片段列表: 流式响应命中后按原片段回放,
+    非流式响应取拼接结果, 因此think()与invoke()的调用方感知不到差异。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+    ):
+        """
+        Args:
+            max_entries: 内存LRU最多保存的条目数
+            ttl: 条目存活秒数, None表示永不过期
+            path: SQLite文件路径, None表示只使用内存缓存
+            max_disk_entries: 磁盘层最多保存的条目数, 超出时淘汰最久未访问的条目
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple[float, list[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, chunks TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str) -> Optional[list[str]]:
+        """查询缓存, 命中返回文本片段列表, 未命中返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, chunks = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return list(chunks)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT chunks, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        chunks = json.loads(row[0])
+                        # 回填内存层, 保留原始写入时间以便TTL一致
+                        self._put_memory(key, row[1], chunks)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return list(chunks)
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, chunks: list[str]) -> None:
+        """写入缓存(同时写内存层与磁盘层)"""
+        now = time.time()
+        chunks = list(chunks)
+        with self._lock:
+            self._put_memory(key, now, chunks)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, chunks, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(chunks, ensure_ascii=False), now, now),
+                )
+                overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_entries
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._stats["evictions"] += overflow
+                self._db.commit()
+
+    def _put_memory(self, key: str, created: float, chunks: list[str]) -> None:
+        """写入内存LRU, 调用方需持有锁"""
+        self._memory[key] = (created, chunks)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """清空两级缓存(统计计数保留)"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        """返回命中/未命中/淘汰计数以及当前内存条目数"""
+        with self._lock:
+            return {**self._stats, "memory_entries": len(self._memory)}
+
+    def close(self) -> None:
+        """关闭SQLite连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
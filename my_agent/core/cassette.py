@@ -0,0 +1,261 @@
+"""LLM请求录制/回放(cassette): 录制真实响应(含流式片段的时间间隔), 离线时按原样回放"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import inspect
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator, Literal, Optional
+
+from .cache import make_cache_key
+from .exceptions import LLMException
+
+CassetteMode = Literal["record", "replay"]
+
+
+def _to_dict(obj: Any) -> Any:
+    """把SDK响应对象(pydantic模型或普通对象)转换为可JSON序列化的结构, 丢弃None字段以压缩体积"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(exclude_none=True)
+    if isinstance(obj, dict):
+        return {k: _to_dict(v) for k, v in obj.items() if v is not None}
+    if isinstance(obj, (list, tuple)):
+        return [_to_dict(v) for v in obj]
+    if hasattr(obj, "__dict__"):
+        return {k: _to_dict(v) for k, v in vars(obj).items() if v is not None and not k.startswith("_")}
+    return obj
+
+
+class _Record(SimpleNamespace):
+    """回放出的响应对象, 按属性访问字段, 缺失的字段返回None(与SDK对象的可选字段一致)"""
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return None
+
+    def model_dump(self, **_: Any) -> dict:
+        return _to_dict(self)
+
+
+def _from_dict(data: Any) -> Any:
+    if isinstance(data, dict):
+        return _Record(**{k: _from_dict(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_from_dict(v) for v in data]
+    return data
+
+
+class Cassette:
+    """
+    一盘磁带对应一个JSONL文件(以.gz结尾时gzip压缩), 每行一次请求。
+    录制模式下把每次成功的请求及响应追加写入; 回放模式下按请求键取出,
+    同一请求键出现多次时按录制顺序依次返回, 用完后重复最后一条, 保证多轮agent循环可重现。
+    """
+
+    def __init__(self, path: str, mode: CassetteMode = "replay", latency_scale: Optional[float] = None):
+        """
+        Args:
+            path: 磁带文件路径
+            mode: record(录制, 覆盖已有文件)或replay(回放)
+            latency_scale: 回放时模拟延迟的倍数, 0表示不等待(默认, 只测框架自身开销),
+                1表示按录制时的首token延迟与片段间隔回放; 从环境变量LLM_CASSETTE_LATENCY_SCALE读取
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的cassette模式: {mode}")
+        self.path = path
+        self.mode = mode
+        if latency_scale is None:
+            latency_scale = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", 0))
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries: dict[str, list[dict]] = defaultdict(list)
+        self._cursors: dict[str, int] = defaultdict(int)
+        if mode == "record":
+            self._file = self._open("wt")
+        else:
+            with self._open("rt") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode, encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    @staticmethod
+    def key(request: dict) -> str:
+        """
+        请求键: 与响应缓存相同的规范化哈希, 再区分流式与非流式(两者的响应结构不同)。
+        不含provider, 离线环境没有配置provider时也能匹配到录制时的请求。
+        """
+        kind = "stream" if request.get("stream") else "complete"
+        return f"{make_cache_key('cassette', request)}:{kind}"
+
+    def _write(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def record(self, key: str, request: dict, response: Any, start: float) -> Any:
+        """
+        录制一次响应。非流式响应立即写入并原样返回;
+        流式响应返回包装后的迭代器, 片段被读取完毕(或调用方提前关闭)时写入。
+
+        Args:
+            key: 请求键
+            request: 请求参数(只保存模型名, 便于排查)
+            response: provider返回的响应
+            start: 发起请求的时间(time.monotonic), 用于计算首token延迟
+        """
+        if not request.get("stream"):
+            self._write({
+                "key": key, "model": request.get("model"),
+                "latency": round(time.monotonic() - start, 4), "response": _to_dict(response),
+            })
+            return response
+        return self._record_stream(key, request, response, start)
+
+    def _record_stream(self, key: str, request: dict, response: Any, start: float) -> Iterator:
+        chunks = []
+        finished = False
+        try:
+            for chunk in response:
+                chunks.append([round(time.monotonic() - start, 4), _to_dict(chunk)])
+                yield chunk
+            finished = True
+        except GeneratorExit:
+            # 调用方提前停止读取时只录制已读取的部分, 回放时同样会在这里停下
+            finished = True
+            raise
+        finally:
+            # 出错的流不录制, 回放时找不到记录比回放半截响应更容易发现问题
+            if finished:
+                self._write({"key": key, "model": request.get("model"), "chunks": chunks})
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+
+    async def arecord(self, key: str, request: dict, response: Any, start: float) -> Any:
+        """record的异步版本"""
+        if not request.get("stream"):
+            return self.record(key, request, response, start)
+        return self._arecord_stream(key, request, response, start)
+
+    async def _arecord_stream(self, key: str, request: dict, response: Any, start: float) -> AsyncIterator:
+        chunks = []
+        finished = False
+        try:
+            async for chunk in response:
+                chunks.append([round(time.monotonic() - start, 4), _to_dict(chunk)])
+                yield chunk
+            finished = True
+        except GeneratorExit:
+            finished = True
+            raise
+        finally:
+            if finished:
+                self._write({"key": key, "model": request.get("model"), "chunks": chunks})
+            close = getattr(response, "aclose", None) or getattr(response, "close", None)
+            if close is not None:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+
+    def _next(self, key: str) -> dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise LLMException(f"cassette {self.path} 中没有匹配的请求(key={key[:12]})")
+            index = min(self._cursors[key], len(entries) - 1)
+            self._cursors[key] += 1
+            return entries[index]
+
+    def replay(self, key: str, stream: bool) -> Any:
+        """回放一次响应; 流式请求返回迭代器, 按录制的时间偏移产出片段"""
+        entry = self._next(key)
+        if not stream:
+            if self.latency_scale:
+                time.sleep(entry["latency"] * self.latency_scale)
+            return _from_dict(entry["response"])
+        return self._replay_stream(entry)
+
+    def _replay_stream(self, entry: dict) -> Iterator:
+        start = time.monotonic()
+        for offset, chunk in entry["chunks"]:
+            if self.latency_scale:
+                delay = offset * self.latency_scale - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield _from_dict(chunk)
+
+    async def areplay(self, key: str, stream: bool) -> Any:
+        """replay的异步版本"""
+        entry = self._next(key)
+        if not stream:
+            if self.latency_scale:
+                await asyncio.sleep(entry["latency"] * self.latency_scale)
+            return _from_dict(entry["response"])
+        return self._areplay_stream(entry)
+
+    async def _areplay_stream(self, entry: dict) -> AsyncIterator:
+        start = time.monotonic()
+        for offset, chunk in entry["chunks"]:
+            if self.latency_scale:
+                delay = offset * self.latency_scale - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield _from_dict(chunk)
+
+    def rewind(self) -> None:
+        """回放指针归零, 同一盘磁带可以重复跑多轮基准"""
+        with self._lock:
+            self._cursors.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        with _cassettes_lock:
+            for key, cassette in list(_cassettes.items()):
+                if cassette is self:
+                    del _cassettes[key]
+
+
+_cassettes: dict[tuple[str, str], Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str, mode: CassetteMode = "replay") -> Cassette:
+    """
+    获取路径对应的进程级磁带, 同一文件的所有AgentsLLM共享(以首次创建时的参数为准)。
+    录制模式下文件只打开一次, 多个实例各自以"wt"打开会互相截断、交错写入。
+    """
+    key = (os.path.realpath(path), mode)
+    with _cassettes_lock:
+        cassette = _cassettes.get(key)
+        if cassette is None:
+            cassette = _cassettes[key] = Cassette(path, mode)
+        return cassette
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    """根据环境变量LLM_CASSETTE(路径)与LLM_CASSETTE_MODE(record/replay, 默认replay)获取共享的磁带"""
+    path = os.getenv("LLM_CASSETTE")
+    if not path:
+        return None
+    return get_cassette(path, os.getenv("LLM_CASSETTE_MODE", "replay"))
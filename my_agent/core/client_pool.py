@@ -0,0 +1,114 @@
+"""进程级OpenAI客户端注册表: 相同(base_url, api_key, timeout)的AgentsLLM共享同一个连接池
+
+重试由AgentsLLM统一负责(见retry.py), 因此这里创建的客户端关闭了SDK自带的重试, 避免重试次数叠加。
+"""
+
+import os
+import asyncio
+import weakref
+import threading
+import importlib.util
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from .sinks import diagnostic
+
+if TYPE_CHECKING:
+    # openai SDK(及其HTTP库)在创建第一个客户端时才导入, 不拖慢import my_agent.core
+    from openai import OpenAI, AsyncOpenAI
+
+
+@dataclass
+class PoolSettings:
+    """连接池参数, 默认值可通过环境变量覆盖"""
+
+    max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+    max_keepalive_connections: int = int(os.getenv("LLM_MAX_KEEPALIVE", 20))
+    keepalive_expiry: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 30))
+    # auto: 安装了h2时启用HTTP/2; 也可以显式设置为true/false
+    http2: str = os.getenv("LLM_HTTP2", "auto")
+
+    def limits(self):
+        """
+        构造SDK所用HTTP库的Limits。不同版本的openai SDK底层分别是httpx或httpx2,
+        因此从SDK的默认值取得Limits类型; 无法构造时退回SDK默认值, 而不是让客户端不可用。
+        """
+        import openai
+
+        defaults = openai.DEFAULT_CONNECTION_LIMITS
+        try:
+            return type(defaults)(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+        except Exception as e:
+            diagnostic(f"⚠️ 连接池参数无效, 使用SDK默认值: {e}")
+            return defaults
+
+    def use_http2(self) -> bool:
+        value = str(self.http2).lower()
+        if value == "auto":
+            return importlib.util.find_spec("h2") is not None
+        return value == "true"
+
+
+ClientKey = tuple[str, str, Optional[float]]
+
+_settings = PoolSettings()
+_lock = threading.Lock()
+_clients: "dict[ClientKey, OpenAI]" = {}
+# 异步连接池绑定事件循环, 按循环分别缓存, 循环被回收后对应客户端一并释放
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[ClientKey, AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+
+
+def configure_pool(**kwargs) -> PoolSettings:
+    """
+    修改连接池参数, 只影响之后新建的客户端。
+
+    Args:
+        **kwargs: PoolSettings的字段, 如max_connections、http2
+    """
+    for name, value in kwargs.items():
+        if not hasattr(_settings, name):
+            raise ValueError(f"未知的连接池参数: {name}")
+        setattr(_settings, name, value)
+    return _settings
+
+
+def get_client(base_url: str, api_key: str, timeout: Optional[float]) -> "OpenAI":
+    """获取(必要时创建)共享的同步客户端"""
+    key = (base_url, api_key, timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI, DefaultHttpxClient
+
+            http_client = DefaultHttpxClient(limits=_settings.limits(), http2=_settings.use_http2())
+            client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
+            _clients[key] = client
+        return client
+
+
+def get_async_client(base_url: str, api_key: str, timeout: Optional[float]) -> "AsyncOpenAI":
+    """获取当前事件循环上共享的异步客户端(必须在协程中调用)"""
+    loop = asyncio.get_running_loop()
+    key = (base_url, api_key, timeout)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            http_client = DefaultAsyncHttpxClient(limits=_settings.limits(), http2=_settings.use_http2())
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0, http_client=http_client)
+            clients[key] = client
+        return client
+
+
+def close_all() -> None:
+    """关闭并清空所有同步客户端(异步客户端随事件循环回收)"""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
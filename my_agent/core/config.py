@@ -22,6 +22,13 @@ class Config(BaseModel):
     debug: bool = False # 是否启用调试模式
     log_level: str = "INFO" # 日志记录级别
 
+    # 流式输出配置
+    stream_sink: str = "stdout" # 流式输出去向: stdout / null / queue / async_queue
+    stream_buffer_size: int = 64 # stdout输出时合并多少个字符后再写出
+
+    # 运行配置
+    run_timeout: Optional[float] = None # 单次run的总时间预算(秒), 其中每次LLM调用、工具调用与重试都以剩余时间为上限
+
     # 其他配置
     max_history_length: int = 1000 # 最大历史消息长度
 
@@ -37,7 +44,10 @@ class Config(BaseModel):
             debug = os.getenv("DEBUG","false").lower() == "true",
             log_level = os.getenv("LOG_LEVEL","INFO"),
             temperature = float(os.getenv("TEMPERATURE","0.7")),
-            max_tokens = int(os.getenv("MAX_TOKENS")) if os.getenv("MAX_TOKENS") else None
+            max_tokens = int(os.getenv("MAX_TOKENS")) if os.getenv("MAX_TOKENS") else None,
+            stream_sink = os.getenv("LLM_STREAM_SINK","stdout"),
+            stream_buffer_size = int(os.getenv("LLM_STREAM_BUFFER_SIZE","64")),
+            run_timeout = float(os.getenv("AGENT_RUN_TIMEOUT")) if os.getenv("AGENT_RUN_TIMEOUT") else None
         )
     
     def to_dict(self) -> Dict[str, Any]:
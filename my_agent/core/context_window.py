@@ -0,0 +1,200 @@
+"""上下文窗口管理: 估算消息token数, 在发送前按模型上下文上限裁剪历史消息"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Optional, Union
+
+from .exceptions import LLMException
+from .sinks import diagnostic
+
+if TYPE_CHECKING:
+    # Message基于pydantic, 导入较慢; 这里只需按duck typing调用to_dict
+    from .message import Message
+
+# 常见模型的上下文长度(token), 查找时按最长前缀匹配
+MODEL_CONTEXT_LIMITS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o3": 200000,
+    "deepseek-chat": 64000,
+    "deepseek-reasoner": 64000,
+    "qwen-plus": 131072,
+    "qwen-turbo": 1000000,
+    "qwen-max": 32768,
+    "Qwen/Qwen2.5-72B-Instruct": 32768,
+    "Qwen/Qwen1.5-0.5B-Chat": 32768,
+    "moonshot-v1-8k": 8192,
+    "moonshot-v1-32k": 32768,
+    "moonshot-v1-128k": 131072,
+    "glm-4": 128000,
+    "llama3": 8192,
+    "llama3.1": 131072,
+    "llama3.2": 131072,
+    "meta-llama/Llama-2-7b-chat-hf": 4096,
+}
+DEFAULT_CONTEXT_LIMIT = 8192
+
+# 每条消息的格式开销(role、分隔符等)与回复前缀开销, 参考OpenAI的计算方式
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+MessageLike = Union[dict[str, Any], "Message"]
+
+
+def context_limit(model: str) -> int:
+    """返回模型的上下文长度, 未知模型返回DEFAULT_CONTEXT_LIMIT"""
+    if model in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[model]
+    matches = [name for name in MODEL_CONTEXT_LIMITS if model.startswith(name)]
+    return MODEL_CONTEXT_LIMITS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_LIMIT
+
+
+def heuristic_token_count(text: str) -> int:
+    """
+    不依赖分词器的快速估算: 中日韩字符按每字1个token计, 其余字符按每4个字符1个token计。
+    结果偏保守(略微高估), 适合作为预算检查。
+    """
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "가" <= ch <= "힯" or "豈" <= ch <= "﫿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def tiktoken_counter(model: str) -> Optional[Callable[[str], int]]:
+    """安装了tiktoken时返回对应模型的精确计数函数, 否则返回None"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text))
+
+
+class TokenCounter:
+    """
+    消息token计数器。每条消息的计数按(role, 内容)缓存,
+    多轮对话中反复出现的历史消息只计算一次。
+    """
+
+    def __init__(self, tokenizer: Optional[Callable[[str], int]] = None, cache_size: int = 4096):
+        """
+        Args:
+            tokenizer: 文本->token数的函数, 为None时使用heuristic_token_count
+            cache_size: 最多缓存的消息条数
+        """
+        self.tokenizer = tokenizer or heuristic_token_count
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count_text(self, text: str) -> int:
+        return self.tokenizer(text) if text else 0
+
+    def count_message(self, message: MessageLike) -> int:
+        """估算单条消息的token数(含格式开销)"""
+        data = message if isinstance(message, dict) else message.to_dict()
+        content = data.get("content") or ""
+        if not isinstance(content, str):
+            # 多模态等结构化内容按JSON文本估算
+            content = json.dumps(content, ensure_ascii=False)
+        extras = {k: v for k, v in data.items() if k not in ("role", "content")}
+        extra_text = json.dumps(extras, ensure_ascii=False, sort_keys=True, default=str) if extras else ""
+        key = (data.get("role"), content, extra_text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        tokens = TOKENS_PER_MESSAGE + self.count_text(content) + self.count_text(extra_text)
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: list[MessageLike]) -> int:
+        """估算整个请求的提示词token数"""
+        return TOKENS_PER_REPLY + sum(self.count_message(message) for message in messages)
+
+
+class ContextWindowManager:
+    """
+    在每次调用前保证提示词+预留输出不超过模型上下文上限。
+    system消息与最后一条消息始终保留, 其余消息从最早的开始丢弃;
+    带tool_calls的assistant消息与紧随其后的tool结果作为一个整体保留或丢弃(最后一条消息是tool结果时,
+    它所属的整组都保留), 避免出现孤立的工具结果。
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_context_tokens: Optional[int] = None,
+        reserve_tokens: int = 1024,
+        counter: Optional[TokenCounter] = None,
+    ):
+        """
+        Args:
+            model: 模型名称, 用于查找上下文上限
+            max_context_tokens: 手动指定上下文上限, 覆盖内置表
+            reserve_tokens: 未指定max_tokens时为输出预留的token数
+            counter: token计数器, 默认优先使用tiktoken, 否则用启发式估算
+        """
+        self.model = model
+        self.max_context_tokens = max_context_tokens or context_limit(model)
+        self.reserve_tokens = reserve_tokens
+        self.counter = counter or TokenCounter(tiktoken_counter(model))
+
+    def budget(self, max_tokens: Optional[int] = None) -> int:
+        """提示词可用的token预算"""
+        return self.max_context_tokens - (max_tokens or self.reserve_tokens)
+
+    def fit(self, messages: list[dict[str, Any]], max_tokens: Optional[int] = None) -> list[dict[str, Any]]:
+        """
+        裁剪消息列表使其符合预算, 不修改传入的列表。
+
+        Raises:
+            LLMException: 仅保留必须保留的消息仍然超出预算时
+        """
+        budget = self.budget(max_tokens)
+        counts = [self.counter.count_message(message) for message in messages]
+        total = TOKENS_PER_REPLY + sum(counts)
+        if total <= budget:
+            return messages
+
+        # 带tool_calls的assistant消息与紧随其后的tool结果是一个整体, 要么一起保留要么一起丢弃
+        units: list[list[int]] = []
+        for i, message in enumerate(messages):
+            if message.get("role") == "tool" and units and messages[units[-1][0]].get("tool_calls"):
+                units[-1].append(i)
+            else:
+                units.append([i])
+        last = len(messages) - 1
+        # system消息与最后一条消息(连同它所在的工具调用组)始终保留
+        pinned = {
+            index for index, unit in enumerate(units)
+            if last in unit or messages[unit[0]].get("role") == "system"
+        }
+        dropped: set[int] = set()
+        for index, unit in enumerate(units):
+            if total <= budget:
+                break
+            if index in pinned:
+                continue
+            for i in unit:
+                dropped.add(i)
+                total -= counts[i]
+
+        if total > budget:
+            raise LLMException(
+                f"提示词约 {total} tokens, 超出 {self.model} 的可用预算 {budget} tokens",
+                retryable=False,
+            )
+        if dropped:
+            diagnostic(f"上下文超出预算, 已丢弃最早的 {len(dropped)} 条消息")
+        return [message for i, message in enumerate(messages) if i not in dropped]
@@ -0,0 +1,196 @@
+"""向量嵌入: 把大量零散的并发embed调用合并成provider大小的批次, 相同文本去重, 结果以float32数组缓存"""
+
+import asyncio
+import threading
+import contextvars
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Optional, Sequence
+
+from .exceptions import DeadlineExceeded
+from .metrics import MetricsRegistry, REGISTRY, COUNT_BUCKETS
+from .runtime import remaining, without_deadline
+
+REGISTRY.describe("llm_embed_batch_size", "histogram", "每次发往provider的嵌入请求包含的文本数", buckets=COUNT_BUCKETS)
+REGISTRY.describe("llm_embed_texts_total", "counter", "embed请求的文本数, 按来源(cache/inflight/provider)区分")
+
+# 批量嵌入函数: 文本列表 -> 等长的向量列表
+EmbedFn = Callable[[list[str]], Sequence[Sequence[float]]]
+
+
+class EmbeddingBatcher:
+    """
+    嵌入请求的微批处理器。
+
+    每个文本先查缓存, 再查是否已有相同文本在途(共享同一个Future), 都没有时进入待发送队列;
+    队列攒满max_batch_size条立即发送, 否则最多等待max_wait秒, 让同一时间窗口内其他调用方的文本
+    合并进同一个批次。批次在后台线程池中发送, 同步与异步调用方都只等待各自文本的Future。
+    批次在最早提交者的运行上下文中发送(用量归属随之传递), 但不带截止时间: 批次由多个调用方共享,
+    不能因为其中一个调用方超时而让其他调用方一起失败; 每个调用方只按自己的截止时间限制等待。
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        max_batch_size: int = 64,
+        max_wait: float = 0.005,
+        cache_size: int = 10_000,
+        max_workers: int = 4,
+        metrics: Optional[MetricsRegistry] = None,
+        **labels,
+    ):
+        """
+        Args:
+            embed_fn: 发送一个批次的函数, 返回与输入等长、顺序一致的向量列表
+            max_batch_size: 单个批次的最大文本数(provider的上限)
+            max_wait: 批次未满时最多等待的秒数, 0表示不等待
+            cache_size: 最多缓存的向量数, 超出时淘汰最久未使用的
+            max_workers: 同时在途的批次数上限
+            metrics: 指标注册表, 默认使用进程级的REGISTRY
+            labels: 指标标签(如provider/model)
+        """
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.max_workers = max_workers
+        self.metrics = metrics or REGISTRY
+        self.labels = labels
+        self._cache: "OrderedDict[str, array]" = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._pending: list[str] = []
+        # 待发送文本所属调用方的上下文
+        self._contexts: dict[str, contextvars.Context] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts: Sequence[str]) -> list[Future]:
+        """提交一组文本, 返回与输入一一对应的Future(结果为array('f'))"""
+        futures = []
+        ready: list[list[str]] = []
+        counts = {"cache": 0, "inflight": 0, "provider": 0}
+        context = contextvars.copy_context()
+        with self._lock:
+            for text in texts:
+                vector = self._cache.get(text)
+                if vector is not None:
+                    self._cache.move_to_end(text)
+                    future: Future = Future()
+                    future.set_result(vector)
+                    counts["cache"] += 1
+                elif text in self._inflight:
+                    future = self._inflight[text]
+                    counts["inflight"] += 1
+                else:
+                    future = self._inflight[text] = Future()
+                    self._pending.append(text)
+                    self._contexts[text] = context
+                    counts["provider"] += 1
+                    if len(self._pending) >= self.max_batch_size:
+                        ready.append(self._pending[:self.max_batch_size])
+                        del self._pending[:self.max_batch_size]
+                futures.append(future)
+            if self._pending:
+                if self.max_wait <= 0:
+                    ready.append(self._pending)
+                    self._pending = []
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.max_wait, self._flush_due)
+                    self._timer.daemon = True
+                    self._timer.start()
+        for source, count in counts.items():
+            if count:
+                self.metrics.inc("llm_embed_texts_total", count, source=source, **self.labels)
+        for batch in ready:
+            self._dispatch(batch)
+        return futures
+
+    def embed(self, texts: Sequence[str]) -> list[array]:
+        """
+        同步获取一组文本的向量; 返回的数组可能与缓存共享, 不要原地修改。
+        运行设置了截止时间时最多等待到截止时间, 超时抛出DeadlineExceeded(批次本身不会被取消, 其他调用方仍可拿到结果)。
+        """
+        futures = self.submit(texts)
+        try:
+            return [future.result(timeout=remaining()) for future in futures]
+        except FutureTimeout:
+            raise DeadlineExceeded("嵌入请求未能在截止时间前完成") from None
+
+    async def aembed(self, texts: Sequence[str]) -> list[array]:
+        """embed的异步版本, 等待期间不阻塞事件循环"""
+        waiters = [asyncio.wrap_future(future) for future in self.submit(texts)]
+        if not waiters:
+            return []
+        # 用wait而不是wait_for: 超时时不能取消Future, 它们可能被其他调用方共享
+        _, pending = await asyncio.wait(waiters, timeout=remaining())
+        if pending:
+            raise DeadlineExceeded("嵌入请求未能在截止时间前完成")
+        return [waiter.result() for waiter in waiters]
+
+    def flush(self) -> None:
+        """立即发送待发送队列中的文本, 不再等待凑批"""
+        self._flush_due()
+
+    def _flush_due(self) -> None:
+        with self._lock:
+            self._timer = None
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_batch_size):
+            self._dispatch(pending[start:start + self.max_batch_size])
+
+    def _dispatch(self, batch: list[str]) -> None:
+        if not batch:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed")
+            executor = self._executor
+            contexts = [self._contexts.pop(text) for text in batch if text in self._contexts]
+        context = self._batch_context(contexts)
+        executor.submit(context.run, self._run_batch, batch)
+
+    @staticmethod
+    def _batch_context(contexts: list[contextvars.Context]) -> contextvars.Context:
+        """
+        选出批次的运行上下文: 最早提交的调用方。
+        返回副本, 同一调用方的上下文可能同时被多个批次使用。
+        """
+        return contexts[0].copy() if contexts else contextvars.copy_context()
+
+    def _run_batch(self, batch: list[str]) -> None:
+        self.metrics.observe("llm_embed_batch_size", len(batch), **self.labels)
+        try:
+            with without_deadline():
+                vectors = self.embed_fn(batch)
+            if len(vectors) != len(batch):
+                raise ValueError(f"嵌入结果数量({len(vectors)})与输入文本数({len(batch)})不一致")
+            results = [array("f", vector) for vector in vectors]
+        except BaseException as e:
+            with self._lock:
+                futures = [self._inflight.pop(text) for text in batch]
+            for future in futures:
+                future.set_exception(e)
+            return
+        with self._lock:
+            futures = [self._inflight.pop(text) for text in batch]
+            for text, vector in zip(batch, results):
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for future, vector in zip(futures, results):
+            future.set_result(vector)
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def close(self) -> None:
+        """发送剩余文本并关闭后台线程池"""
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,267 @@
+"""多端点负载均衡: 为自建的vLLM/Ollama等多副本服务提供选路、摘除与故障转移"""
+
+import time
+import random
+import threading
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Optional, TypeVar
+
+from .client_pool import get_client, get_async_client
+from .exceptions import CircuitOpenException
+from .retry import CircuitBreaker, get_circuit_breaker, is_retryable
+from .sinks import diagnostic
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+T = TypeVar("T")
+
+STRATEGIES = ("least_outstanding", "latency")
+
+
+class Endpoint:
+    """单个服务副本, 记录在途请求数与延迟的指数滑动平均"""
+
+    def __init__(self, url: str, api_key: str, timeout: Optional[float], breaker: CircuitBreaker):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        # 熔断器打开即视为该副本被摘除
+        self.breaker = breaker
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+
+    @property
+    def client(self) -> "OpenAI":
+        return get_client(self.url, self.api_key, self.timeout)
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        return get_async_client(self.url, self.api_key, self.timeout)
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.state == "closed"
+
+    def __repr__(self) -> str:
+        return f"Endpoint(url={self.url}, outstanding={self.outstanding}, healthy={self.healthy})"
+
+
+class EndpointPool:
+    """
+    端点池。按最少在途请求(least_outstanding)或延迟加权(latency)选择副本,
+    连续失败的副本由熔断器摘除, 冷却后放行探测请求, 成功即恢复。
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        api_key: str,
+        timeout: Optional[float] = None,
+        provider: str = "auto",
+        strategy: str = "least_outstanding",
+        health_check_interval: Optional[float] = None,
+        ewma_alpha: float = 0.3,
+    ):
+        """
+        Args:
+            urls: 各副本的base_url
+            api_key: 各副本共用的API密钥
+            timeout: 请求超时时间
+            provider: provider名称, 用于区分熔断器
+            strategy: 选路策略, least_outstanding或latency
+            health_check_interval: 后台健康检查间隔秒数, None表示不启动后台检查
+            ewma_alpha: 延迟滑动平均的平滑系数
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"不支持的选路策略: {strategy}, 可选: {STRATEGIES}")
+        self.endpoints = [
+            Endpoint(url, api_key, timeout, get_circuit_breaker(f"{provider}:{url}"))
+            for url in urls
+        ]
+        if not self.endpoints:
+            raise ValueError("端点池至少需要一个base_url")
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        # 经get_endpoint_pool取得本池的使用者数, 由_pools_lock保护
+        self._users = 0
+        if health_check_interval:
+            self.start_health_checks(health_check_interval)
+
+    def _score(self, endpoint: Endpoint) -> tuple:
+        latency = endpoint.ewma_latency if endpoint.ewma_latency is not None else 0.0
+        if self.strategy == "latency":
+            # 预计排队时间: 平均延迟 x (在途数 + 1)
+            return (latency * (endpoint.outstanding + 1), endpoint.outstanding, random.random())
+        return (endpoint.outstanding, latency, random.random())
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Endpoint:
+        """
+        选择一个端点并计入在途请求。优先选择未排除的健康端点;
+        全部被摘除时尝试放行一个到期的探测请求, 仍无可用端点则快速失败。
+        """
+        exclude = set(exclude)
+        with self._lock:
+            candidates = [ep for ep in self.endpoints if ep.healthy and ep.url not in exclude]
+            if not candidates:
+                candidates = [ep for ep in self.endpoints if ep.url not in exclude and ep.breaker.allow()]
+            if not candidates:
+                raise CircuitOpenException("端点池中没有可用的服务副本", retryable=False)
+            endpoint = min(candidates, key=self._score)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, error: Optional[BaseException] = None, latency: Optional[float] = None) -> None:
+        """请求结束时调用, 更新在途数、延迟统计与健康状态"""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if latency is not None and error is None:
+                if endpoint.ewma_latency is None:
+                    endpoint.ewma_latency = latency
+                else:
+                    endpoint.ewma_latency += self.ewma_alpha * (latency - endpoint.ewma_latency)
+        if error is None or not is_retryable(error):
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure()
+
+    def call(self, fn: Callable[[Endpoint], T]) -> tuple[T, Endpoint, float]:
+        """
+        在选中的端点上执行fn, 可重试错误立即转移到下一个未尝试过的端点。
+        成功时返回(结果, 端点, 耗时), 此时端点仍计入在途, 由调用方在请求真正结束时release。
+        """
+        tried: list[str] = []
+        while True:
+            try:
+                endpoint = self.acquire(exclude=tried)
+            except CircuitOpenException:
+                if tried:
+                    raise last_error
+                raise
+            tried.append(endpoint.url)
+            start = time.monotonic()
+            try:
+                result = fn(endpoint)
+            except Exception as e:
+                self.release(endpoint, error=e)
+                if not is_retryable(e) or len(tried) >= len(self.endpoints):
+                    raise
+                diagnostic(f"端点 {endpoint.url} 调用失败({e}), 转移到其他副本")
+                last_error = e
+                continue
+            return result, endpoint, time.monotonic() - start
+
+    async def acall(self, fn: Callable[[Endpoint], Awaitable[T]]) -> tuple[T, Endpoint, float]:
+        """call的异步版本"""
+        tried: list[str] = []
+        while True:
+            try:
+                endpoint = self.acquire(exclude=tried)
+            except CircuitOpenException:
+                if tried:
+                    raise last_error
+                raise
+            tried.append(endpoint.url)
+            start = time.monotonic()
+            try:
+                result = await fn(endpoint)
+            except Exception as e:
+                self.release(endpoint, error=e)
+                if not is_retryable(e) or len(tried) >= len(self.endpoints):
+                    raise
+                diagnostic(f"端点 {endpoint.url} 调用失败({e}), 转移到其他副本")
+                last_error = e
+                continue
+            return result, endpoint, time.monotonic() - start
+
+    def check_health(self, timeout: float = 5.0) -> dict[str, bool]:
+        """
+        对每个端点请求一次/models, 失败的摘除, 成功的恢复。
+
+        Returns:
+            dict[str, bool]: 各端点的健康状态
+        """
+        status = {}
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.with_options(timeout=timeout).models.list()
+            except Exception:
+                endpoint.breaker.trip()
+                status[endpoint.url] = False
+            else:
+                endpoint.breaker.record_success()
+                status[endpoint.url] = True
+        return status
+
+    def start_health_checks(self, interval: float) -> None:
+        """启动后台健康检查线程(守护线程), 已经启动时不重复启动"""
+
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                self.check_health()
+
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(target=loop, name="llm-endpoint-health", daemon=True)
+            self._health_thread.start()
+
+    def close(self) -> None:
+        """
+        释放一个使用者。共享的端点池在最后一个使用者关闭时才停止后台健康检查并从注册表中移除,
+        直接构造的端点池立即停止
+        """
+        with _pools_lock:
+            self._users = max(0, self._users - 1)
+            if self._users:
+                return
+            for key, pool in list(_pools.items()):
+                if pool is self:
+                    del _pools[key]
+        self._stop.set()
+
+    def stats(self) -> list[dict[str, Any]]:
+        """各端点的当前状态"""
+        with self._lock:
+            return [
+                {
+                    "url": ep.url,
+                    "outstanding": ep.outstanding,
+                    "ewma_latency": ep.ewma_latency,
+                    "healthy": ep.healthy,
+                }
+                for ep in self.endpoints
+            ]
+
+
+PoolKey = tuple[tuple[str, ...], str, Optional[float], str]
+
+_pools: dict[PoolKey, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_endpoint_pool(
+    urls: Iterable[str],
+    api_key: str,
+    timeout: Optional[float] = None,
+    provider: str = "auto",
+    strategy: str = "least_outstanding",
+    health_check_interval: Optional[float] = None,
+) -> EndpointPool:
+    """
+    获取一组端点对应的进程级端点池, 相同(地址, 密钥, 超时, provider)的实例共享,
+    在途请求数与延迟统计因此覆盖所有Agent, 后台健康检查也只有一个线程。
+    选路策略以首次创建时的参数为准; 之后的调用方要求健康检查而池尚未启动时会补上。
+    每次调用计为一个使用者, 用完后调用一次close()释放。
+    """
+    key = (tuple(urls), api_key, timeout, provider)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EndpointPool(key[0], api_key, timeout, provider, strategy=strategy)
+        pool._users += 1
+    if health_check_interval:
+        pool.start_health_checks(health_check_interval)
+    return pool
@@ -0,0 +1,76 @@
+"""结构化流式事件: 把OpenAI流式chunk拆成文本、工具调用增量、结束原因与用量事件"""
+
+from dataclasses import dataclass
+from typing import Optional, Union
+
+
+@dataclass
+class ContentEvent:
+    """文本增量"""
+
+    text: str
+
+
+@dataclass
+class ToolCallDeltaEvent:
+    """
+    工具调用增量。同一个工具调用按index关联: 首个增量通常携带id与name,
+    之后的增量只携带arguments片段, 调用方按index拼接即可。
+    """
+
+    index: int
+    id: Optional[str] = None
+    name: Optional[str] = None
+    arguments: str = ""
+
+
+@dataclass
+class FinishEvent:
+    """生成结束, reason为stop / length / tool_calls / content_filter等"""
+
+    reason: str
+
+
+@dataclass
+class UsageEvent:
+    """服务端返回的token用量(需开启stream_options.include_usage)"""
+
+    prompt_tokens: int
+    completion_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+StreamEvent = Union[ContentEvent, ToolCallDeltaEvent, FinishEvent, UsageEvent]
+
+
+def chunk_events(chunk) -> list[StreamEvent]:
+    """把一个流式chunk转换为事件列表, 缺失字段的chunk会被安全跳过"""
+    events: list[StreamEvent] = []
+    choices = getattr(chunk, "choices", None)
+    if choices:
+        choice = choices[0]
+        delta = getattr(choice, "delta", None)
+        content = getattr(delta, "content", None)
+        if content:
+            events.append(ContentEvent(content))
+        for call in getattr(delta, "tool_calls", None) or ():
+            function = getattr(call, "function", None)
+            events.append(ToolCallDeltaEvent(
+                index=getattr(call, "index", 0) or 0,
+                id=getattr(call, "id", None),
+                name=getattr(function, "name", None),
+                arguments=getattr(function, "arguments", None) or "",
+            ))
+        reason = getattr(choice, "finish_reason", None)
+        if reason:
+            events.append(FinishEvent(reason))
+    usage = getattr(chunk, "usage", None)
+    if usage is not None:
+        events.append(UsageEvent(
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        ))
+    return events
@@ -1,17 +1,40 @@
 """异常体系"""
 
+from typing import Optional
+
 class AgentsException(Exception):
     """HelloAgents基础异常类"""
     pass
 
-class LLMException(AgentsException):
-    """LLM相关异常"""
-    pass
-
 class AgentException(AgentsException):
     """Agent相关异常"""
     pass
 
+class LLMException(AgentException):
+    """LLM相关异常。继承AgentException, 原先以except AgentException处理LLM调用失败的代码仍然有效"""
+
+    def __init__(self, message: str, retryable: bool = False, status_code: Optional[int] = None):
+        """
+        Args:
+            message: 错误信息
+            retryable: 该错误是否值得重试(限流、连接中断、5xx等)
+            status_code: 服务端返回的HTTP状态码(如有)
+        """
+        super().__init__(message)
+        self.retryable = retryable
+        self.status_code = status_code
+
+class CircuitOpenException(LLMException):
+    """熔断器处于打开状态, 请求被快速拒绝"""
+    pass
+
+class DeadlineExceeded(LLMException):
+    """运行的截止时间已到(或剩余时间不足以完成下一步), partial为中止前已得到的部分结果"""
+
+    def __init__(self, message: str, partial: Optional[str] = None):
+        super().__init__(message, retryable=False)
+        self.partial = partial
+
 class ConfigException(AgentsException):
     """配置相关异常"""
     pass
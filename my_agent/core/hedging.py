@@ -0,0 +1,250 @@
+"""对冲请求: 首个请求迟迟没有返回首个token时, 向另一端点再发一份, 谁先返回用谁"""
+
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from .sinks import diagnostic
+
+
+class LatencyHistogram:
+    """保存最近若干次首token延迟样本, 用于估计分位数"""
+
+    def __init__(self, max_samples: int = 512):
+        self._samples: deque[float] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回第p分位(0~1)的延迟, 没有样本时返回None"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+_histograms: dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_latency_histogram(key: str) -> LatencyHistogram:
+    """获取进程级共享的端点延迟直方图"""
+    with _histograms_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = LatencyHistogram()
+        return histogram
+
+
+@dataclass
+class HedgePolicy:
+    """
+    对冲策略。对冲延迟取该端点历史首token延迟的percentile分位,
+    样本不足min_samples时使用default_delay, 结果限制在[min_delay, max_delay]之间。
+    """
+
+    percentile: float = 0.95
+    min_samples: int = 20
+    default_delay: float = 1.0
+    min_delay: float = 0.05
+    max_delay: float = 10.0
+    # 对冲请求的目标: 另一个AgentsLLM(可以是其他provider); 为None时在原端点池上再发一次,
+    # 既没有fallback也没有端点池时对冲只会打到同一个端点, 此时不进行对冲
+    fallback: Optional[Any] = None
+
+    def delay(self, histogram: LatencyHistogram) -> float:
+        value = None
+        if len(histogram) >= self.min_samples:
+            value = histogram.percentile(self.percentile)
+        if value is None:
+            value = self.default_delay
+        return min(self.max_delay, max(self.min_delay, value))
+
+
+def _discard_quietly(discard: Callable[[Any], None], value: Any) -> None:
+    try:
+        discard(value)
+    except Exception:
+        pass
+
+
+class _StreamTracker:
+    """记录一个对冲分支已经打开的流, 该分支落败时从调度线程直接关闭, 不必等它读到首个token"""
+
+    def __init__(self):
+        self._streams: list[Any] = []
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def add(self, stream: Any) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._streams.append(stream)
+                return
+        # 落败之后才建立的流立即关闭
+        _discard_quietly(lambda s: s.close(), stream)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            streams, self._streams = self._streams, []
+        for stream in streams:
+            _discard_quietly(lambda s: s.close(), stream)
+
+
+_tracker: contextvars.ContextVar[Optional[_StreamTracker]] = contextvars.ContextVar("llm_hedge_tracker", default=None)
+
+
+def track_stream(stream: Any) -> None:
+    """
+    登记刚建立的流式响应(SDK的原始Stream对象)。在同步对冲分支中调用时,
+    该分支落败后流会被立即关闭, 阻塞在读取上的线程随之退出并释放连接; 其他情况下什么都不做。
+    """
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.add(stream)
+
+
+def hedged_call(
+    starters: Sequence[Callable[[], Any]],
+    delay: float,
+    discard: Callable[[Any], None],
+    histograms: Sequence[LatencyHistogram],
+) -> Any:
+    """
+    先启动starters[0], 超过delay秒仍未返回时启动starters[1], 取最先成功的结果。
+    分出胜负时, 落败分支中经track_stream登记过的流会被立即关闭;
+    落败请求仍然返回了结果时交给discard清理(如关闭流)。全部失败时抛出第一个请求的异常。
+
+    Args:
+        starters: 主请求与对冲请求, 各自返回"已拿到首个token"的结果
+        delay: 启动对冲请求前的等待秒数
+        discard: 清理落败结果的函数
+        histograms: 与starters一一对应的延迟直方图, 记录胜出请求的耗时;
+            主请求落败时记录它到落败为止的耗时(真实延迟的下限), 避免只统计赢家使分位数越估越低
+    """
+    results: "queue.Queue[tuple[int, Any, Optional[BaseException], float]]" = queue.Queue()
+    lock = threading.Lock()
+    winner: list[int] = []
+    trackers = [_StreamTracker() for _ in starters]
+    started: dict[int, float] = {}
+
+    def run(index: int) -> None:
+        _tracker.set(trackers[index])
+        start = started[index]
+        try:
+            value = starters[index]()
+        except Exception as e:
+            results.put((index, None, e, 0.0))
+            return
+        with lock:
+            lost = bool(winner)
+            if not lost:
+                winner.append(index)
+        if lost:
+            _discard_quietly(discard, value)
+            return
+        results.put((index, value, None, time.monotonic() - start))
+
+    def launch(index: int) -> None:
+        # 在调用方上下文的副本中运行, 截止时间等运行信息随之传递
+        started[index] = time.monotonic()
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run, index), name=f"llm-hedge-{index}", daemon=True).start()
+
+    launch(0)
+    launched = 1
+    errors: list[BaseException] = []
+    failed_primary = False
+    while True:
+        timeout = delay if launched < len(starters) else None
+        try:
+            index, value, error, elapsed = results.get(timeout=timeout)
+        except queue.Empty:
+            diagnostic(f"首token超过 {delay:.2f}秒 未返回, 发起对冲请求")
+            launch(launched)
+            launched += 1
+            continue
+        if error is None:
+            histograms[index].observe(elapsed)
+            if index != 0 and not failed_primary:
+                histograms[0].observe(time.monotonic() - started[0])
+            for other in range(launched):
+                if other != index:
+                    trackers[other].cancel()
+            return value
+        errors.append(error)
+        failed_primary = failed_primary or index == 0
+        if launched < len(starters):
+            # 主请求直接失败时立即启动对冲请求, 不再等待
+            launch(launched)
+            launched += 1
+        elif len(errors) >= launched:
+            raise errors[0]
+
+
+async def ahedged_call(
+    starters: Sequence[Callable[[], Awaitable[Any]]],
+    delay: float,
+    discard: Callable[[Any], Awaitable[None]],
+    histograms: Sequence[LatencyHistogram],
+) -> Any:
+    """hedged_call的异步版本, 落败请求的任务会被直接取消"""
+    loop = asyncio.get_running_loop()
+    tasks: dict[asyncio.Task, tuple[int, float]] = {}
+
+    def launch(index: int) -> None:
+        tasks[asyncio.ensure_future(starters[index]())] = (index, loop.time())
+
+    launch(0)
+    launched = 1
+    errors: list[BaseException] = []
+    pending = set(tasks)
+    try:
+        while True:
+            timeout = delay if launched < len(starters) else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                diagnostic(f"首token超过 {delay:.2f}秒 未返回, 发起对冲请求")
+                launch(launched)
+                launched += 1
+                pending = {task for task in tasks if not task.done()}
+                continue
+            for task in done:
+                if task.exception() is None:
+                    index, started = tasks[task]
+                    histograms[index].observe(loop.time() - started)
+                    if index != 0:
+                        # 主请求落败时同样记录它的耗时(截尾于此刻), 见hedged_call
+                        primary = next(t for t, (i, _) in tasks.items() if i == 0)
+                        if primary not in done and not primary.done():
+                            histograms[0].observe(loop.time() - tasks[primary][1])
+                    # 同时完成的其他请求也需要清理
+                    for other in done - {task}:
+                        if other.exception() is None:
+                            await discard(other.result())
+                    return task.result()
+                errors.append(task.exception())
+            if launched < len(starters):
+                launch(launched)
+                launched += 1
+                pending = {task for task in tasks if not task.done()}
+            elif not pending:
+                raise errors[0]
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,20 +1,68 @@
 """Agents统一接口LLM接口,基于OpenAI原生API"""
 
 import os 
-from typing import Literal,Optional,Iterator # Iterator用于生成器类型提示
-from openai import OpenAI
-from .exceptions import AgentException
+import time
+import asyncio
+import inspect
+import weakref
+import contextlib
+from array import array
+from typing import TYPE_CHECKING,Literal,Optional,Union,Iterator,AsyncIterator # Iterator用于生成器类型提示
+from .exceptions import LLMException, DeadlineExceeded
+from .retry import RetryPolicy, get_circuit_breaker, call_with_retry, acall_with_retry, to_llm_exception
+from .cache import ResponseCache, make_cache_key
+from .client_pool import get_client, get_async_client
+from .endpoints import Endpoint, EndpointPool, get_endpoint_pool
+from .context_window import ContextWindowManager, TokenCounter
+from .rate_limit import RateLimiter, get_rate_limiter, DEFAULT_COMPLETION_ESTIMATE
+from .adaptive import AdaptiveLimiter, get_adaptive_limiter
+from .scheduler import PriorityScheduler
+from .cassette import Cassette, cassette_from_env, get_cassette
+from .singleflight import default_flight, default_async_flight
+from .stop import StopMatcher, normalize_stop
+from .tools import ChatResponse, ToolCallAssembler, response_from_completion
+from .events import StreamEvent, ContentEvent, ToolCallDeltaEvent, FinishEvent, UsageEvent, chunk_events
+from .sinks import StreamSink, make_sink, diagnostics_to
+from .metrics import MetricsRegistry, StreamTimer, REGISTRY
+from .usage import Usage, UsageTracker, default_tracker
+from .runtime import current_run, bounded_timeout, run_scope
+from .hedging import HedgePolicy, get_latency_histogram, hedged_call, ahedged_call, track_stream
+from .batch import BatchResult, BatchChunk, run_batch, stream_batch, arun_batch
+from .embeddings import EmbeddingBatcher
+
+if TYPE_CHECKING:
+    # openai SDK导入很慢(数百毫秒), 只在首次发起请求、创建客户端时才真正导入
+    from openai import OpenAI, AsyncOpenAI
 
 # 支持的LLM提供商
 SUPPORTED_PROVIDERS = Literal[
     "openai", "deepseek", "qwen", "modelscope",
-    "kimi", "zhipu", "ollama", "vllm", "local", "auto"
+    "kimi", "zhipu", "ollama", "vllm", "local", "transformers", "auto"
 ]
 
+# provider检测与凭据解析会读取的全部环境变量, 其取值快照是解析结果缓存键的一部分
+_CREDENTIAL_ENV_VARS = (
+    "OPENAI_API_KEY", "DEEPSEEK_API_KEY", "DASHSCOPE_API_KEY", "MODELSCOPE_API_KEY",
+    "KIMI_API_KEY", "MOONSHOT_API_KEY", "ZHIPU_API_KEY", "GLM_API_KEY",
+    "OLLAMA_API_KEY", "OLLAMA_HOST", "VLLM_API_KEY", "VLLM_HOST",
+    "LLM_API_KEY", "LLM_BASE_URL",
+)
+_ENDPOINT_CONFIG_CACHE_SIZE = 128
+_endpoint_configs: dict[tuple, tuple[str, Optional[str], Optional[str]]] = {}
+
+
+def _env_snapshot() -> tuple:
+    environ = os.environ
+    return tuple(environ.get(name) for name in _CREDENTIAL_ENV_VARS)
+
+
 class AgentsLLM:
     """
     为Agents定制的LLM客户端。它用于调用任何兼容OpenAI接口服务, 并默认使用流式响应。
     """
+    # invoke/think支持tools参数并返回结构化的工具调用, Agent据此选择原生工具调用而不是提示词+正则解析
+    supports_native_tools = True
+
     def __init__(
         self,
         model: Optional[str] = None,
@@ -23,7 +71,25 @@ class AgentsLLM:
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         timeout: Optional[int] = None,
-        base_url: Optional[str] = None,
+        base_url: Optional[Union[str, list[str]]] = None,
+        max_concurrency: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        load_balance: Optional[str] = None,
+        health_check_interval: Optional[float] = None,
+        hedge: Optional[HedgePolicy] = None,
+        usage_tracker: Optional[UsageTracker] = None,
+        include_usage: Optional[bool] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        sink: Optional[Union[str, StreamSink]] = None,
+        context_window: Union[bool, ContextWindowManager, None] = None,
+        coalesce: bool = False,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        cassette: Optional[Union[str, Cassette]] = None,
+        embedding_model: Optional[str] = None,
+        adaptive_concurrency: Optional[bool] = None,
+        scheduler: Optional[PriorityScheduler] = None,
         **kwargs
     ):
         """
@@ -33,33 +99,138 @@ class AgentsLLM:
         Args:
             model: 模型名称, 如果未提供则从环境变量LLM_MODEL_ID读取
             api_key: API密钥, 如果未提供则从环境变量读取
-            base_url: 服务地址, 如果未提供则从环境变量LLM_BASE_URL读取
-            provider: LLM提供商, 如果未提供则自动检测
+            base_url: 服务地址, 如果未提供则从环境变量LLM_BASE_URL读取;
+                传入列表或逗号分隔的多个地址时启用端点池(多副本负载均衡与故障转移)
+            provider: LLM提供商, 如果未提供则自动检测; transformers表示在当前进程内加载HuggingFace模型直接推理
+                (不经过HTTP服务, 设备从环境变量LLM_DEVICE读取), 不支持原生工具调用与embed()
             temperature: 温度参数
             max_tokens: 最大token数
             timeout: 超时时间, 从环境变量LLM_TIMEOUT读取, 默认60秒
+            max_concurrency: 异步接口的单实例并发上限, 从环境变量LLM_MAX_CONCURRENCY读取, 默认32
+            cache: 可选的响应缓存, 命中时不再请求provider
+            retry_policy: 重试策略, 默认最多重试LLM_MAX_RETRIES(3)次
+            load_balance: 端点池选路策略(least_outstanding/latency), 从环境变量LLM_LOAD_BALANCE读取;
+                相同端点组的实例共享一个端点池, 以首个实例的策略为准
+            health_check_interval: 端点池后台健康检查间隔秒数, 从环境变量LLM_HEALTH_CHECK_INTERVAL读取, 默认不检查
+            hedge: 对冲策略, 首token超过历史延迟分位仍未返回时向备用端点再发一份请求;
+                只有配置了fallback或多个base_url(端点池)时生效
+            usage_tracker: token用量统计器, 默认使用进程级的default_tracker
+            include_usage: 流式请求是否附带stream_options.include_usage, 从环境变量LLM_STREAM_USAGE读取, 默认开启
+            metrics: 指标注册表(首token延迟、片段间隔、总耗时等), 默认使用进程级的REGISTRY
+            sink: think/athink的输出去向, 可传入StreamSink或名称(stdout/null/queue),
+                从环境变量LLM_STREAM_SINK读取, 默认带合并缓冲的stdout
+            context_window: 上下文窗口管理器, 传True时按模型自动创建; 启用后每次调用前按token预算裁剪消息
+            coalesce: 是否合并同时在途的相同请求(含流式响应的多路分发), 只有领头请求计入用量
+            rpm: 每分钟请求数配额, 从环境变量LLM_RPM读取, 默认不限
+            tpm: 每分钟token配额(按提示词估算+max_tokens计), 从环境变量LLM_TPM读取, 默认不限;
+                同一provider+模型的所有实例共享一个限流器, 超额的调用按到达顺序排队
+            cassette: 录制/回放磁带(Cassette或文件路径, 同一路径的实例共享一盘磁带), 从环境变量LLM_CASSETTE/LLM_CASSETTE_MODE读取;
+                回放模式下不访问网络, 也不要求配置API密钥
+            embedding_model: embed()使用的向量模型, 从环境变量LLM_EMBEDDING_MODEL读取, 默认text-embedding-3-small;
+                批大小与凑批等待时间分别从LLM_EMBED_BATCH_SIZE(默认64)与LLM_EMBED_MAX_WAIT(默认0.005秒)读取
+            adaptive_concurrency: 是否按端点自适应调整在途请求上限(AIMD, 不超过max_concurrency),
+                从环境变量LLM_ADAPTIVE_CONCURRENCY读取, 默认关闭; 同一端点的所有实例共享一个上限
+            scheduler: 优先级调度器, 可在多个实例间共享; 设置后每次调用(流式调用为整个流)先按
+                运行上下文中的priority/tenant排队, Agent.run默认为interactive, invoke_many等批量接口默认为batch
         """
         # 优先使用传入参数，如果未提供则从环境变量加载
         self.model = model or os.getenv("LLM_MODEL_ID")
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.timeout = timeout or int(os.getenv("LLM_TIMEOUT", 60))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.hedge = hedge
+        self.usage_tracker = usage_tracker or default_tracker
+        if include_usage is None:
+            include_usage = os.getenv("LLM_STREAM_USAGE", "true").lower() == "true"
+        self.include_usage = include_usage
+        self.last_usage: Optional[Usage] = None
+        # think/athink最近一次流式调用的完整结果(文本+工具调用)
+        self.last_response: Optional[ChatResponse] = None
+        self.metrics = metrics or REGISTRY
+        if sink is None or isinstance(sink, str):
+            sink = make_sink(sink or os.getenv("LLM_STREAM_SINK", "stdout"))
+        self.sink = sink
+        self.embedding_model = embedding_model or os.getenv("LLM_EMBEDDING_MODEL", "text-embedding-3-small")
+        self._embedder: Optional[EmbeddingBatcher] = None
         self.kwargs = kwargs
 
-        # 自动检测provider
-        self.provider = provider or self._auto_detect_provider(api_key,base_url)
+        if isinstance(base_url, (list, tuple)):
+            base_url = ",".join(base_url)
 
-        # 根据provider确认API密钥和基础URL
-        self.api_key,  self.base_url = self._resolve_credentials(api_key, base_url)
+        # 自动检测provider并确认API密钥和基础URL; 结果按(参数, 相关环境变量)缓存, 重复构造时不再逐个探测
+        self.provider, self.api_key, self.base_url = self._resolve_endpoint_config(provider, api_key, base_url)
+
+        if isinstance(cassette, str):
+            cassette = get_cassette(cassette, os.getenv("LLM_CASSETTE_MODE", "replay"))
+        self.cassette: Optional[Cassette] = cassette or cassette_from_env()
+        if self.cassette is not None and self.cassette.replaying:
+            # 回放时响应全部来自磁带, 凭据只用于构造(不会被使用的)客户端
+            self.api_key = self.api_key or "cassette"
+            self.base_url = self.base_url or "http://cassette.invalid/v1"
 
         # 验证必要参数
         if not self.model:
             self.model = self._get_default_model()
         if not all([self.api_key, self.base_url]):
-            raise AgentException("API key and base URL must be provided.")
+            raise LLMException("API key and base URL must be provided.")
         
-        # 初始化OpenAI客户端
-        self.client = self._create_client()
+        if context_window is True:
+            context_window = ContextWindowManager(self.model)
+        self.context_window: Optional[ContextWindowManager] = context_window or None
+        self.coalesce = coalesce
+
+        rpm = rpm or float(os.getenv("LLM_RPM", 0))
+        tpm = tpm or float(os.getenv("LLM_TPM", 0))
+        self.rate_limiter: Optional[RateLimiter] = None
+        if rpm or tpm:
+            self.rate_limiter = get_rate_limiter(self.provider, self.model, rpm or None, tpm or None)
+        self._token_counter = self.context_window.counter if self.context_window is not None else TokenCounter()
+        if adaptive_concurrency is None:
+            adaptive_concurrency = os.getenv("LLM_ADAPTIVE_CONCURRENCY", "false").lower() == "true"
+        self.adaptive_concurrency = adaptive_concurrency
+        self.scheduler = scheduler
+        if self.provider == "transformers":
+            # 进程内模型只生成文本, Agent改用提示词+解析的方式调用工具
+            self.supports_native_tools = False
+
+        # 多个地址时启用端点池, 每个副本各自有熔断器, base_url保留第一个地址用于展示;
+        # 相同端点组的实例共享一个池, 在途统计覆盖所有Agent; close()释放本实例的引用
+        urls = [url.strip() for url in self.base_url.split(",") if url.strip()]
+        self.endpoint_pool: Optional[EndpointPool] = None
+        self.breaker_key = f"{self.provider}:{self.base_url}"
+        if len(urls) > 1:
+            self.base_url = urls[0]
+            interval = health_check_interval or float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", 0))
+            self.endpoint_pool = get_endpoint_pool(
+                urls, self.api_key, self.timeout, self.provider,
+                strategy=load_balance or os.getenv("LLM_LOAD_BALANCE", "least_outstanding"),
+                health_check_interval=interval or None,
+            )
+        self._pool_ref = self.endpoint_pool
+
+        # OpenAI客户端在首次使用时才创建(来自进程级注册表, 相同配置的实例共享连接池)
+        self._client: Optional["OpenAI"] = None
+        # 同一provider+端点的所有实例共享熔断器, 端点故障时快速失败; 端点池模式下由各副本的熔断器负责
+        self.circuit_breaker = get_circuit_breaker(self.breaker_key) if self.endpoint_pool is None else None
+        # 并发信号量绑定事件循环, 按循环懒加载, 循环销毁后自动释放
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    def _resolve_endpoint_config(
+        self, provider: Optional[str], api_key: Optional[str], base_url: Optional[str]
+    ) -> tuple[str, Optional[str], Optional[str]]:
+        """返回(provider, api_key, base_url), 相同参数且相关环境变量未变时直接复用上次的解析结果"""
+        key = (type(self), provider, api_key, base_url, _env_snapshot())
+        resolved = _endpoint_configs.get(key)
+        if resolved is None:
+            self.provider = provider or self._auto_detect_provider(api_key, base_url)
+            resolved = (self.provider, *self._resolve_credentials(api_key, base_url))
+            if len(_endpoint_configs) >= _ENDPOINT_CONFIG_CACHE_SIZE:
+                _endpoint_configs.clear()
+            _endpoint_configs[key] = resolved
+        return resolved
 
     def _auto_detect_provider(self, api_key: Optional[str], base_url: Optional[str]) -> str:
         """
@@ -194,19 +365,60 @@ class AgentsLLM:
             resolved_base_url = base_url or os.getenv("LLM_BASE_URL") or "http://localhost:8000/v1"
             return resolved_api_key, resolved_base_url
 
+        elif self.provider == "transformers":
+            # 进程内推理, 不需要密钥; base_url只作为熔断器、限流等按端点区分的标识
+            return api_key or "transformers", base_url or "inproc://transformers"
+
         else:
             # auto或其他情况：使用通用配置，支持任何OpenAI兼容的服务
             resolved_api_key = api_key or os.getenv("LLM_API_KEY")
             resolved_base_url = base_url or os.getenv("LLM_BASE_URL")
             return resolved_api_key, resolved_base_url
 
-    def _create_client(self) -> OpenAI:
-        """创建OpenAI客户端"""
-        return OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            timeout=self.timeout
-        )
+    @property
+    def client(self) -> "OpenAI":
+        """同步客户端, 首次访问时创建; 也可以直接赋值替换(如接入自定义客户端)"""
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    @client.setter
+    def client(self, client: "OpenAI") -> None:
+        self._client = client
+
+    def _create_client(self) -> "OpenAI":
+        """获取OpenAI客户端"""
+        if self.provider == "transformers":
+            from .local_model import LocalModelClient
+            return LocalModelClient(self.model, os.getenv("LLM_DEVICE"))
+        return get_client(self.base_url, self.api_key, self.timeout)
+
+    def _create_async_client(self) -> "AsyncOpenAI":
+        """获取当前事件循环上的AsyncOpenAI客户端, 与同步客户端共享同一套provider/凭证解析结果"""
+        if self.provider == "transformers":
+            from .local_model import AsyncLocalModelClient
+            return AsyncLocalModelClient(self.model, os.getenv("LLM_DEVICE"))
+        return get_async_client(self.base_url, self.api_key, self.timeout)
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """当前事件循环对应的异步客户端(必须在协程中访问)"""
+        return self._create_async_client()
+
+    def close(self) -> None:
+        """释放本实例对共享端点池的引用(重复调用无效), 最后一个使用者关闭时池才停止后台健康检查"""
+        pool, self._pool_ref = self._pool_ref, None
+        if pool is not None:
+            pool.close()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """当前事件循环对应的并发信号量, 限制本实例同时在途的异步请求数"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
     
     def _get_default_model(self) -> str:
         """获取默认模型"""
@@ -228,6 +440,8 @@ class AgentsLLM:
             return "meta-llama/Llama-2-7b-chat-hf"  # vLLM常用模型
         elif self.provider == "local":
             return "local-model"  # 本地模型占位符
+        elif self.provider == "transformers":
+            return "Qwen/Qwen1.5-0.5B-Chat"  # 与qwen-0.5b/main.py相同的小模型, CPU上也能运行
         else:
             # auto或其他情况：根据base_url智能推断默认模型
             base_url = os.getenv("LLM_BASE_URL", "")
@@ -251,7 +465,801 @@ class AgentsLLM:
             else:
                 return "gpt-3.5-turbo"
 
-    def think(self, messages: list[dict[str, str]], temperature: Optional[float] = None) -> Iterator[str]:
+    def _build_request(self, messages: list[dict[str, str]], stream: bool, **kwargs) -> dict:
+        """组装chat.completions.create的请求参数, 同步/异步接口共用"""
+        temperature = kwargs.pop('temperature', None)
+        max_tokens = kwargs.pop('max_tokens', None)
+        if max_tokens is None:
+            max_tokens = self.max_tokens
+        if self.context_window is not None:
+            with diagnostics_to(self.sink):
+                messages = self.context_window.fit(messages, max_tokens)
+        request = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature if temperature is not None else self.temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+        }
+        if stream and self.include_usage:
+            # 让服务端在流的最后一个chunk中返回usage
+            request["stream_options"] = {"include_usage": True}
+        request.update(kwargs)
+        return request
+
+    def _record_usage(self, request: dict, usage, duration: float, generated: Optional[list[str]] = None) -> None:
+        """
+        记录一次请求的token用量。服务端未返回usage时: 流式请求(命中stop、超过截止时间或调用方提前停止读取,
+        usage chunk都不会到达)按提示词与已收到的输出估算并标记为估算值, 非流式请求跳过。
+
+        Args:
+            request: 请求参数
+            usage: 服务端返回的usage, 没有时为None
+            duration: 请求耗时
+            generated: 流式请求已收到的输出片段, 用于估算
+        """
+        estimated = usage is None
+        if estimated and generated is None:
+            return
+        prompt_tokens, completion_tokens = self._usage_tokens(request, usage, generated or [])
+        # 限流器的token配额在每次尝试结束时已按实际用量修正(见_send), 这里只做统计
+        self.last_usage = self.usage_tracker.record(
+            request["model"], prompt_tokens, completion_tokens, duration, estimated=estimated,
+        )
+
+    def _usage_tokens(self, request: dict, usage, generated: list[str]) -> tuple[int, int]:
+        """(提示词token数, 输出token数): 有usage时取服务端的值, 否则按提示词与已收到的输出估算"""
+        if usage is not None:
+            return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+        return (self._token_counter.count_messages(request["messages"]),
+                self._token_counter.count_text("".join(generated)))
+
+    @staticmethod
+    def _meter_chunk(chunk, generated: list[str]):
+        """把chunk中的输出(文本与工具调用参数)记入generated, 返回chunk携带的usage(没有时为None)"""
+        usage = None
+        for event in chunk_events(chunk):
+            if isinstance(event, ContentEvent):
+                generated.append(event.text)
+            elif isinstance(event, ToolCallDeltaEvent):
+                generated.extend((event.name or "", event.arguments))
+            elif isinstance(event, UsageEvent):
+                usage = event
+        return usage
+
+    def _estimate_tokens(self, request: dict) -> int:
+        """估算一次请求最多消耗的token数: 提示词token + max_tokens"""
+        max_tokens = request.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+        return self._token_counter.count_messages(request["messages"]) + max_tokens
+
+    def _timeout_options(self) -> dict:
+        """运行设置了截止时间时, 把本次调用的超时收紧到剩余时间(时间已用完则直接抛出DeadlineExceeded)"""
+        if current_run().deadline is None:
+            return {}
+        return {"timeout": bounded_timeout(self.timeout)}
+
+    def _scheduled(self, request: dict):
+        """配置了调度器时按优先级排队占用一个名额, 排队时间以运行的剩余时间为上限"""
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.slot(cost=self._estimate_tokens(request), timeout=bounded_timeout(None))
+
+    def _ascheduled(self, request: dict):
+        """_scheduled的异步版本"""
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.aslot(cost=self._estimate_tokens(request), timeout=bounded_timeout(None))
+
+    def _concurrency_limiter(self, endpoint: str) -> Optional[AdaptiveLimiter]:
+        """启用自适应并发时返回端点对应的限制器"""
+        if not self.adaptive_concurrency:
+            return None
+        return get_adaptive_limiter(f"{self.provider}:{endpoint}", self.max_concurrency)
+
+    @staticmethod
+    def _token_latency(response, latency: float) -> Optional[float]:
+        """非流式响应的延迟样本: 每个输出token的平均耗时, 避免输出长短不同被误判为拥塞"""
+        completion_tokens = getattr(getattr(response, "usage", None), "completion_tokens", 0) or 0
+        return latency / completion_tokens if completion_tokens else None
+
+    def _chat_create(self, client: "OpenAI", request: dict):
+        """发出请求; 流式响应登记到对冲分支, 分支落败时由调度线程直接关闭"""
+        response = client.chat.completions.create(**request, **self._timeout_options())
+        if request.get("stream"):
+            track_stream(response)
+        return response
+
+    def _create(self, client: "OpenAI", request: dict, endpoint: str):
+        """
+        调用chat.completions.create。启用自适应并发时先占用端点的在途名额,
+        请求结束(流式请求为整个流结束)后按延迟与错误调整上限。
+        """
+        limiter = self._concurrency_limiter(endpoint)
+        if limiter is None:
+            return self._chat_create(client, request)
+        if not limiter.acquire(bounded_timeout(None)):
+            raise DeadlineExceeded(f"等待 {endpoint} 的并发名额时超过截止时间")
+        start = time.monotonic()
+        try:
+            response = self._chat_create(client, request)
+        except BaseException as e:
+            limiter.release(error=e)
+            raise
+        latency = time.monotonic() - start
+        if request.get("stream"):
+            return self._release_limiter_on_close(response, limiter, latency)
+        limiter.release(self._token_latency(response, latency), kind="complete")
+        return response
+
+    async def _acreate(self, client: "AsyncOpenAI", request: dict, endpoint: str):
+        """_create的异步版本"""
+        limiter = self._concurrency_limiter(endpoint)
+        if limiter is None:
+            return await client.chat.completions.create(**request, **self._timeout_options())
+        if not await limiter.aacquire(bounded_timeout(None)):
+            raise DeadlineExceeded(f"等待 {endpoint} 的并发名额时超过截止时间")
+        start = time.monotonic()
+        try:
+            response = await client.chat.completions.create(**request, **self._timeout_options())
+        except BaseException as e:
+            limiter.release(error=e)
+            raise
+        latency = time.monotonic() - start
+        if request.get("stream"):
+            return self._arelease_limiter_on_close(response, limiter, latency)
+        limiter.release(self._token_latency(response, latency), kind="complete")
+        return response
+
+    def _release_limiter_on_close(self, response, limiter: AdaptiveLimiter, latency: float) -> Iterator:
+        """包装流式响应, 流读完、出错或被关闭时归还并发名额; 延迟样本取拿到响应头的耗时"""
+        error = None
+        try:
+            yield from response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._close_stream(response)
+            limiter.release(None if error is not None else latency, error)
+
+    async def _arelease_limiter_on_close(self, response, limiter: AdaptiveLimiter, latency: float) -> AsyncIterator:
+        """_release_limiter_on_close的异步版本"""
+        error = None
+        try:
+            async for chunk in response:
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await self._aclose_stream(response)
+            limiter.release(None if error is not None else latency, error)
+
+    def _send(self, client: "OpenAI", request: dict):
+        """向单个端点发出一次请求(每次重试都会重新经过限流)"""
+        return self._metered(request, lambda: self._create(client, request, self.base_url))
+
+    async def _asend(self, client: "AsyncOpenAI", request: dict):
+        """_send的异步版本"""
+        return await self._ametered(request, lambda: self._acreate(client, request, self.base_url))
+
+    def _metered(self, request: dict, fn):
+        """
+        经过限流器执行一次尝试。每次尝试各自结算按估算扣掉的token配额: 失败的尝试全部退还,
+        非流式响应按usage修正, 流式响应在流结束或被关闭时按usage(没有时按已收到的输出估算)修正。
+        """
+        if self.rate_limiter is None:
+            return fn()
+        estimate = self._estimate_tokens(request)
+        self.rate_limiter.acquire(estimate)
+        try:
+            response = fn()
+        except BaseException:
+            self.rate_limiter.reconcile(estimate, 0)
+            raise
+        if request.get("stream"):
+            return self._reconcile_on_close(response, request, estimate)
+        self.rate_limiter.reconcile(estimate, self._actual_tokens(request, response, estimate))
+        return response
+
+    async def _ametered(self, request: dict, fn):
+        """_metered的异步版本"""
+        if self.rate_limiter is None:
+            return await fn()
+        estimate = self._estimate_tokens(request)
+        await self.rate_limiter.aacquire(estimate)
+        try:
+            response = await fn()
+        except BaseException:
+            self.rate_limiter.reconcile(estimate, 0)
+            raise
+        if request.get("stream"):
+            return self._areconcile_on_close(response, request, estimate)
+        self.rate_limiter.reconcile(estimate, self._actual_tokens(request, response, estimate))
+        return response
+
+    @staticmethod
+    def _actual_tokens(request: dict, response, estimate: int) -> int:
+        """非流式响应的实际token数; 服务端没有返回usage时无从修正, 按估算计"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return estimate
+        return (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+    def _reconcile_on_close(self, response, request: dict, estimate: int) -> Iterator:
+        """包装流式响应, 流读完、出错或被关闭时按实际用量修正限流器"""
+        generated: list[str] = []
+        usage = None
+        try:
+            for chunk in response:
+                usage = self._meter_chunk(chunk, generated) or usage
+                yield chunk
+        finally:
+            self._close_stream(response)
+            self.rate_limiter.reconcile(estimate, sum(self._usage_tokens(request, usage, generated)))
+
+    async def _areconcile_on_close(self, response, request: dict, estimate: int) -> AsyncIterator:
+        """_reconcile_on_close的异步版本"""
+        generated: list[str] = []
+        usage = None
+        try:
+            async for chunk in response:
+                usage = self._meter_chunk(chunk, generated) or usage
+                yield chunk
+        finally:
+            await self._aclose_stream(response)
+            self.rate_limiter.reconcile(estimate, sum(self._usage_tokens(request, usage, generated)))
+
+    def _cache_key(self, request: dict) -> Optional[str]:
+        """启用缓存时返回请求对应的缓存键"""
+        if self.cache is None:
+            return None
+        return make_cache_key(self.provider, request)
+
+    def _create_completion(self, request: dict):
+        """创建一次补全请求, 启用对冲时走对冲路径; 配置了磁带时录制或回放响应"""
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay(Cassette.key(request), bool(request.get("stream")))
+        start = time.monotonic()
+        # 重试、故障转移与对冲的提示写到本实例的sink
+        with diagnostics_to(self.sink):
+            if self._hedging():
+                response = self._hedged_completion(request)
+            else:
+                response = self._dispatch(request)
+        if self.cassette is not None:
+            return self.cassette.record(Cassette.key(request), request, response, start)
+        return response
+
+    async def _acreate_completion(self, request: dict):
+        """_create_completion的异步版本"""
+        if self.cassette is not None and self.cassette.replaying:
+            return await self.cassette.areplay(Cassette.key(request), bool(request.get("stream")))
+        start = time.monotonic()
+        with diagnostics_to(self.sink):
+            if self._hedging():
+                response = await self._ahedged_completion(request)
+            else:
+                response = await self._adispatch(request)
+        if self.cassette is not None:
+            return await self.cassette.arecord(Cassette.key(request), request, response, start)
+        return response
+
+    def _dispatch(self, request: dict):
+        """带重试与熔断地调用chat.completions.create; 流式请求只重试建立连接阶段"""
+        if self.endpoint_pool is None:
+            return call_with_retry(
+                lambda: self._send(self.client, request),
+                self.retry_policy, self.circuit_breaker, self.breaker_key,
+            )
+
+        def attempt():
+            response, endpoint, latency = self.endpoint_pool.call(
+                lambda ep: self._create(ep.client, request, ep.url)
+            )
+            if request.get("stream"):
+                # 流式请求在整个流结束后才释放在途名额
+                return self._release_on_close(response, endpoint, latency)
+            self.endpoint_pool.release(endpoint, latency=latency)
+            return response
+
+        # 在选端点之前经过限流, 限流等待不计入端点延迟
+        return call_with_retry(lambda: self._metered(request, attempt), self.retry_policy, None, self.breaker_key)
+
+    async def _adispatch(self, request: dict):
+        """_dispatch的异步版本"""
+        if self.endpoint_pool is None:
+            return await acall_with_retry(
+                lambda: self._asend(self.async_client, request),
+                self.retry_policy, self.circuit_breaker, self.breaker_key,
+            )
+
+        async def attempt():
+            response, endpoint, latency = await self.endpoint_pool.acall(
+                lambda ep: self._acreate(ep.async_client, request, ep.url)
+            )
+            if request.get("stream"):
+                return self._arelease_on_close(response, endpoint, latency)
+            self.endpoint_pool.release(endpoint, latency=latency)
+            return response
+
+        return await acall_with_retry(lambda: self._ametered(request, attempt), self.retry_policy, None, self.breaker_key)
+
+    def _release_on_close(self, response, endpoint: Endpoint, latency: float) -> Iterator:
+        """包装端点池中的流式响应, 流读完、出错或被关闭时释放端点"""
+        error = None
+        try:
+            yield from response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._close_stream(response)
+            self.endpoint_pool.release(endpoint, error=error, latency=latency)
+
+    async def _arelease_on_close(self, response, endpoint: Endpoint, latency: float) -> AsyncIterator:
+        """_release_on_close的异步版本"""
+        error = None
+        try:
+            async for chunk in response:
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await self._aclose_stream(response)
+            self.endpoint_pool.release(endpoint, error=error, latency=latency)
+
+    @staticmethod
+    def _close_stream(stream) -> None:
+        """关闭流式响应, 释放底层连接"""
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    @staticmethod
+    async def _aclose_stream(stream) -> None:
+        """关闭异步流式响应(兼容AsyncStream.close与异步生成器的aclose)"""
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+    @staticmethod
+    def _is_first_token(chunk) -> bool:
+        """chunk是否携带了实际输出(文本、工具调用或结束原因), 仅含role的首包不算"""
+        if not getattr(chunk, 'choices', None):
+            return False
+        choice = chunk.choices[0]
+        delta = getattr(choice, 'delta', None)
+        return bool(
+            getattr(delta, 'content', None)
+            or getattr(delta, 'tool_calls', None)
+            or getattr(choice, 'finish_reason', None)
+        )
+
+    def _hedging(self) -> bool:
+        """是否对冲: 需要有不同的目标, 即fallback或端点池中的其他副本; 对同一端点重发只会加重它的负载"""
+        return self.hedge is not None and (self.hedge.fallback is not None or self.endpoint_pool is not None)
+
+    def _hedge_targets(self, request: dict) -> tuple[list, list]:
+        """返回(主请求, 对冲请求)的发起函数以及对应的延迟直方图"""
+        kind = "stream" if request.get("stream") else "complete"
+        fallback = self.hedge.fallback
+        if fallback is not None:
+            hedge_request = {**request, "model": fallback.model}
+            hedge_target = (fallback, hedge_request, f"{fallback.breaker_key}:{kind}")
+        else:
+            # 端点池会优先选择在途请求更少的副本, 自然落到另一个端点
+            hedge_target = (self, request, f"{self.breaker_key}:{kind}")
+        targets = [(self, request, f"{self.breaker_key}:{kind}"), hedge_target]
+        return targets, [get_latency_histogram(key) for _, _, key in targets]
+
+    def _hedged_completion(self, request: dict):
+        """对冲版本的_dispatch: 流式请求以首个token为准, 非流式请求以完整响应为准"""
+        targets, histograms = self._hedge_targets(request)
+        delay = self.hedge.delay(histograms[0])
+        if not request.get("stream"):
+            def complete(llm, req):
+                start = time.monotonic()
+                return llm, req, start, llm._dispatch(req)
+
+            def discard_response(result) -> None:
+                # 落败的请求仍然跑完并计费(限流器已在_metered中按实际用量修正), 用量记到发出它的实例上
+                llm, req, start, response = result
+                llm._record_usage(req, getattr(response, "usage", None), time.monotonic() - start)
+
+            starters = [lambda llm=llm, req=req: complete(llm, req) for llm, req, _ in targets]
+            return hedged_call(starters, delay, discard_response, histograms)[3]
+
+        def starter(llm, req):
+            stream = llm._dispatch(req)
+            iterator = iter(stream)
+            head = []
+            try:
+                for chunk in iterator:
+                    head.append(chunk)
+                    if self._is_first_token(chunk):
+                        break
+            except BaseException:
+                self._close_stream(stream)
+                raise
+            return head, iterator, stream
+
+        head, iterator, stream = hedged_call(
+            [lambda llm=llm, req=req: starter(llm, req) for llm, req, _ in targets],
+            delay,
+            lambda result: self._close_stream(result[2]),
+            histograms,
+        )
+        return self._resume_stream(head, iterator, stream)
+
+    async def _ahedged_completion(self, request: dict):
+        """_hedged_completion的异步版本"""
+        targets, histograms = self._hedge_targets(request)
+        delay = self.hedge.delay(histograms[0])
+        if not request.get("stream"):
+            async def complete(llm, req):
+                start = time.monotonic()
+                return llm, req, start, await llm._adispatch(req)
+
+            async def discard_response(result) -> None:
+                # 落败的任务会被取消(限流器配额随之退还), 只有与胜者同时完成的请求会走到这里
+                llm, req, start, response = result
+                llm._record_usage(req, getattr(response, "usage", None), time.monotonic() - start)
+
+            starters = [lambda llm=llm, req=req: complete(llm, req) for llm, req, _ in targets]
+            return (await ahedged_call(starters, delay, discard_response, histograms))[3]
+
+        async def starter(llm, req):
+            stream = await llm._adispatch(req)
+            iterator = stream.__aiter__()
+            head = []
+            try:
+                async for chunk in iterator:
+                    head.append(chunk)
+                    if self._is_first_token(chunk):
+                        break
+            except BaseException:
+                # 包括对冲落败被取消的情况
+                await self._aclose_stream(stream)
+                raise
+            return head, iterator, stream
+
+        async def discard_stream(result) -> None:
+            await self._aclose_stream(result[2])
+
+        head, iterator, stream = await ahedged_call(
+            [lambda llm=llm, req=req: starter(llm, req) for llm, req, _ in targets],
+            delay,
+            discard_stream,
+            histograms,
+        )
+        return self._aresume_stream(head, iterator, stream)
+
+    def _resume_stream(self, head: list, iterator, stream) -> Iterator:
+        """先回放已读取的首包, 再继续读取剩余的流"""
+        try:
+            yield from head
+            yield from iterator
+        finally:
+            self._close_stream(stream)
+
+    async def _aresume_stream(self, head: list, iterator, stream) -> AsyncIterator:
+        """_resume_stream的异步版本"""
+        try:
+            for chunk in head:
+                yield chunk
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            await self._aclose_stream(stream)
+
+    def _timer(self) -> StreamTimer:
+        return StreamTimer(self.metrics, provider=self.provider, model=self.model)
+
+    def _flight_key(self, request: dict) -> str:
+        """请求合并使用的键, 流式与非流式请求分开合并"""
+        kind = "stream" if request.get("stream") else "complete"
+        return f"{kind}:{make_cache_key(self.breaker_key, request)}"
+
+    def _open_completion(self, request: dict):
+        """
+        发起请求并返回(响应, 是否由本调用实际发出)。开启coalesce时相同的在途请求只发送一次,
+        流式响应会分发给所有订阅者。
+        """
+        if not self.coalesce:
+            return self._create_completion(request), True
+        key = self._flight_key(request)
+        if request.get("stream"):
+            return default_flight.stream(key, lambda: self._create_completion(request))
+        return default_flight.do(key, lambda: self._create_completion(request))
+
+    async def _aopen_completion(self, request: dict):
+        """_open_completion的异步版本"""
+        if not self.coalesce:
+            return await self._acreate_completion(request), True
+        key = self._flight_key(request)
+        if request.get("stream"):
+            return default_async_flight.stream(key, lambda: self._acreate_completion(request))
+        return await default_async_flight.do(key, lambda: self._acreate_completion(request))
+
+    def _record_early_stop(self, request: dict, matcher: StopMatcher) -> None:
+        self.metrics.inc("llm_stop_early_total", provider=self.provider, model=self.model)
+        saved = matcher.tokens_saved(request.get("max_tokens"))
+        if saved:
+            self.metrics.inc("llm_stop_tokens_saved_total", saved, provider=self.provider, model=self.model)
+        if matcher.discarded:
+            self.metrics.inc("llm_stop_chars_discarded_total", matcher.discarded, provider=self.provider, model=self.model)
+
+    @staticmethod
+    def _truncate_at_stop(text: str, stop) -> str:
+        hits = [index for index in (text.find(pattern) for pattern in normalize_stop(stop)) if index >= 0]
+        return text[:min(hits)] if hits else text
+
+    def _iter_events(self, request: dict, response) -> Iterator[StreamEvent]:
+        """
+        把流式响应转换为事件。请求带stop时在客户端再匹配一次:
+        部分服务会忽略stop参数, 命中后立即关闭HTTP流, 不再为之后的输出付出token与延迟。
+        运行设置了截止时间时, 到期后同样关闭流并抛出DeadlineExceeded。
+        """
+        expires = current_run().deadline
+        patterns = normalize_stop(request.get("stop"))
+        if not patterns:
+            for chunk in response:
+                if expires is not None and time.monotonic() >= expires:
+                    self._close_stream(response)
+                    raise DeadlineExceeded("流式响应未能在截止时间前结束")
+                yield from chunk_events(chunk)
+            return
+        matcher = StopMatcher(patterns)
+        for chunk in response:
+            if expires is not None and time.monotonic() >= expires:
+                self._close_stream(response)
+                raise DeadlineExceeded("流式响应未能在截止时间前结束")
+            yield from matcher.filter(chunk_events(chunk))
+            if matcher.stopped:
+                self._close_stream(response)
+                self._record_early_stop(request, matcher)
+                return
+        held = matcher.flush()
+        if held:
+            yield ContentEvent(held)
+
+    async def _aiter_events(self, request: dict, response) -> AsyncIterator[StreamEvent]:
+        """_iter_events的异步版本"""
+        expires = current_run().deadline
+        patterns = normalize_stop(request.get("stop"))
+        matcher = StopMatcher(patterns) if patterns else None
+        async for chunk in response:
+            if expires is not None and time.monotonic() >= expires:
+                await self._aclose_stream(response)
+                raise DeadlineExceeded("流式响应未能在截止时间前结束")
+            events = chunk_events(chunk)
+            if matcher is None:
+                for event in events:
+                    yield event
+                continue
+            for event in matcher.filter(events):
+                yield event
+            if matcher.stopped:
+                await self._aclose_stream(response)
+                self._record_early_stop(request, matcher)
+                return
+        held = matcher.flush() if matcher is not None else ""
+        if held:
+            yield ContentEvent(held)
+
+    def _stream_events(self, messages: list[dict[str, str]], **kwargs) -> Iterator[StreamEvent]:
+        """发起流式请求并逐个产出结构化事件, 不打印也不包装异常, 是所有同步流式接口的底层实现"""
+        request = self._build_request(messages, stream=True, **kwargs)
+        key = self._cache_key(request)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                for content in cached:
+                    yield ContentEvent(content)
+                yield FinishEvent("stop")
+                return
+
+        with self._scheduled(request):
+            timer = self._timer()
+            status = "error"
+            response = None
+            leader = False
+            chunks = []
+            # 已收到的输出(含工具调用参数), 流没有带回usage时用于估算用量
+            generated = []
+            usage = None
+            try:
+                response, leader = self._open_completion(request)
+                finish_reason = None
+                for event in self._iter_events(request, response):
+                    if isinstance(event, ContentEvent):
+                        timer.on_chunk()
+                        chunks.append(event.text)
+                        generated.append(event.text)
+                    elif isinstance(event, ToolCallDeltaEvent):
+                        timer.on_chunk()
+                        generated.extend((event.name or "", event.arguments))
+                    elif isinstance(event, FinishEvent):
+                        finish_reason = event.reason
+                    elif isinstance(event, UsageEvent):
+                        usage = event
+                    yield event
+                status = "ok"
+            except GeneratorExit:
+                # 调用方提前停止读取
+                status = "cancelled"
+                raise
+            finally:
+                # 无论正常结束、出错还是调用方提前停止, 都关闭响应, 把连接(或本地模型)还回去
+                if response is not None:
+                    self._close_stream(response)
+                timer.finish(status)
+                # 提前结束的流同样消耗了token, 在finally中记录(没有usage chunk时为估算值)
+                if leader:
+                    self._record_usage(request, usage, timer.elapsed, generated)
+        # 只缓存正常结束的纯文本响应
+        if key is not None and finish_reason in (None, "stop"):
+            self.cache.set(key, chunks)
+
+    def _stream_content(self, messages: list[dict[str, str]], **kwargs) -> Iterator[str]:
+        """只产出文本片段的流式接口, 供think与批量接口复用"""
+        for event in self._stream_events(messages, **kwargs):
+            if isinstance(event, ContentEvent):
+                yield event.text
+
+    def _complete(self, messages: list[dict[str, str]], **kwargs) -> str:
+        """发起非流式请求并返回完整文本, 不包装异常"""
+        return self._complete_response(messages, **kwargs).content
+
+    def _complete_response(self, messages: list[dict[str, str]], **kwargs) -> ChatResponse:
+        """发起非流式请求并返回文本与工具调用, 不包装异常"""
+        request = self._build_request(messages, stream=False, **kwargs)
+        key = self._cache_key(request)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ChatResponse("".join(cached), finish_reason="stop")
+
+        with self._scheduled(request):
+            timer = self._timer()
+            status = "error"
+            try:
+                response, leader = self._open_completion(request)
+                status = "ok"
+            finally:
+                timer.finish(status, stream=False)
+        if leader:
+            self._record_usage(request, getattr(response, "usage", None), timer.elapsed)
+        result = response_from_completion(response)
+        if result.content:
+            # 忽略stop参数的服务会返回停止序列之后的内容, 非流式响应无法提前结束, 至少保证结果一致
+            result.content = self._truncate_at_stop(result.content, request.get("stop"))
+        # 工具调用无法用文本缓存还原, 只缓存正常结束的纯文本响应(与流式一致, 被max_tokens截断的不缓存)
+        if (key is not None and result.content is not None and not result.tool_calls
+                and result.finish_reason in (None, "stop")):
+            self.cache.set(key, [result.content])
+        return result
+
+    async def _astream_events(self, messages: list[dict[str, str]], **kwargs) -> AsyncIterator[StreamEvent]:
+        """_stream_events的异步版本, 整个流的生命周期内占用一个并发名额"""
+        request = self._build_request(messages, stream=True, **kwargs)
+        key = self._cache_key(request)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                for content in cached:
+                    yield ContentEvent(content)
+                yield FinishEvent("stop")
+                return
+
+        async with self._ascheduled(request), self._get_semaphore():
+            timer = self._timer()
+            status = "error"
+            response = None
+            leader = False
+            chunks = []
+            # 已收到的输出(含工具调用参数), 流没有带回usage时用于估算用量
+            generated = []
+            usage = None
+            try:
+                response, leader = await self._aopen_completion(request)
+                finish_reason = None
+                async for event in self._aiter_events(request, response):
+                    if isinstance(event, ContentEvent):
+                        timer.on_chunk()
+                        chunks.append(event.text)
+                        generated.append(event.text)
+                    elif isinstance(event, ToolCallDeltaEvent):
+                        timer.on_chunk()
+                        generated.extend((event.name or "", event.arguments))
+                    elif isinstance(event, FinishEvent):
+                        finish_reason = event.reason
+                    elif isinstance(event, UsageEvent):
+                        usage = event
+                    yield event
+                status = "ok"
+            except (GeneratorExit, asyncio.CancelledError):
+                status = "cancelled"
+                raise
+            finally:
+                if response is not None:
+                    await self._aclose_stream(response)
+                timer.finish(status)
+                if leader:
+                    self._record_usage(request, usage, timer.elapsed, generated)
+        if key is not None and finish_reason in (None, "stop"):
+            self.cache.set(key, chunks)
+
+    async def _astream_content(self, messages: list[dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """_stream_content的异步版本"""
+        async for event in self._astream_events(messages, **kwargs):
+            if isinstance(event, ContentEvent):
+                yield event.text
+
+    async def _acomplete(self, messages: list[dict[str, str]], **kwargs) -> str:
+        """_complete的异步版本"""
+        return (await self._acomplete_response(messages, **kwargs)).content
+
+    async def _acomplete_response(self, messages: list[dict[str, str]], **kwargs) -> ChatResponse:
+        """_complete_response的异步版本"""
+        request = self._build_request(messages, stream=False, **kwargs)
+        key = self._cache_key(request)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ChatResponse("".join(cached), finish_reason="stop")
+
+        async with self._ascheduled(request), self._get_semaphore():
+            timer = self._timer()
+            status = "error"
+            try:
+                response, leader = await self._aopen_completion(request)
+                status = "ok"
+            finally:
+                timer.finish(status, stream=False)
+        if leader:
+            self._record_usage(request, getattr(response, "usage", None), timer.elapsed)
+        result = response_from_completion(response)
+        if result.content:
+            # 忽略stop参数的服务会返回停止序列之后的内容, 非流式响应无法提前结束, 至少保证结果一致
+            result.content = self._truncate_at_stop(result.content, request.get("stop"))
+        # 工具调用无法用文本缓存还原, 只缓存正常结束的纯文本响应(与流式一致, 被max_tokens截断的不缓存)
+        if (key is not None and result.content is not None and not result.tool_calls
+                and result.finish_reason in (None, "stop")):
+            self.cache.set(key, [result.content])
+        return result
+
+    @staticmethod
+    def _tool_kwargs(tools: Optional[list[dict]], tool_choice) -> dict:
+        """只在提供了工具时才附带tools/tool_choice, 不支持工具调用的服务不受影响"""
+        if not tools:
+            return {}
+        kwargs = {"tools": tools}
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return kwargs
+
+    @classmethod
+    def _request_kwargs(cls, tools: Optional[list[dict]], tool_choice, stop) -> dict:
+        """think/athink的可选请求参数, 未提供的不出现在请求里"""
+        kwargs = cls._tool_kwargs(tools, tool_choice)
+        if stop:
+            kwargs["stop"] = stop
+        return kwargs
+
+    def think(
+        self,
+        messages: list[dict[str, str]],
+        temperature: Optional[float] = None,
+        tools: Optional[list[dict]] = None,
+        tool_choice: Union[str, dict, None] = None,
+        stop: Union[str, list[str], None] = None,
+        **kwargs
+    ) -> Iterator[str]:
         """
         调用大语言模型进行思考，并返回流式响应。
         这是主要的调用方法，默认使用流式响应以获得更好的用户体验。
@@ -259,68 +1267,329 @@ class AgentsLLM:
         Args:
             messages: 消息列表
             temperature: 温度参数，如果未提供则使用初始化时的值
+            tools: 工具定义列表(见tools.function_tool), 提供时模型可以发起原生工具调用
+            tool_choice: auto / none / required 或指定某个工具
+            stop: 停止序列, 透传给服务端, 同时在客户端匹配: 命中后截断输出并立即关闭流
+            **kwargs: 其他透传给请求的参数, 如max_tokens
 
         Yields:
-            str: 流式响应的文本片段
+            str: 流式响应的文本片段; 流结束后完整文本与拼接好的工具调用保存在last_response中
         """
-        print(f"正在调用 {self.model} 模型...")
+        self.sink.info(f"正在调用 {self.model} 模型...")
         try:
-            response = self._client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature if temperature is not None else self.temperature,
-                max_tokens=self.max_tokens,
-                stream=True,
-            )
-
             # 处理流式响应
-            print("大语言模型响应成功:")
-            for chunk in response:
-                # --- 核心修复点：增加安全防御 ---
-                # 检查 chunk 是否有效，且包含 choices 列表且不为空
-                if not hasattr(chunk, 'choices') or not chunk.choices:
-                    continue
-                
-                # 安全获取 content
-                # 使用 getattr 进一步防止某些特殊的 delta 对象缺失 content 属性
-                delta = chunk.choices[0].delta
-                content = getattr(delta, 'content', "") or "" 
-                # getattr(对象, "属性名", 默认值)获取对象的属性。
-                if content:
-                    print(content, end="", flush=True)
-                    yield content # yield content让函数成为一个生成器，能够
+            self.sink.info("大语言模型响应成功:")
+            parts = []
+            assembler = ToolCallAssembler()
+            finish_reason = None
+            for event in self._stream_events(messages, temperature=temperature, **self._request_kwargs(tools, tool_choice, stop), **kwargs):
+                if isinstance(event, ContentEvent):
+                    self.sink.write(event.text)
+                    parts.append(event.text)
+                    yield event.text # yield content让函数成为一个生成器，能够
                     # 逐步返回内容而不是一次性返回完整响应
-            print()  # 在流式输出结束后换行
+                elif isinstance(event, ToolCallDeltaEvent):
+                    assembler.add(event)
+                elif isinstance(event, FinishEvent):
+                    finish_reason = event.reason
+            self.sink.end()  # 在流式输出结束后换行并写出剩余缓冲
+            self.last_response = ChatResponse("".join(parts) or None, assembler.calls(), finish_reason)
 
+        except DeadlineExceeded as e:
+            # 截止前已经输出的文本作为部分结果交给调用方
+            self.sink.end()
+            if e.partial is None:
+                e.partial = "".join(parts) or None
+            raise
         except Exception as e:
-            print(f"调用LLM API时发生错误: {e}")
-            raise AgentException(f"LLM调用失败: {str(e)}")
+            self.sink.info(f"调用LLM API时发生错误: {e}")
+            raise to_llm_exception(e) from e
 
-    def invoke(self, messages: list[dict[str, str]], **kwargs) -> str:
+    def invoke(
+        self,
+        messages: list[dict[str, str]],
+        tools: Optional[list[dict]] = None,
+        tool_choice: Union[str, dict, None] = None,
+        **kwargs
+    ) -> Union[str, ChatResponse]:
         """
         非流式调用LLM,返回完整响应。
         适用于不需要流式输出的场景。
+        提供tools时返回ChatResponse, 其中tool_calls为解析好的(可能多个并行的)工具调用;
+        tools为空列表时同样返回ChatResponse(请求中不带tools字段), 调用方无需区分工具注册表是否为空。
         """
         try:
-            response = self._client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=kwargs.get('temperature', self.temperature),
-                max_tokens=kwargs.get('max_tokens', self.max_tokens),
-                **{k: v for k, v in kwargs.items() if k not in ['temperature', 'max_tokens']}
-            )
-            return response.choices[0].message.content
+            if tools is not None:
+                return self._complete_response(messages, **self._tool_kwargs(tools, tool_choice), **kwargs)
+            return self._complete(messages, **kwargs)
         except Exception as e:
-            print(f"调用LLM API时发生错误: {e}")
-            raise AgentException(f"LLM调用失败: {str(e)}")
+            self.sink.info(f"调用LLM API时发生错误: {e}")
+            raise to_llm_exception(e) from e
 
     def stream_invoke(self, messages: list[dict[str, str]], **kwargs) -> Iterator[str]:
         """
         流式调用LLM的别名方法,与think方法功能相同。
         保持向后兼容性。
         """
-        temperature = kwargs.get('temperature')
-        yield from self.think(messages, temperature)
+        yield from self.think(messages, **kwargs)
+
+    def think_events(self, messages: list[dict[str, str]], **kwargs) -> Iterator[StreamEvent]:
+        """
+        结构化的流式调用。除文本增量外, 还会实时产出工具调用增量、结束原因和用量,
+        调用方可以在工具调用或截断(finish_reason=length)到达时立即处理, 无需再发一次非流式请求。
+        不向sink回显输出。
+
+        Args:
+            messages: 消息列表
+            **kwargs: 透传给请求的参数, 如temperature、tools
+
+        Yields:
+            StreamEvent: ContentEvent / ToolCallDeltaEvent / FinishEvent / UsageEvent
+        """
+        try:
+            yield from self._stream_events(messages, **kwargs)
+        except Exception as e:
+            self.sink.info(f"调用LLM API时发生错误: {e}")
+            raise to_llm_exception(e) from e
+
+    async def athink(
+        self,
+        messages: list[dict[str, str]],
+        temperature: Optional[float] = None,
+        tools: Optional[list[dict]] = None,
+        tool_choice: Union[str, dict, None] = None,
+        stop: Union[str, list[str], None] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        think的异步版本, 基于AsyncOpenAI, 不占用线程。
+        同一实例的在途请求数受max_concurrency限制, 超出的调用在事件循环上排队等待。
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数，如果未提供则使用初始化时的值
+            tools: 工具定义列表
+            tool_choice: 工具选择策略
+            stop: 停止序列
+            **kwargs: 其他透传给请求的参数, 如max_tokens
+
+        Yields:
+            str: 流式响应的文本片段; 流结束后完整结果保存在last_response中
+        """
+        self.sink.info(f"正在调用 {self.model} 模型...")
+        try:
+            self.sink.info("大语言模型响应成功:")
+            parts = []
+            assembler = ToolCallAssembler()
+            finish_reason = None
+            async for event in self._astream_events(messages, temperature=temperature, **self._request_kwargs(tools, tool_choice, stop), **kwargs):
+                if isinstance(event, ContentEvent):
+                    self.sink.write(event.text)
+                    parts.append(event.text)
+                    yield event.text
+                elif isinstance(event, ToolCallDeltaEvent):
+                    assembler.add(event)
+                elif isinstance(event, FinishEvent):
+                    finish_reason = event.reason
+            self.sink.end()
+            self.last_response = ChatResponse("".join(parts) or None, assembler.calls(), finish_reason)
+
+        except DeadlineExceeded as e:
+            self.sink.end()
+            if e.partial is None:
+                e.partial = "".join(parts) or None
+            raise
+        except Exception as e:
+            self.sink.info(f"调用LLM API时发生错误: {e}")
+            raise to_llm_exception(e) from e
+
+    async def ainvoke(
+        self,
+        messages: list[dict[str, str]],
+        tools: Optional[list[dict]] = None,
+        tool_choice: Union[str, dict, None] = None,
+        **kwargs
+    ) -> Union[str, ChatResponse]:
+        """
+        invoke的异步版本, 非流式调用LLM并返回完整响应; 提供tools(包括空列表)时返回ChatResponse。
+        """
+        try:
+            if tools is not None:
+                return await self._acomplete_response(messages, **self._tool_kwargs(tools, tool_choice), **kwargs)
+            return await self._acomplete(messages, **kwargs)
+        except Exception as e:
+            self.sink.info(f"调用LLM API时发生错误: {e}")
+            raise to_llm_exception(e) from e
+
+    async def athink_events(self, messages: list[dict[str, str]], **kwargs) -> AsyncIterator[StreamEvent]:
+        """
+        think_events的异步版本。
+        """
+        try:
+            async for event in self._astream_events(messages, **kwargs):
+                yield event
+        except Exception as e:
+            self.sink.info(f"调用LLM API时发生错误: {e}")
+            raise to_llm_exception(e) from e
+
+    async def astream_invoke(self, messages: list[dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """
+        异步流式调用LLM的别名方法,与athink方法功能相同。
+        """
+        async for chunk in self.athink(messages, **kwargs):
+            yield chunk
+
+    def invoke_many(
+        self,
+        messages_list: list[list[dict[str, str]]],
+        max_concurrency: Optional[int] = None,
+        priority: str = "batch",
+        **kwargs
+    ) -> list[BatchResult]:
+        """
+        批量非流式调用LLM。请求分发到有界线程池并发执行, 结果按输入顺序返回。
+        单条请求失败只记录在对应BatchResult.error中, 不会中断整个批次。
+
+        Args:
+            messages_list: 多组消息列表, 每组对应一次invoke
+            max_concurrency: 线程池大小, 默认使用实例的max_concurrency
+            priority: 配置了调度器时使用的优先级通道, 默认batch, 让位于交互请求
+            **kwargs: 透传给每次invoke的参数
+
+        Returns:
+            list[BatchResult]: 与messages_list一一对应的结果
+        """
+        with run_scope(priority=priority):
+            return run_batch(
+                lambda messages: self.invoke(messages, **kwargs),
+                messages_list,
+                max_concurrency or self.max_concurrency,
+            )
+
+    def stream_invoke_many(
+        self,
+        messages_list: list[list[dict[str, str]]],
+        max_concurrency: Optional[int] = None,
+        priority: str = "batch",
+        **kwargs
+    ) -> Iterator[BatchChunk]:
+        """
+        批量流式调用LLM。各请求的文本片段按到达顺序交错产出, 通过BatchChunk.index区分归属;
+        每个请求结束(或失败)时产出一个done=True的BatchChunk。提前停止迭代会取消尚未完成的请求。
+
+        Args:
+            messages_list: 多组消息列表
+            max_concurrency: 线程池大小, 默认使用实例的max_concurrency
+            priority: 配置了调度器时使用的优先级通道, 默认batch
+            **kwargs: 透传给每次流式调用的参数
+
+        Yields:
+            BatchChunk: 带请求序号的文本片段或结束标记
+        """
+        # 工作线程在提交时复制上下文, 之后调用方的上下文变化不影响它们
+        with run_scope(priority=priority):
+            stream = stream_batch(
+                lambda messages: self._stream_content(messages, **kwargs),
+                messages_list,
+                max_concurrency or self.max_concurrency,
+            )
+            first = next(stream, None)
+        if first is None:
+            return
+        yield first
+        yield from stream
+
+    async def ainvoke_many(
+        self,
+        messages_list: list[list[dict[str, str]]],
+        max_concurrency: Optional[int] = None,
+        priority: str = "batch",
+        **kwargs
+    ) -> list[BatchResult]:
+        """
+        invoke_many的异步版本, 在当前事件循环上并发执行, 结果按输入顺序返回。
+        实例级的max_concurrency限制依然生效。
+        """
+        with run_scope(priority=priority):
+            return await arun_batch(
+                lambda messages: self.ainvoke(messages, **kwargs),
+                messages_list,
+                max_concurrency or self.max_concurrency,
+            )
+
+    @property
+    def embedder(self) -> EmbeddingBatcher:
+        """本实例的嵌入微批处理器, 首次使用时创建"""
+        if self._embedder is None:
+            self._embedder = EmbeddingBatcher(
+                self._embed_batch,
+                max_batch_size=int(os.getenv("LLM_EMBED_BATCH_SIZE", 64)),
+                max_wait=float(os.getenv("LLM_EMBED_MAX_WAIT", 0.005)),
+                metrics=self.metrics,
+                provider=self.provider,
+                model=self.embedding_model,
+            )
+        return self._embedder
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """向provider发送一个批次的embeddings请求(带重试、熔断与限流), 按输入顺序返回向量"""
+        request = {"model": self.embedding_model, "input": texts}
+        tokens = sum(self._token_counter.count_text(text) for text in texts)
+
+        def send(client):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(tokens)
+            return client.embeddings.create(**request, **self._timeout_options())
+
+        def attempt():
+            result, endpoint, latency = self.endpoint_pool.call(lambda ep: send(ep.client))
+            self.endpoint_pool.release(endpoint, latency=latency)
+            return result
+
+        start = time.monotonic()
+        with diagnostics_to(self.sink):
+            if self.endpoint_pool is None:
+                response = call_with_retry(lambda: send(self.client), self.retry_policy, self.circuit_breaker, self.breaker_key)
+            else:
+                response = call_with_retry(attempt, self.retry_policy, None, self.breaker_key)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            self.usage_tracker.record(self.embedding_model, prompt_tokens, 0, time.monotonic() - start)
+            if self.rate_limiter is not None:
+                self.rate_limiter.reconcile(tokens, prompt_tokens)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed(self, texts: Union[str, list[str]]) -> Union[array, list[array]]:
+        """
+        计算文本向量。并发的零散调用会被合并成批次发送, 相同文本只请求一次, 结果以float32数组缓存。
+
+        Args:
+            texts: 单个文本或文本列表
+
+        Returns:
+            单个文本时返回一个array('f'), 列表时返回等长的向量列表(与缓存共享, 不要原地修改)
+        """
+        try:
+            if isinstance(texts, str):
+                return self.embedder.embed([texts])[0]
+            return self.embedder.embed(texts)
+        except Exception as e:
+            self.sink.info(f"调用Embedding API时发生错误: {e}")
+            raise to_llm_exception(e) from e
+
+    async def aembed(self, texts: Union[str, list[str]]) -> Union[array, list[array]]:
+        """
+        embed的异步版本, 批次在后台线程中发送, 等待期间不阻塞事件循环。
+        """
+        try:
+            if isinstance(texts, str):
+                return (await self.embedder.aembed([texts]))[0]
+            return await self.embedder.aembed(texts)
+        except Exception as e:
+            self.sink.info(f"调用Embedding API时发生错误: {e}")
+            raise to_llm_exception(e) from e
+
 # 向后兼容：某些模块引用 `LLM` 名称，提供别名以避免导入错误
 LLM = AgentsLLM
 if __name__ == "__main__":
@@ -0,0 +1,235 @@
+"""
+进程内本地模型(transformers provider): 在当前进程中加载HuggingFace模型,
+提供与OpenAI客户端相同形状的chat.completions.create接口, 省去本地HTTP服务的序列化与socket开销。
+
+    llm = AgentsLLM(provider="transformers", model="Qwen/Qwen1.5-0.5B-Chat")
+
+transformers与torch只在首次创建请求时导入, 同一模型在进程内只加载一次。
+"""
+
+import time
+import uuid
+import asyncio
+import threading
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+
+from .exceptions import LLMException
+from .sinks import diagnostic
+
+DEFAULT_LOCAL_MODEL = "Qwen/Qwen1.5-0.5B-Chat"
+# 请求未指定max_tokens时最多生成的token数, 与qwen-0.5b/main.py保持一致
+DEFAULT_MAX_NEW_TOKENS = 512
+
+
+class _LoadedModel:
+    """已加载的分词器与模型。CPU推理时并发生成只会互相争抢算力, 因此同一模型的生成串行执行"""
+
+    def __init__(self, model_id: str, device: Optional[str]):
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise LLMException("transformers provider需要安装transformers与torch: pip install transformers torch") from e
+        self.torch = torch
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        diagnostic(f"🧠 正在加载本地模型 {model_id} ({self.device})...")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.model = AutoModelForCausalLM.from_pretrained(model_id).to(self.device)
+        self.model.eval()
+        self.lock = threading.Lock()
+
+
+_models: dict[tuple[str, Optional[str]], _LoadedModel] = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_id: str, device: Optional[str] = None) -> _LoadedModel:
+    """获取进程内共享的模型, 首次调用时加载(并发的首次调用只会加载一次)"""
+    key = (model_id, device)
+    with _models_lock:
+        loaded = _models.get(key)
+        if loaded is None:
+            loaded = _models[key] = _LoadedModel(model_id, device)
+        return loaded
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens)
+
+
+class _StopFlag:
+    """transformers的StoppingCriteria: 流被关闭时中止生成, 同时记录已生成的token数"""
+
+    def __init__(self, prompt_length: int):
+        self.prompt_length = prompt_length
+        self.generated = 0
+        self.cancelled = threading.Event()
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        self.generated = input_ids.shape[-1] - self.prompt_length
+        return self.cancelled.is_set()
+
+
+class LocalStream:
+    """
+    流式响应。生成在后台线程中进行, 通过TextIteratorStreamer逐段取出文本并包装成chunk;
+    close()会让模型在下一个token处停止生成(配合客户端stop序列提前结束)。
+    """
+
+    def __init__(self, loaded: _LoadedModel, inputs, generate_kwargs: dict, model: str, include_usage: bool):
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+        self.id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        self.created = int(time.time())
+        self.model = model
+        self.include_usage = include_usage
+        self.max_new_tokens = generate_kwargs["max_new_tokens"]
+        self.prompt_tokens = inputs["input_ids"].shape[-1]
+        self._stop = _StopFlag(self.prompt_tokens)
+        self._streamer = TextIteratorStreamer(loaded.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self._loaded = loaded
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(
+            target=self._generate,
+            args=({**inputs, **generate_kwargs, "streamer": self._streamer,
+                   "stopping_criteria": StoppingCriteriaList([self._stop])},),
+            name="local-model-generate", daemon=True,
+        )
+        self._thread.start()
+
+    def _generate(self, kwargs: dict) -> None:
+        try:
+            with self._loaded.lock, self._loaded.torch.inference_mode():
+                self._loaded.model.generate(**kwargs)
+        except BaseException as e:
+            self._error = e
+            # 让正在等待文本的消费者退出
+            self._streamer.end()
+
+    def _chunk(self, delta: dict, finish_reason: Optional[str] = None, usage=None) -> SimpleNamespace:
+        choices = [] if usage is not None else [SimpleNamespace(
+            index=0, delta=SimpleNamespace(role=delta.get("role"), content=delta.get("content"), tool_calls=None),
+            finish_reason=finish_reason,
+        )]
+        return SimpleNamespace(id=self.id, object="chat.completion.chunk", created=self.created,
+                               model=self.model, choices=choices, usage=usage)
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        yield self._chunk({"role": "assistant", "content": ""})
+        for text in self._streamer:
+            if text:
+                yield self._chunk({"content": text})
+        self._thread.join()
+        if self._error is not None:
+            raise LLMException(f"本地模型生成失败: {self._error}") from self._error
+        if self._stop.cancelled.is_set():
+            return
+        finish_reason = "length" if self._stop.generated >= self.max_new_tokens else "stop"
+        yield self._chunk({}, finish_reason)
+        if self.include_usage:
+            yield self._chunk({}, usage=_usage(self.prompt_tokens, self._stop.generated))
+
+    def close(self) -> None:
+        self._stop.cancelled.set()
+
+
+class AsyncLocalStream:
+    """LocalStream的异步包装, 每个chunk在线程中取出, 不阻塞事件循环"""
+
+    def __init__(self, stream: LocalStream):
+        self._stream = stream
+        self._iterator = iter(stream)
+
+    def __aiter__(self) -> "AsyncLocalStream":
+        return self
+
+    async def __anext__(self) -> SimpleNamespace:
+        chunk = await asyncio.to_thread(next, self._iterator, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    async def close(self) -> None:
+        self._stream.close()
+
+
+class _Completions:
+    def __init__(self, client: "LocalModelClient"):
+        self._client = client
+
+    def create(self, **request: Any):
+        return self._client.create(**request)
+
+
+class _AsyncCompletions:
+    def __init__(self, client: "LocalModelClient"):
+        self._client = client
+
+    async def create(self, **request: Any):
+        if request.get("stream"):
+            stream = await asyncio.to_thread(self._client.create, **request)
+            return AsyncLocalStream(stream)
+        return await asyncio.to_thread(self._client.create, **request)
+
+
+class LocalModelClient:
+    """
+    与OpenAI客户端接口一致的进程内客户端, 只实现AgentsLLM用到的chat.completions.create。
+    不支持原生工具调用; temperature为0时使用贪心解码。
+    """
+
+    def __init__(self, model: str = DEFAULT_LOCAL_MODEL, device: Optional[str] = None):
+        """
+        Args:
+            model: HuggingFace模型ID或本地路径
+            device: 运行设备(cpu/cuda/mps), 默认有GPU时用cuda
+        """
+        self.model = model
+        self.device = device
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def create(self, **request: Any):
+        """chat.completions.create的本地实现, 忽略服务端专用参数(如stream_options以外的扩展字段)"""
+        if request.get("tools"):
+            raise LLMException("transformers provider不支持原生工具调用")
+        loaded = load_model(request.get("model") or self.model, self.device)
+        text = loaded.tokenizer.apply_chat_template(request["messages"], tokenize=False, add_generation_prompt=True)
+        inputs = loaded.tokenizer([text], return_tensors="pt").to(loaded.device)
+        generate_kwargs: dict[str, Any] = {"max_new_tokens": request.get("max_tokens") or DEFAULT_MAX_NEW_TOKENS}
+        temperature = request.get("temperature")
+        if temperature:
+            generate_kwargs.update(do_sample=True, temperature=temperature)
+        else:
+            generate_kwargs["do_sample"] = False
+        if request.get("timeout"):
+            # 运行截止时间收紧的超时直接限制生成时长
+            generate_kwargs["max_time"] = float(request["timeout"])
+        model = request.get("model") or self.model
+
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            return LocalStream(loaded, inputs, generate_kwargs, model, include_usage)
+
+        prompt_tokens = inputs["input_ids"].shape[-1]
+        with loaded.lock, loaded.torch.inference_mode():
+            output = loaded.model.generate(**inputs, **generate_kwargs)
+        new_ids = output[0][prompt_tokens:]
+        content = loaded.tokenizer.decode(new_ids, skip_special_tokens=True)
+        completion_tokens = len(new_ids)
+        finish_reason = "length" if completion_tokens >= generate_kwargs["max_new_tokens"] else "stop"
+        return SimpleNamespace(
+            id=f"chatcmpl-{uuid.uuid4().hex[:12]}", object="chat.completion", created=int(time.time()), model=model,
+            choices=[SimpleNamespace(index=0, finish_reason=finish_reason,
+                                     message=SimpleNamespace(role="assistant", content=content, tool_calls=None))],
+            usage=_usage(prompt_tokens, completion_tokens),
+        )
+
+
+class AsyncLocalModelClient(LocalModelClient):
+    """LocalModelClient的异步版本, 生成在线程中进行"""
+
+    def __init__(self, model: str = DEFAULT_LOCAL_MODEL, device: Optional[str] = None):
+        super().__init__(model, device)
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self))
@@ -0,0 +1,196 @@
+"""轻量指标系统: 计数器/仪表/直方图, 支持Prometheus文本格式导出与回调"""
+
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+# 延迟类直方图的默认分桶(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 计数类直方图(如每个响应的chunk数)的默认分桶
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+Labels = tuple[tuple[str, str], ...]
+Listener = Callable[[str, float, dict[str, str]], None]
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为+Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    指标注册表。指标在首次使用时按名称注册, 同名指标按标签区分序列。
+    监听器会收到每一次observe/inc/set, 可用于对接其他监控系统。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: dict[str, tuple[str, str, tuple[float, ...]]] = {}
+        self._values: dict[str, dict[Labels, object]] = {}
+        self._listeners: list[Listener] = []
+
+    def describe(self, name: str, kind: str, help_text: str = "", buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        """
+        注册指标元信息。
+
+        Args:
+            name: 指标名
+            kind: counter / gauge / histogram
+            help_text: 说明文字
+            buckets: 直方图分桶上界(升序)
+        """
+        with self._lock:
+            self._meta.setdefault(name, (kind, help_text, tuple(sorted(buckets))))
+            self._values.setdefault(name, {})
+
+    def add_listener(self, listener: Listener) -> None:
+        """注册回调, 签名为listener(name, value, labels)"""
+        self._listeners.append(listener)
+
+    def _notify(self, name: str, values: Iterable[float], labels: dict[str, str]) -> None:
+        for listener in self._listeners:
+            for value in values:
+                listener(name, value, labels)
+
+    @staticmethod
+    def _key(labels: dict[str, str]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """向直方图记录一个观测值"""
+        self.observe_many(name, (value,), **labels)
+
+    def observe_many(self, name: str, values: Iterable[float], **labels) -> None:
+        """批量记录观测值, 只加一次锁, 适合在流结束时一次性提交逐chunk的数据"""
+        values = list(values)
+        if not values:
+            return
+        if name not in self._meta:
+            self.describe(name, "histogram")
+        key = self._key(labels)
+        with self._lock:
+            series = self._values[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._meta[name][2])
+            for value in values:
+                histogram.observe(value)
+        self._notify(name, values, labels)
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """计数器累加"""
+        if name not in self._meta:
+            self.describe(name, "counter")
+        key = self._key(labels)
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0.0) + value
+        self._notify(name, (value,), labels)
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """设置仪表值"""
+        if name not in self._meta:
+            self.describe(name, "gauge")
+        with self._lock:
+            self._values[name][self._key(labels)] = value
+        self._notify(name, (value,), labels)
+
+    def get(self, name: str, **labels) -> Optional[object]:
+        """读取某个序列的当前值(计数器/仪表为数值, 直方图为内部对象)"""
+        with self._lock:
+            return self._values.get(name, {}).get(self._key(labels))
+
+    def to_prometheus(self) -> str:
+        """按Prometheus文本格式导出所有指标"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in self._values[name].items():
+                    if kind != "histogram":
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {value.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """清空所有序列(保留指标定义与监听器)"""
+        with self._lock:
+            for series in self._values.values():
+                series.clear()
+
+
+def _format_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    body = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in key)
+    return "{" + body + "}"
+
+
+# 进程级默认注册表
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("llm_requests_total", "counter", "LLM请求数, 按结果区分")
+REGISTRY.describe("llm_request_duration_seconds", "histogram", "LLM请求从发出到结束的总耗时")
+REGISTRY.describe("llm_time_to_first_token_seconds", "histogram", "流式请求从发出到首个文本片段的耗时")
+REGISTRY.describe("llm_inter_token_latency_seconds", "histogram", "流式响应相邻文本片段之间的间隔")
+REGISTRY.describe("llm_stream_chunks", "histogram", "每个流式响应包含的文本片段数", buckets=COUNT_BUCKETS)
+
+
+class StreamTimer:
+    """
+    记录一次LLM请求的时间线: 发出时刻、首个片段、片段间隔、总耗时与片段数。
+    逐片段数据先保存在本地, finish时一次性提交到注册表, 避免在热路径上加锁。
+    """
+
+    def __init__(self, registry: MetricsRegistry, **labels):
+        self.registry = registry
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self._last: Optional[float] = None
+        self.gaps: list[float] = []
+        self.chunks = 0
+
+    def on_chunk(self) -> None:
+        now = time.perf_counter()
+        if self._last is None:
+            self.first_token = now - self.start
+        else:
+            self.gaps.append(now - self._last)
+        self._last = now
+        self.chunks += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def finish(self, status: str = "ok", stream: bool = True) -> None:
+        """提交本次请求的全部指标"""
+        registry, labels = self.registry, self.labels
+        registry.inc("llm_requests_total", status=status, **labels)
+        registry.observe("llm_request_duration_seconds", self.elapsed, stream=str(stream).lower(), **labels)
+        if not stream:
+            return
+        if self.first_token is not None:
+            registry.observe("llm_time_to_first_token_seconds", self.first_token, **labels)
+        registry.observe_many("llm_inter_token_latency_seconds", self.gaps, **labels)
+        if status == "ok":
+            registry.observe("llm_stream_chunks", self.chunks, **labels)
@@ -0,0 +1,172 @@
+"""客户端限流: 按provider/模型共享的令牌桶, 同时限制每分钟请求数(RPM)与token数(TPM)"""
+
+import time
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import Optional
+
+from .metrics import MetricsRegistry, REGISTRY
+
+# 请求未指定max_tokens时, 按此估算补全部分的token数
+DEFAULT_COMPLETION_ESTIMATE = 512
+
+REGISTRY.describe("llm_rate_limit_queue_depth", "gauge", "等待限流放行的请求数")
+REGISTRY.describe("llm_rate_limit_wait_seconds", "histogram", "请求在限流器中的等待时间")
+
+
+class _Bucket:
+    """令牌桶, 容量为每分钟配额, 按秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """距离桶内有amount个令牌还需等待的秒数"""
+        missing = amount - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class RateLimiter:
+    """
+    RPM/TPM限流器。等待者按到达顺序排队(FIFO), 只有队首能取令牌,
+    避免大请求被源源不断的小请求饿死。同步线程与协程可以共用同一个限流器。
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        name: str = "default",
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            rpm: 每分钟请求数上限, None表示不限
+            tpm: 每分钟token数上限, None表示不限
+            name: 限流器名称, 用作指标标签
+            metrics: 指标注册表, 默认使用进程级的REGISTRY
+        """
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self.name = name
+        self.metrics = metrics or REGISTRY
+        self._cond = threading.Condition()
+        self._queue: deque[int] = deque()
+        self._tickets = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _try_take(self, ticket: int, tokens: float) -> float:
+        """持锁调用。队首且配额足够时扣减并出队返回0, 否则返回建议等待秒数"""
+        now = time.monotonic()
+        waits = []
+        for bucket, amount in ((self.requests, 1.0), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                waits.append(bucket.wait_time(min(amount, bucket.capacity)))
+        wait = max(waits, default=0.0)
+        if self._queue[0] != ticket:
+            return max(wait, 0.01)
+        if wait > 0:
+            return wait
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= min(tokens, self.tokens.capacity)
+        self._queue.popleft()
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self) -> int:
+        ticket = next(self._tickets)
+        self._queue.append(ticket)
+        self.metrics.set("llm_rate_limit_queue_depth", len(self._queue), limiter=self.name)
+        return ticket
+
+    def _done(self, ticket: int, start: float) -> None:
+        """持锁调用。记录等待时间与队列深度"""
+        if ticket in self._queue:
+            # 等待被中断(如任务取消)时离开队列, 让后面的请求继续
+            self._queue.remove(ticket)
+            self._cond.notify_all()
+        self.metrics.set("llm_rate_limit_queue_depth", len(self._queue), limiter=self.name)
+        self.metrics.observe("llm_rate_limit_wait_seconds", time.monotonic() - start, limiter=self.name)
+
+    def acquire(self, tokens: float = 0) -> float:
+        """
+        阻塞直到取得1个请求配额和tokens个token配额。
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue()
+            try:
+                while True:
+                    wait = self._try_take(ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            finally:
+                self._done(ticket, start)
+        return time.monotonic() - start
+
+    async def aacquire(self, tokens: float = 0) -> float:
+        """acquire的异步版本, 等待期间不阻塞事件循环"""
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue()
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            with self._cond:
+                self._done(ticket, start)
+        return time.monotonic() - start
+
+    def reconcile(self, estimated: float, actual: float) -> None:
+        """
+        一次尝试结束后按实际用量修正token桶: 估多了退还, 估少了补扣。
+        acquire时超过桶容量的估算只扣了容量那么多, 退还也以此为准, 不会多退。
+
+        Args:
+            estimated: 传给acquire的估算token数
+            actual: 实际消耗的token数, 请求失败时为0(全部退还)
+        """
+        if self.tokens is None:
+            return
+        with self._cond:
+            self.tokens.refill(time.monotonic())
+            charged = min(estimated, self.tokens.capacity)
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + charged - actual)
+            self._cond.notify_all()
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str, rpm: Optional[float], tpm: Optional[float]) -> RateLimiter:
+    """获取进程级共享的限流器, 同一provider+模型只创建一次(以首次创建时的配额为准)"""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(rpm, tpm, name=f"{provider}:{model}")
+        return limiter
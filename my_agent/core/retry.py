@@ -0,0 +1,287 @@
+"""重试与熔断: 指数退避+抖动、Retry-After、可重试错误分类、按provider的熔断器"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+import email.utils
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from .exceptions import LLMException, CircuitOpenException, DeadlineExceeded
+from .runtime import check_deadline, remaining
+from .sinks import diagnostic
+
+T = TypeVar("T")
+
+# 这些状态码代表服务端暂时不可用或限流, 重试有意义
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略"""
+
+    max_retries: int = int(os.getenv("LLM_MAX_RETRIES", 3))
+    base_delay: float = 0.5  # 第一次重试的基准等待秒数
+    max_delay: float = 30.0  # 单次退避等待上限
+    jitter: float = 1.0  # 抖动比例, 1.0为full jitter, 0为不抖动
+    max_retry_after: float = 60.0  # 服务端要求等待更久时不再重试, 直接失败
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        计算第attempt次(从0开始)重试前的等待时间。
+        服务端给出Retry-After时以它为下限。
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay -= delay * self.jitter * random.random()
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def status_code_of(exc: BaseException) -> Optional[int]:
+    """取出异常携带的HTTP状态码"""
+    if isinstance(exc, LLMException):
+        return exc.status_code
+    return getattr(exc, "status_code", None)
+
+
+def _transient_errors() -> tuple[type, ...]:
+    """
+    连接类异常类型。openai及其HTTP库尚未被导入时不可能抛出它们的异常,
+    因此只从sys.modules中取, 不为了类型判断而导入SDK。
+    SDK底层可能是httpx或httpx2, 以SDK默认Limits所在的模块为准。
+    """
+    errors: tuple[type, ...] = (ConnectionError, TimeoutError)
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        errors += (openai.APIConnectionError,)
+        limits = getattr(openai, "DEFAULT_CONNECTION_LIMITS", None)
+        if limits is not None:
+            http = sys.modules.get(type(limits).__module__.split(".")[0])
+            if http is not None and hasattr(http, "TransportError"):
+                errors += (http.TransportError,)
+    return errors
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断异常是否值得重试: 连接类错误、超时、限流与5xx可重试, 鉴权/参数错误等直接失败"""
+    if isinstance(exc, LLMException):
+        return exc.retryable
+    if isinstance(exc, _transient_errors()):
+        return True
+    status = status_code_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return False
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """解析响应头中的retry-after-ms / retry-after(秒数或HTTP日期)"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value) if value else None
+        if parsed is None:
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+
+def to_llm_exception(exc: BaseException) -> LLMException:
+    """把底层异常转换为带分类信息的LLMException"""
+    if isinstance(exc, LLMException):
+        return exc
+    return LLMException(f"LLM调用失败: {exc}", retryable=is_retryable(exc), status_code=status_code_of(exc))
+
+
+class CircuitBreaker:
+    """
+    熔断器。连续failure_threshold次可重试失败后打开, 打开期间直接拒绝请求;
+    经过recovery_timeout秒进入半开状态, 只放行一个探测请求, 成功则关闭, 失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"  # closed / open / half_open
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """当前是否允许发出请求"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def trip(self) -> None:
+        """立即打开熔断器(例如健康检查失败时)"""
+        with self._lock:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def retry_in(self) -> float:
+        """距离允许探测还需等待的秒数"""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(key: str) -> CircuitBreaker:
+    """获取进程级共享的熔断器, key通常为provider与base_url的组合"""
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", 5)),
+                recovery_timeout=float(os.getenv("LLM_BREAKER_RECOVERY", 30)),
+            )
+            _breakers[key] = breaker
+        return breaker
+
+
+def _check_breaker(breaker: Optional[CircuitBreaker], key: str) -> None:
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenException(
+            f"{key} 熔断中, {breaker.retry_in():.1f}秒后重试", retryable=False
+        )
+
+
+def _next_delay(exc: BaseException, attempt: int, policy: RetryPolicy, breaker: Optional[CircuitBreaker]) -> Optional[float]:
+    """记录一次失败并返回下一次重试前的等待秒数, 不应重试时返回None"""
+    if not is_retryable(exc):
+        # 鉴权、参数等客户端错误说明端点本身可达, 不计入熔断
+        if breaker is not None:
+            breaker.record_success()
+        return None
+    if breaker is not None:
+        breaker.record_failure()
+    if attempt >= policy.max_retries:
+        return None
+    retry_after = retry_after_seconds(exc)
+    if retry_after is not None and retry_after > policy.max_retry_after:
+        return None
+    return policy.backoff(attempt, retry_after)
+
+
+def _check_backoff(exc: BaseException, delay: Optional[float]) -> None:
+    """
+    运行设置了截止时间时: 退避等待会越过截止时间则不再重试, 可重试错误发生时截止时间已过
+    (通常是被收紧的单次超时触发的)也归为超时, 两种情况都以DeadlineExceeded结束。
+    """
+    left = remaining()
+    if left is None:
+        return
+    if delay is None:
+        if left <= 0 and is_retryable(exc):
+            raise DeadlineExceeded(f"运行已超过截止时间({exc})") from exc
+        return
+    if delay >= left:
+        raise DeadlineExceeded(f"剩余{max(left, 0):.2f}秒, 不足以等待{delay:.2f}秒后重试({exc})") from exc
+
+
+def call_with_retry(
+    fn: Callable[[], T],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    key: str = "llm",
+) -> T:
+    """
+    按策略调用fn, 可重试错误按退避时间重试, 最终失败时抛出LLMException。
+    当前运行设置了截止时间时, 每次尝试前检查是否超时, 退避等待也不会越过截止时间。
+
+    Args:
+        fn: 无参调用
+        policy: 重试策略
+        breaker: 可选的熔断器
+        key: 用于错误信息的端点标识
+    """
+    attempt = 0
+    while True:
+        _check_breaker(breaker, key)
+        check_deadline()
+        try:
+            result = fn()
+        except Exception as e:
+            delay = _next_delay(e, attempt, policy, breaker)
+            _check_backoff(e, delay)
+            if delay is None:
+                raise to_llm_exception(e) from e
+            diagnostic(f"调用 {key} 失败({e}), {delay:.2f}秒后进行第{attempt + 1}次重试")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def acall_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    key: str = "llm",
+) -> T:
+    """call_with_retry的异步版本"""
+    attempt = 0
+    while True:
+        _check_breaker(breaker, key)
+        check_deadline()
+        try:
+            result = await fn()
+        except Exception as e:
+            delay = _next_delay(e, attempt, policy, breaker)
+            _check_backoff(e, delay)
+            if delay is None:
+                raise to_llm_exception(e) from e
+            diagnostic(f"调用 {key} 失败({e}), {delay:.2f}秒后进行第{attempt + 1}次重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
@@ -0,0 +1,285 @@
+"""模型路由: 在多个模型之间按提示词长度、难度提示以及实时延迟/错误率为每个请求选择模型"""
+
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, Optional, Union
+
+from .context_window import TokenCounter, context_limit
+from .events import StreamEvent
+from .exceptions import LLMException
+from .usage import Usage
+
+if TYPE_CHECKING:
+    from .llm import AgentsLLM
+
+# 难度提示到所需模型档位(tier)的映射, 也可以直接传整数档位
+DIFFICULTY_TIERS = {"easy": 0, "medium": 1, "hard": 2}
+
+Difficulty = Union[str, int, None]
+
+
+@dataclass
+class ModelRoute:
+    """
+    一个可选模型。tier表示能力档位, 数值越大越强(通常也越慢越贵);
+    cost为每千token的相对成本, 为None时按AgentsLLM用量统计器的价格表估算。
+    延迟分两种统计: ewma_latency为非流式调用的总耗时, ewma_ttft为流式调用的首token延迟,
+    两者量级不同, 路由时按调用方式取对应的一个。
+    """
+
+    llm: "AgentsLLM"
+    tier: int = 0
+    cost: Optional[float] = None
+    name: Optional[str] = None
+    ewma_latency: Optional[float] = None
+    ewma_ttft: Optional[float] = None
+    ewma_error: float = 0.0
+    requests: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self.name = self.name or self.llm.model
+
+    @property
+    def max_prompt_tokens(self) -> int:
+        return context_limit(self.llm.model) - (self.llm.max_tokens or 0)
+
+    @property
+    def available(self) -> bool:
+        """熔断器打开(或端点池无健康副本)时不可用"""
+        breaker = self.llm.circuit_breaker
+        if breaker is not None:
+            return breaker.state != "open"
+        pool = self.llm.endpoint_pool
+        return pool is None or any(endpoint.healthy for endpoint in pool.endpoints)
+
+    def estimated_cost(self, prompt_tokens: int) -> float:
+        completion_tokens = self.llm.max_tokens or 256
+        if self.cost is not None:
+            return self.cost * (prompt_tokens + completion_tokens) / 1000
+        return self.llm.usage_tracker.price_table.cost(self.llm.model, prompt_tokens, completion_tokens)
+
+    def latency(self, stream: bool = False) -> Optional[float]:
+        """与调用方式对应的延迟: 流式为首token延迟, 非流式为总耗时"""
+        return self.ewma_ttft if stream else self.ewma_latency
+
+    def record(self, latency: Optional[float], error: bool, alpha: float, stream: bool = False) -> None:
+        """更新延迟(流式为首token延迟, 非流式为总耗时)与错误率的指数滑动平均"""
+        with self._lock:
+            self.requests += 1
+            self.ewma_error = (1 - alpha) * self.ewma_error + alpha * (1.0 if error else 0.0)
+            if latency is not None:
+                current = self.latency(stream)
+                value = latency if current is None else (1 - alpha) * current + alpha * latency
+                if stream:
+                    self.ewma_ttft = value
+                else:
+                    self.ewma_latency = value
+
+
+class ModelRouter:
+    """
+    与AgentsLLM接口一致的模型路由器, 可以直接作为Agent的llm使用。
+
+    每个请求先确定所需档位: 调用方通过difficulty参数提示(easy/medium/hard或整数),
+    未提示时提示词超过long_prompt_tokens视为hard, 否则为easy。
+    然后在档位足够、上下文放得下且健康的模型中按
+    cost_weight*预估成本 + latency_weight*延迟 + error_weight*错误率 打分, 取最低者
+    (延迟取与调用方式对应的统计: 流式调用比较首token延迟, 非流式调用比较总耗时);
+    没有满足档位的模型时退回能力最强的可用模型。
+    """
+
+    def __init__(
+        self,
+        routes: list[ModelRoute],
+        long_prompt_tokens: int = 4000,
+        cost_weight: float = 100.0,
+        latency_weight: float = 1.0,
+        error_weight: float = 10.0,
+        max_error_rate: float = 0.5,
+        ewma_alpha: float = 0.2,
+        counter: Optional[TokenCounter] = None,
+    ):
+        """
+        Args:
+            routes: 候选模型
+            long_prompt_tokens: 未给难度提示时, 提示词token数达到该值即按hard路由
+            cost_weight: 预估成本(按价格表计的金额)的权重
+            latency_weight: 延迟秒数的权重
+            error_weight: 错误率(0~1)的权重
+            max_error_rate: 错误率超过该值的模型暂不参与路由(全部超过时忽略此限制)
+            ewma_alpha: 延迟与错误率滑动平均的平滑系数
+            counter: token计数器, 默认使用启发式估算
+        """
+        if not routes:
+            raise ValueError("ModelRouter至少需要一个ModelRoute")
+        self.routes = sorted(routes, key=lambda route: route.tier)
+        self.long_prompt_tokens = long_prompt_tokens
+        self.cost_weight = cost_weight
+        self.latency_weight = latency_weight
+        self.error_weight = error_weight
+        self.max_error_rate = max_error_rate
+        self.ewma_alpha = ewma_alpha
+        self.counter = counter or TokenCounter()
+        self.last_route: Optional[ModelRoute] = None
+
+    # 让Agent等调用方把路由器当作单个LLM使用
+    @property
+    def default(self) -> "AgentsLLM":
+        return (self.last_route or self.routes[-1]).llm
+
+    @property
+    def provider(self) -> str:
+        return self.default.provider
+
+    @property
+    def model(self) -> str:
+        return self.default.model
+
+    @property
+    def sink(self):
+        return self.default.sink
+
+    @property
+    def usage_tracker(self):
+        return self.default.usage_tracker
+
+    @property
+    def last_usage(self) -> Optional[Usage]:
+        return self.default.last_usage
+
+    @property
+    def last_response(self):
+        return self.default.last_response
+
+    @property
+    def supports_native_tools(self) -> bool:
+        return all(getattr(route.llm, "supports_native_tools", False) for route in self.routes)
+
+    def _required_tier(self, difficulty: Difficulty, prompt_tokens: int) -> int:
+        if difficulty is None:
+            return DIFFICULTY_TIERS["hard"] if prompt_tokens >= self.long_prompt_tokens else DIFFICULTY_TIERS["easy"]
+        if isinstance(difficulty, int):
+            return difficulty
+        if difficulty not in DIFFICULTY_TIERS:
+            raise ValueError(f"未知的难度提示: {difficulty}, 可选 {list(DIFFICULTY_TIERS)} 或整数档位")
+        return DIFFICULTY_TIERS[difficulty]
+
+    def _score(self, route: ModelRoute, prompt_tokens: int, stream: bool = False) -> float:
+        latency = route.latency(stream) or 0.0
+        return (
+            self.cost_weight * route.estimated_cost(prompt_tokens)
+            + self.latency_weight * latency
+            + self.error_weight * route.ewma_error
+        )
+
+    def select(self, messages: list[dict], difficulty: Difficulty = None, stream: bool = False) -> ModelRoute:
+        """为一组消息选择模型, stream表示流式调用(按首token延迟比较)"""
+        prompt_tokens = self.counter.count_messages(messages)
+        tier = self._required_tier(difficulty, prompt_tokens)
+        fits = [route for route in self.routes if route.max_prompt_tokens >= prompt_tokens]
+        if not fits:
+            raise LLMException(f"提示词约{prompt_tokens}个token, 超出所有候选模型的上下文长度")
+        healthy = [route for route in fits if route.available and route.ewma_error <= self.max_error_rate]
+        pool = healthy or [route for route in fits if route.available] or fits
+        capable = [route for route in pool if route.tier >= tier]
+        if not capable:
+            return max(pool, key=lambda route: route.tier)
+        return min(capable, key=lambda route: (self._score(route, prompt_tokens, stream), route.tier))
+
+    def _route(self, messages: list[dict], difficulty: Difficulty, stream: bool = False) -> ModelRoute:
+        route = self.select(messages, difficulty, stream)
+        self.last_route = route
+        return route
+
+    def stats(self) -> list[dict]:
+        return [
+            {"name": route.name, "tier": route.tier, "requests": route.requests,
+             "ewma_latency": route.ewma_latency, "ewma_ttft": route.ewma_ttft, "ewma_error": round(route.ewma_error, 4),
+             "available": route.available}
+            for route in self.routes
+        ]
+
+    def invoke(self, messages: list[dict[str, str]], difficulty: Difficulty = None, **kwargs):
+        """非流式调用, difficulty为难度提示, 其余参数透传给选中模型的invoke"""
+        route = self._route(messages, difficulty)
+        start = time.monotonic()
+        try:
+            result = route.llm.invoke(messages, **kwargs)
+        except Exception:
+            route.record(None, True, self.ewma_alpha)
+            raise
+        route.record(time.monotonic() - start, False, self.ewma_alpha)
+        return result
+
+    async def ainvoke(self, messages: list[dict[str, str]], difficulty: Difficulty = None, **kwargs):
+        """invoke的异步版本"""
+        route = self._route(messages, difficulty)
+        start = time.monotonic()
+        try:
+            result = await route.llm.ainvoke(messages, **kwargs)
+        except Exception:
+            route.record(None, True, self.ewma_alpha)
+            raise
+        route.record(time.monotonic() - start, False, self.ewma_alpha)
+        return result
+
+    def _track_stream(self, route: ModelRoute, stream: Iterator) -> Iterator:
+        """流式调用按首个片段的延迟计入首token统计, 中途出错计为失败"""
+        start = time.monotonic()
+        first = None
+        try:
+            for item in stream:
+                if first is None:
+                    first = time.monotonic() - start
+                yield item
+        except Exception:
+            route.record(None, True, self.ewma_alpha, stream=True)
+            raise
+        route.record(first if first is not None else time.monotonic() - start, False, self.ewma_alpha, stream=True)
+
+    async def _atrack_stream(self, route: ModelRoute, stream: AsyncIterator) -> AsyncIterator:
+        """_track_stream的异步版本"""
+        start = time.monotonic()
+        first = None
+        try:
+            async for item in stream:
+                if first is None:
+                    first = time.monotonic() - start
+                yield item
+        except Exception:
+            route.record(None, True, self.ewma_alpha, stream=True)
+            raise
+        route.record(first if first is not None else time.monotonic() - start, False, self.ewma_alpha, stream=True)
+
+    def think(self, messages: list[dict[str, str]], temperature: Optional[float] = None,
+              difficulty: Difficulty = None, **kwargs) -> Iterator[str]:
+        """流式调用, 参数同AgentsLLM.think, 另加difficulty难度提示"""
+        route = self._route(messages, difficulty, stream=True)
+        return self._track_stream(route, route.llm.think(messages, temperature, **kwargs))
+
+    def athink(self, messages: list[dict[str, str]], temperature: Optional[float] = None,
+               difficulty: Difficulty = None, **kwargs) -> AsyncIterator[str]:
+        """think的异步版本"""
+        route = self._route(messages, difficulty, stream=True)
+        return self._atrack_stream(route, route.llm.athink(messages, temperature, **kwargs))
+
+    def stream_invoke(self, messages: list[dict[str, str]], difficulty: Difficulty = None, **kwargs) -> Iterator[str]:
+        route = self._route(messages, difficulty, stream=True)
+        return self._track_stream(route, route.llm.stream_invoke(messages, **kwargs))
+
+    def astream_invoke(self, messages: list[dict[str, str]], difficulty: Difficulty = None, **kwargs) -> AsyncIterator[str]:
+        route = self._route(messages, difficulty, stream=True)
+        return self._atrack_stream(route, route.llm.astream_invoke(messages, **kwargs))
+
+    def think_events(self, messages: list[dict[str, str]], difficulty: Difficulty = None, **kwargs) -> Iterator[StreamEvent]:
+        route = self._route(messages, difficulty, stream=True)
+        return self._track_stream(route, route.llm.think_events(messages, **kwargs))
+
+    def athink_events(self, messages: list[dict[str, str]], difficulty: Difficulty = None, **kwargs) -> AsyncIterator[StreamEvent]:
+        route = self._route(messages, difficulty, stream=True)
+        return self._atrack_stream(route, route.llm.athink_events(messages, **kwargs))
+
+    def __repr__(self) -> str:
+        return f"ModelRouter(routes={[route.name for route in self.routes]})"
@@ -0,0 +1,137 @@
+"""运行上下文: 记录当前调用链所属的Agent、运行ID与截止时间, 供用量统计、超时控制等横切功能读取"""
+
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from .exceptions import DeadlineExceeded
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RunContext:
+    """一次Agent运行的上下文信息"""
+
+    agent: Optional[str] = None  # Agent名称
+    agent_type: Optional[str] = None  # Agent类名
+    agent_id: Optional[str] = None  # Agent实例的唯一ID, 用于识别嵌套调用与按实例统计用量
+    run_id: Optional[str] = None
+    deadline: Optional[float] = None  # 截止时刻(time.monotonic()), None表示不限时
+    priority: Optional[str] = None  # 调度优先级通道(interactive/batch)
+    tenant: Optional[str] = None  # 租户, 调度器按租户限制在途请求数
+
+
+_current_run: contextvars.ContextVar[RunContext] = contextvars.ContextVar("agents_run_context", default=RunContext())
+
+
+def current_run() -> RunContext:
+    """返回当前调用链所在的运行上下文"""
+    return _current_run.get()
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def run_scope(**fields) -> Iterator[RunContext]:
+    """
+    在当前上下文基础上覆盖部分字段, 退出时恢复。
+    contextvars会随asyncio任务自动传递; 线程池中需要用contextvars.copy_context()显式传递。
+
+    Args:
+        **fields: RunContext的字段, 值为None的字段不覆盖
+    """
+    context = replace(current_run(), **{k: v for k, v in fields.items() if v is not None})
+    token = _current_run.set(context)
+    try:
+        yield context
+    finally:
+        _current_run.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """当前运行距截止时间的剩余秒数(可能为负), 未设置截止时间时返回None"""
+    expires = _current_run.get().deadline
+    return None if expires is None else expires - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[RunContext]:
+    """
+    为当前调用链设置截止时间, 其中的每次LLM调用、工具调用与重试都以剩余时间为上限。
+    嵌套时只会收紧不会放宽: 内层的截止时间取自身与外层中较早的一个。
+
+    Args:
+        seconds: 从现在起的时间预算, None表示沿用外层设置
+    """
+    if seconds is None:
+        yield current_run()
+        return
+    expires = time.monotonic() + seconds
+    outer = current_run().deadline
+    if outer is not None:
+        expires = min(expires, outer)
+    with run_scope(deadline=expires) as context:
+        yield context
+
+
+@contextmanager
+def without_deadline() -> Iterator[RunContext]:
+    """
+    在保留其余运行信息(Agent、运行ID等)的同时取消截止时间,
+    用于多个调用方共享的后台工作: 它不应因为其中某一个调用方的截止时间而失败, 各调用方自行限制等待时间。
+    """
+    token = _current_run.set(replace(current_run(), deadline=None))
+    try:
+        yield current_run()
+    finally:
+        _current_run.reset(token)
+
+
+def check_deadline(partial: Optional[str] = None) -> None:
+    """截止时间已到时抛出DeadlineExceeded"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"运行已超过截止时间({-left:.2f}秒)", partial=partial)
+
+
+def bounded_timeout(timeout: Optional[float]) -> Optional[float]:
+    """把单次调用的超时收紧到运行的剩余时间; 时间已用完时抛出DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return timeout
+    check_deadline()
+    return left if timeout is None else min(timeout, left)
+
+
+def call_with_deadline(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在剩余时间内执行一个同步调用(如工具), 超时抛出DeadlineExceeded。
+    未设置截止时间时直接调用; 否则在后台线程中执行, 超时后该线程无法被强行终止, 其结果会被丢弃。
+    """
+    left = remaining()
+    if left is None:
+        return fn(*args, **kwargs)
+    check_deadline()
+    outcome: dict[str, Any] = {}
+
+    def target() -> None:
+        try:
+            outcome["result"] = fn(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+    worker.start()
+    worker.join(left)
+    if worker.is_alive():
+        raise DeadlineExceeded(f"{getattr(fn, '__name__', '调用')} 未能在剩余的{left:.2f}秒内完成")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
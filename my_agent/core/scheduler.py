@@ -0,0 +1,223 @@
+"""优先级调度: 在LLM客户端前按优先级通道做加权公平排队(WFQ), 并限制每个租户的在途请求数"""
+
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from .exceptions import DeadlineExceeded
+from .metrics import MetricsRegistry, REGISTRY
+from .runtime import current_run
+
+REGISTRY.describe("llm_scheduler_queue_depth", "gauge", "调度器中各通道排队等待的请求数")
+REGISTRY.describe("llm_scheduler_wait_seconds", "histogram", "请求在调度器中的排队时间")
+
+# 默认通道及权重: 交互请求与批量请求同时排队时, 按token计交互通道获得约8倍的份额
+DEFAULT_LANES = {"interactive": 8.0, "batch": 1.0}
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class _Ticket:
+    """一个排队中的请求"""
+
+    lane: str
+    tenant: str
+    cost: float
+    start_tag: float
+    finish_tag: float
+    seq: int
+    enqueued: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    wake: Optional[Callable[[], None]] = None  # 异步等待者被放行时的回调
+
+
+class PriorityScheduler:
+    """
+    加权公平排队调度器。
+
+    每个通道维护自己的虚拟完成时间, 请求入队时的完成标签为
+    max(全局虚拟时间, 通道上次完成标签) + cost/权重, 有空闲名额时放行标签最小的请求。
+    新到的交互请求标签从当前虚拟时间算起, 会排在已经积压的批量请求前面, 但批量通道仍按权重获得份额不会被饿死。
+    租户达到在途上限时, 其请求暂不参与选择, 让给其他租户。
+    """
+
+    def __init__(
+        self,
+        capacity: int = 32,
+        lanes: Optional[dict[str, float]] = None,
+        tenant_limits: Optional[dict[str, int]] = None,
+        default_tenant_limit: Optional[int] = None,
+        name: str = "default",
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            capacity: 同时放行的最大请求数
+            lanes: 通道名到权重的映射, 默认interactive=8, batch=1
+            tenant_limits: 各租户的在途请求上限
+            default_tenant_limit: 未单独配置的租户的在途上限, None表示不限
+            name: 调度器名称, 用作指标标签
+            metrics: 指标注册表, 默认使用进程级的REGISTRY
+        """
+        self.capacity = capacity
+        self.lanes = dict(lanes or DEFAULT_LANES)
+        self.tenant_limits = dict(tenant_limits or {})
+        self.default_tenant_limit = default_tenant_limit
+        self.name = name
+        self.metrics = metrics or REGISTRY
+        self.inflight = 0
+        self._tenant_inflight: dict[str, int] = {}
+        self._lane_finish: dict[str, float] = {lane: 0.0 for lane in self.lanes}
+        self._virtual_time = 0.0
+        self._waiting: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        with self._cond:
+            return sum(1 for ticket in self._waiting if lane is None or ticket.lane == lane)
+
+    def _tenant_limit(self, tenant: str) -> Optional[int]:
+        return self.tenant_limits.get(tenant, self.default_tenant_limit)
+
+    def _enqueue(self, priority: Optional[str], tenant: Optional[str], cost: float) -> _Ticket:
+        """持锁调用。未指定的优先级与租户取自当前运行上下文"""
+        run = current_run()
+        lane = priority or run.priority or "interactive"
+        if lane not in self.lanes:
+            raise ValueError(f"未知的优先级通道: {lane}, 可选 {list(self.lanes)}")
+        tenant = tenant or run.tenant or DEFAULT_TENANT
+        start = max(self._virtual_time, self._lane_finish[lane])
+        finish = start + max(cost, 1.0) / self.lanes[lane]
+        self._lane_finish[lane] = finish
+        ticket = _Ticket(lane, tenant, cost, start, finish, next(self._seq))
+        self._waiting.append(ticket)
+        self._publish(lane)
+        return ticket
+
+    def _publish(self, lane: str) -> None:
+        depth = sum(1 for ticket in self._waiting if ticket.lane == lane)
+        self.metrics.set("llm_scheduler_queue_depth", depth, scheduler=self.name, lane=lane)
+
+    def _dispatch(self) -> None:
+        """持锁调用。按完成标签依次放行, 直到名额用完或剩下的请求所属租户都已达上限"""
+        while self.inflight < self.capacity and self._waiting:
+            eligible = [
+                ticket for ticket in self._waiting
+                if self._tenant_limit(ticket.tenant) is None
+                or self._tenant_inflight.get(ticket.tenant, 0) < self._tenant_limit(ticket.tenant)
+            ]
+            if not eligible:
+                break
+            ticket = min(eligible, key=lambda t: (t.finish_tag, t.seq))
+            self._waiting.remove(ticket)
+            ticket.granted = True
+            self.inflight += 1
+            self._tenant_inflight[ticket.tenant] = self._tenant_inflight.get(ticket.tenant, 0) + 1
+            self._virtual_time = max(self._virtual_time, ticket.start_tag)
+            self._publish(ticket.lane)
+            self.metrics.observe("llm_scheduler_wait_seconds", time.monotonic() - ticket.enqueued,
+                                 scheduler=self.name, lane=ticket.lane)
+            if ticket.wake is not None:
+                ticket.wake()
+        self._cond.notify_all()
+
+    def _abandon(self, ticket: _Ticket) -> None:
+        """持锁调用。等待被中断时离开队列; 已经放行的则归还名额"""
+        if ticket.granted:
+            self._release(ticket)
+        elif ticket in self._waiting:
+            self._waiting.remove(ticket)
+            self._publish(ticket.lane)
+            self._dispatch()
+
+    def _release(self, ticket: _Ticket) -> None:
+        self.inflight -= 1
+        self._tenant_inflight[ticket.tenant] -= 1
+        self._dispatch()
+
+    def acquire(
+        self,
+        priority: Optional[str] = None,
+        tenant: Optional[str] = None,
+        cost: float = 1.0,
+        timeout: Optional[float] = None,
+    ) -> _Ticket:
+        """
+        排队直到被放行, 返回的凭据需要交给release归还。
+
+        Args:
+            priority: 优先级通道, 默认取运行上下文中的priority, 都没有时为interactive
+            tenant: 租户, 默认取运行上下文中的tenant
+            cost: 请求代价(如预估token数), 决定占用多少份额
+            timeout: 最长排队秒数, 超时抛出DeadlineExceeded
+        """
+        with self._cond:
+            ticket = self._enqueue(priority, tenant, cost)
+            self._dispatch()
+            try:
+                if not self._cond.wait_for(lambda: ticket.granted, timeout):
+                    raise DeadlineExceeded(f"请求在调度器{self.name}中排队超过{timeout:.2f}秒")
+            except BaseException:
+                self._abandon(ticket)
+                raise
+        return ticket
+
+    async def aacquire(
+        self,
+        priority: Optional[str] = None,
+        tenant: Optional[str] = None,
+        cost: float = 1.0,
+        timeout: Optional[float] = None,
+    ) -> _Ticket:
+        """acquire的异步版本, 放行时由调度器唤醒等待的协程"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._cond:
+            ticket = self._enqueue(priority, tenant, cost)
+            ticket.wake = wake
+            self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except asyncio.TimeoutError:
+            with self._cond:
+                self._abandon(ticket)
+            raise DeadlineExceeded(f"请求在调度器{self.name}中排队超过{timeout:.2f}秒") from None
+        except BaseException:
+            with self._cond:
+                self._abandon(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        """归还名额并放行下一个请求"""
+        with self._cond:
+            self._release(ticket)
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, tenant: Optional[str] = None,
+             cost: float = 1.0, timeout: Optional[float] = None) -> Iterator[_Ticket]:
+        """在with块内占用一个名额"""
+        ticket = self.acquire(priority, tenant, cost, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, priority: Optional[str] = None, tenant: Optional[str] = None,
+                    cost: float = 1.0, timeout: Optional[float] = None) -> AsyncIterator[_Ticket]:
+        """slot的异步版本"""
+        ticket = await self.aacquire(priority, tenant, cost, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
@@ -0,0 +1,246 @@
+"""请求合并(singleflight): 相同请求同时在途时只向上游发送一次, 其余调用方共享结果"""
+
+import asyncio
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional
+
+
+class _Call:
+    """一次非流式共享调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class _Broadcast:
+    """
+    一次流式共享调用。生产者线程把上游chunk写入缓冲区, 每个订阅者按自己的节奏从头读取;
+    所有订阅者都提前退出时生产者停止读取并关闭上游流。
+    """
+
+    def __init__(self):
+        self.items: list[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """线程版请求合并组"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _Broadcast] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        执行fn, 若相同key的调用正在进行则等待并共享其结果。
+
+        Returns:
+            (结果, 是否为实际发起请求的领头调用)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, True
+
+    def stream(self, key: str, fn: Callable[[], Iterable[Any]]) -> tuple[Iterator[Any], bool]:
+        """
+        订阅一个共享的流。首个订阅者触发上游请求, 之后加入的订阅者先回放已收到的元素再继续等待新元素。
+
+        Returns:
+            (元素迭代器, 是否为领头订阅者)
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast()
+            with broadcast.cond:
+                broadcast.subscribers += 1
+        if leader:
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run, args=(self._produce, key, broadcast, fn),
+                name="llm-singleflight", daemon=True,
+            ).start()
+        return self._subscribe(broadcast), leader
+
+    def _produce(self, key: str, broadcast: _Broadcast, fn: Callable[[], Iterable[Any]]) -> None:
+        source = None
+        try:
+            source = fn()
+            for item in source:
+                with broadcast.cond:
+                    abandoned = broadcast.subscribers == 0
+                if abandoned and self._abandon(key, broadcast):
+                    break
+                with broadcast.cond:
+                    broadcast.items.append(item)
+                    broadcast.cond.notify_all()
+        except BaseException as e:
+            broadcast.error = e
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+            with broadcast.cond:
+                broadcast.finished = True
+                broadcast.cond.notify_all()
+
+    def _abandon(self, key: str, broadcast: _Broadcast) -> bool:
+        """
+        所有订阅者都已退出时先把流从注册表中摘除, 再由生产者关闭上游:
+        否则关闭期间到达的相同请求会加入这个被截断的流, 拿到一份看似完整的部分结果。
+        摘除前又有订阅者加入时返回False, 生产者继续读取。
+        """
+        with self._lock, broadcast.cond:
+            if broadcast.subscribers:
+                return False
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            return True
+
+    def _subscribe(self, broadcast: _Broadcast) -> Iterator[Any]:
+        position = 0
+        try:
+            while True:
+                with broadcast.cond:
+                    while position >= len(broadcast.items) and not broadcast.finished:
+                        broadcast.cond.wait()
+                    pending = broadcast.items[position:]
+                    finished = broadcast.finished
+                position += len(pending)
+                yield from pending
+                if finished and position >= len(broadcast.items):
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+        finally:
+            with broadcast.cond:
+                broadcast.subscribers -= 1
+
+
+class AsyncSingleFlight:
+    """asyncio版请求合并组, 每个事件循环各自合并"""
+
+    def __init__(self):
+        self._calls: dict[tuple[int, str], asyncio.Future] = {}
+        self._streams: dict[tuple[int, str], dict[str, Any]] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """SingleFlight.do的异步版本"""
+        loop = asyncio.get_running_loop()
+        full_key = (id(loop), key)
+        future = self._calls.get(full_key)
+        if future is not None:
+            # shield: 跟随者被取消不应影响领头请求
+            return await asyncio.shield(future), False
+        future = self._calls[full_key] = loop.create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # 没有跟随者时避免"exception never retrieved"警告
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            self._calls.pop(full_key, None)
+
+    def stream(self, key: str, fn: Callable[[], AsyncIterator[Any]]) -> tuple[AsyncIterator[Any], bool]:
+        """SingleFlight.stream的异步版本, 生产者为当前事件循环上的任务"""
+        loop = asyncio.get_running_loop()
+        full_key = (id(loop), key)
+        state = self._streams.get(full_key)
+        leader = state is None
+        if leader:
+            state = self._streams[full_key] = {
+                "items": [], "finished": False, "error": None,
+                "subscribers": 0, "cond": asyncio.Condition(),
+            }
+            state["task"] = loop.create_task(self._produce(full_key, state, fn))
+        state["subscribers"] += 1
+        return self._subscribe(state), leader
+
+    async def _produce(self, full_key, state: dict, fn: Callable[[], AsyncIterator[Any]]) -> None:
+        cond = state["cond"]
+        source = None
+        try:
+            source = await fn()
+            async for item in source:
+                if state["subscribers"] == 0:
+                    # 与SingleFlight._abandon相同: 关闭上游(需要await)之前先摘除, 期间到达的相同请求重新发起
+                    if self._streams.get(full_key) is state:
+                        del self._streams[full_key]
+                    break
+                async with cond:
+                    state["items"].append(item)
+                    cond.notify_all()
+        except BaseException as e:
+            state["error"] = e
+        finally:
+            close = getattr(source, "aclose", None) or getattr(source, "close", None)
+            if close is not None:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            if self._streams.get(full_key) is state:
+                del self._streams[full_key]
+            async with cond:
+                state["finished"] = True
+                cond.notify_all()
+
+    async def _subscribe(self, state: dict) -> AsyncIterator[Any]:
+        cond = state["cond"]
+        position = 0
+        try:
+            while True:
+                async with cond:
+                    await cond.wait_for(lambda: position < len(state["items"]) or state["finished"])
+                    pending = state["items"][position:]
+                    finished = state["finished"]
+                position += len(pending)
+                for item in pending:
+                    yield item
+                if finished and position >= len(state["items"]):
+                    if state["error"] is not None:
+                        raise state["error"]
+                    return
+        finally:
+            state["subscribers"] -= 1
+
+
+# 进程级默认合并组, 所有开启coalesce的AgentsLLM共享
+default_flight = SingleFlight()
+default_async_flight = AsyncSingleFlight()
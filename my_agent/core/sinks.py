@@ -0,0 +1,191 @@
+"""流式输出的去向: 空输出、带合并缓冲的标准输出、线程队列与asyncio队列; 以及库内部诊断信息的去向"""
+
+import sys
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, TextIO
+
+
+class StreamSink:
+    """
+    流式输出接口。write接收模型输出的文本片段, info接收状态提示,
+    end在一次响应结束时调用。默认实现什么都不做。
+    """
+
+    def write(self, text: str) -> None:
+        pass
+
+    def info(self, text: str) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+class NullSink(StreamSink):
+    """丢弃所有输出, 适用于服务端模式"""
+    pass
+
+
+class StdoutSink(StreamSink):
+    """
+    写到标准输出, 把相邻的小片段合并后再写, 避免每个token一次系统调用。
+    缓冲超过buffer_size个字符或距上次写出超过flush_interval秒时才真正写出。
+    """
+
+    def __init__(self, buffer_size: int = 64, flush_interval: float = 0.05, stream: Optional[TextIO] = None):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.stream = stream
+        self._buffer: list[str] = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def _out(self) -> TextIO:
+        # 每次取sys.stdout, 兼容运行期间被重定向的情况
+        return self.stream or sys.stdout
+
+    def write(self, text: str) -> None:
+        with self._lock:
+            self._buffer.append(text)
+            self._pending += len(text)
+            if self._pending >= self.buffer_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._buffer:
+            self._out.write("".join(self._buffer))
+            self._buffer.clear()
+            self._pending = 0
+        self._out.flush()
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def info(self, text: str) -> None:
+        with self._lock:
+            self._buffer.append(text + "\n")
+            self._flush_locked()
+
+    def end(self) -> None:
+        with self._lock:
+            self._buffer.append("\n")
+            self._flush_locked()
+
+
+class QueueSink(StreamSink):
+    """把文本片段放入线程安全队列, 响应结束时放入None作为结束标记"""
+
+    def __init__(self, target: Optional[queue.Queue] = None):
+        self.queue = target if target is not None else queue.Queue()
+
+    def write(self, text: str) -> None:
+        self.queue.put(text)
+
+    def end(self) -> None:
+        self.queue.put(None)
+
+
+class AsyncQueueSink(StreamSink):
+    """
+    把文本片段放入asyncio.Queue, 可以从任意线程写入(通过所属事件循环转交)。
+    响应结束时放入None作为结束标记。
+    未指定事件循环时绑定创建时正在运行的循环, 在循环外创建的(如由Config创建)绑定首次写入时所在的循环。
+    """
+
+    def __init__(self, target: Optional[asyncio.Queue] = None, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.queue = target if target is not None else asyncio.Queue()
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        self.loop = loop
+
+    def _put(self, item: Optional[str]) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self.loop is None:
+            if running is None:
+                raise RuntimeError("AsyncQueueSink尚未绑定事件循环, 请在协程中使用或创建时传入loop")
+            self.loop = running
+        if running is self.loop:
+            self.queue.put_nowait(item)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def write(self, text: str) -> None:
+        self._put(text)
+
+    def end(self) -> None:
+        self._put(None)
+
+
+SINKS = {
+    "null": NullSink,
+    "stdout": StdoutSink,
+    "queue": QueueSink,
+    "async_queue": AsyncQueueSink,
+}
+
+
+def make_sink(name: str = "stdout", **kwargs: Any) -> StreamSink:
+    """
+    按名称创建sink。
+
+    Args:
+        name: null / stdout / queue / async_queue
+        **kwargs: 传给对应sink构造函数的参数
+    """
+    try:
+        return SINKS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"未知的输出方式: {name}, 可选: {list(SINKS)}") from None
+
+
+def sink_from_config(config) -> StreamSink:
+    """根据Config中的stream_sink与stream_buffer_size创建sink"""
+    if config.stream_sink == "stdout":
+        return StdoutSink(buffer_size=config.stream_buffer_size)
+    return make_sink(config.stream_sink)
+
+
+# 库内部的诊断信息(重试、故障转移、对冲、上下文裁剪等)写到当前调用所属AgentsLLM的sink;
+# 不在任何LLM调用之内时写到进程级的诊断sink, 默认为标准错误, 不与模型输出混在一起
+_diagnostic_sink: contextvars.ContextVar[Optional[StreamSink]] = contextvars.ContextVar("llm_diagnostic_sink", default=None)
+_default_diagnostic_sink: Optional[StreamSink] = None
+
+
+def set_diagnostic_sink(sink: Optional[StreamSink]) -> None:
+    """设置进程级的诊断信息去向, None表示标准错误"""
+    global _default_diagnostic_sink
+    _default_diagnostic_sink = sink
+
+
+@contextmanager
+def diagnostics_to(sink: StreamSink) -> Iterator[StreamSink]:
+    """在with块内把诊断信息写到指定sink(AgentsLLM在发起请求时使用自己的sink)"""
+    token = _diagnostic_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _diagnostic_sink.reset(token)
+
+
+def diagnostic(text: str) -> None:
+    """输出一条诊断信息"""
+    sink = _diagnostic_sink.get() or _default_diagnostic_sink
+    if sink is None:
+        print(text, file=sys.stderr)
+    else:
+        sink.info(text)
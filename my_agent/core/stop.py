@@ -0,0 +1,96 @@
+"""客户端停止序列: 在流式文本中匹配停止模式, 命中后截断输出并提前结束流(兼容忽略stop参数的服务)"""
+
+from typing import Iterable, Optional, Union
+
+from .events import StreamEvent, ContentEvent, FinishEvent
+from .metrics import REGISTRY
+from .rate_limit import DEFAULT_COMPLETION_ESTIMATE
+
+REGISTRY.describe("llm_stop_early_total", "counter", "客户端命中停止序列并提前关闭的流式响应数")
+REGISTRY.describe("llm_stop_tokens_saved_total", "counter",
+                  "因提前关闭流而省下的补全token数(按max_tokens余量估算, 未设置max_tokens时按DEFAULT_COMPLETION_ESTIMATE)")
+REGISTRY.describe("llm_stop_chars_discarded_total", "counter", "命中停止序列时丢弃的已收到字符数(含停止序列本身)")
+
+
+def normalize_stop(stop: Union[str, Iterable[str], None]) -> list[str]:
+    """把stop参数(字符串或列表)规整为非空模式列表"""
+    if not stop:
+        return []
+    if isinstance(stop, str):
+        return [stop]
+    return [pattern for pattern in stop if pattern]
+
+
+class StopMatcher:
+    """
+    增量匹配停止模式。停止模式可能被拆在相邻的两个片段里, 因此文本末尾可能是某个模式前缀的部分
+    先扣留不输出, 等下一个片段到达后再判断; 流正常结束时由flush()放出。
+    """
+
+    def __init__(self, patterns: Union[str, Iterable[str]]):
+        self.patterns = normalize_stop(patterns)
+        self.stopped = False
+        self.chunks = 0  # 已收到的文本片段数, 近似已生成的token数
+        self.discarded = 0  # 命中时丢弃的已收到字符数(停止序列及其后的文本)
+        self._held = ""
+
+    def _hold_length(self, text: str) -> int:
+        """text末尾能作为某个模式前缀的最长长度"""
+        longest = 0
+        for pattern in self.patterns:
+            for size in range(min(len(pattern) - 1, len(text)), longest, -1):
+                if text.endswith(pattern[:size]):
+                    longest = size
+                    break
+        return longest
+
+    def feed(self, text: str) -> str:
+        """送入一个文本片段, 返回可以安全输出的部分; 命中模式时返回模式之前的文本并置stopped"""
+        if self.stopped:
+            return ""
+        self.chunks += 1
+        buffer = self._held + text
+        hits = [index for index in (buffer.find(pattern) for pattern in self.patterns) if index >= 0]
+        if hits:
+            self.stopped = True
+            self._held = ""
+            self.discarded = len(buffer) - min(hits)
+            return buffer[:min(hits)]
+        hold = self._hold_length(buffer)
+        self._held = buffer[len(buffer) - hold:] if hold else ""
+        return buffer[:len(buffer) - hold]
+
+    def flush(self) -> str:
+        """流结束时放出扣留的文本"""
+        held, self._held = self._held, ""
+        return held
+
+    def filter(self, events: Iterable[StreamEvent]) -> list[StreamEvent]:
+        """
+        过滤一个chunk产生的事件。命中停止模式后丢弃之后的所有事件并追加FinishEvent("stop");
+        遇到非文本事件(如结束原因)前先放出扣留的文本, 保证顺序不变。
+        """
+        output: list[StreamEvent] = []
+        for event in events:
+            if isinstance(event, ContentEvent):
+                text = self.feed(event.text)
+                if text:
+                    output.append(ContentEvent(text))
+                if self.stopped:
+                    output.append(FinishEvent("stop"))
+                    break
+                continue
+            held = self.flush()
+            if held:
+                output.append(ContentEvent(held))
+            output.append(event)
+        return output
+
+    def tokens_saved(self, max_tokens: Optional[int]) -> int:
+        """
+        提前停止省下的token数估算: 输出上限减去已生成的部分。
+        未设置max_tokens时以DEFAULT_COMPLETION_ESTIMATE(限流器预估单次输出用的同一个值)作为上限。
+        """
+        if not self.stopped:
+            return 0
+        return max(0, (max_tokens or DEFAULT_COMPLETION_ESTIMATE) - self.chunks)
@@ -0,0 +1,160 @@
+"""原生函数/工具调用: 工具schema构造、结构化的工具调用结果与流式增量拼接"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from .events import ToolCallDeltaEvent
+from .exceptions import LLMException
+
+# hello_agents等框架中ToolParameter.type到JSON Schema类型的映射
+_JSON_TYPES = {
+    "str": "string", "string": "string",
+    "int": "integer", "integer": "integer",
+    "float": "number", "number": "number",
+    "bool": "boolean", "boolean": "boolean",
+    "list": "array", "array": "array",
+    "dict": "object", "object": "object",
+}
+
+
+@dataclass
+class ToolCall:
+    """模型发起的一次工具调用, arguments为模型生成的JSON字符串"""
+
+    id: str
+    name: str
+    arguments: str = "{}"
+
+    @property
+    def args(self) -> dict[str, Any]:
+        """解析后的参数字典"""
+        if not self.arguments or not self.arguments.strip():
+            return {}
+        try:
+            parsed = json.loads(self.arguments)
+        except json.JSONDecodeError as e:
+            raise LLMException(f"工具 {self.name} 的参数不是合法的JSON: {self.arguments!r}") from e
+        return parsed if isinstance(parsed, dict) else {"input": parsed}
+
+    def to_dict(self) -> dict[str, Any]:
+        """转换为assistant消息中tool_calls的元素格式"""
+        return {"id": self.id, "type": "function", "function": {"name": self.name, "arguments": self.arguments}}
+
+
+@dataclass
+class ChatResponse:
+    """
+    带工具调用的响应。模型可能只回复文本、只发起工具调用(可能是多个并行调用),
+    或两者都有; finish_reason为tool_calls时表示需要执行工具后再继续对话。
+    """
+
+    content: Optional[str] = None
+    tool_calls: list[ToolCall] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+
+    @property
+    def has_tool_calls(self) -> bool:
+        return bool(self.tool_calls)
+
+    def to_message(self) -> dict[str, Any]:
+        """转换为追加到对话历史的assistant消息"""
+        message: dict[str, Any] = {"role": "assistant", "content": self.content}
+        if self.tool_calls:
+            message["tool_calls"] = [call.to_dict() for call in self.tool_calls]
+        return message
+
+    def __str__(self) -> str:
+        return self.content or ""
+
+
+def tool_result_message(call: ToolCall, result: Any) -> dict[str, Any]:
+    """把工具执行结果包装为回传给模型的tool消息"""
+    content = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    return {"role": "tool", "tool_call_id": call.id, "content": content}
+
+
+def function_tool(name: str, description: str = "", parameters: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+    """
+    构造chat.completions的工具定义。
+
+    Args:
+        name: 工具名
+        description: 工具说明, 模型据此决定何时调用
+        parameters: 参数的JSON Schema, 默认无参数
+    """
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": parameters or {"type": "object", "properties": {}},
+        },
+    }
+
+
+def tools_from_registry(registry) -> list[dict[str, Any]]:
+    """
+    把工具注册表(hello_agents.ToolRegistry或同接口对象)转换为工具定义列表。
+    带get_parameters()的工具按参数列表生成schema; 只注册了函数的工具接收一个字符串参数input。
+    """
+    tools = []
+    functions = getattr(registry, "_functions", None) or {}
+    for name in registry.list_tools():
+        tool = registry.get_tool(name)
+        if tool is None:
+            description = (functions.get(name) or {}).get("description", "")
+            tools.append(function_tool(name, description, {
+                "type": "object",
+                "properties": {"input": {"type": "string", "description": "工具输入"}},
+                "required": ["input"],
+            }))
+            continue
+        properties: dict[str, Any] = {}
+        required = []
+        get_parameters = getattr(tool, "get_parameters", None)
+        for param in (get_parameters() if get_parameters else []):
+            schema = {"type": _JSON_TYPES.get(str(param.type).lower(), "string"), "description": param.description or ""}
+            if getattr(param, "default", None) is not None:
+                schema["default"] = param.default
+            properties[param.name] = schema
+            if getattr(param, "required", True):
+                required.append(param.name)
+        parameters: dict[str, Any] = {"type": "object", "properties": properties}
+        if required:
+            parameters["required"] = required
+        tools.append(function_tool(name, getattr(tool, "description", ""), parameters))
+    return tools
+
+
+def response_from_completion(response) -> ChatResponse:
+    """从非流式ChatCompletion中取出文本与工具调用"""
+    choice = response.choices[0]
+    message = choice.message
+    calls = [
+        ToolCall(id=call.id, name=call.function.name, arguments=call.function.arguments or "{}")
+        for call in (getattr(message, "tool_calls", None) or ())
+    ]
+    return ChatResponse(content=message.content, tool_calls=calls, finish_reason=getattr(choice, "finish_reason", None))
+
+
+class ToolCallAssembler:
+    """按index拼接流式响应中的工具调用增量, 支持并行的多个工具调用"""
+
+    def __init__(self):
+        self._calls: dict[int, dict[str, Any]] = {}
+
+    def add(self, event: ToolCallDeltaEvent) -> None:
+        call = self._calls.setdefault(event.index, {"id": None, "name": "", "arguments": []})
+        if event.id:
+            call["id"] = event.id
+        if event.name and not call["name"]:
+            call["name"] = event.name
+        if event.arguments:
+            call["arguments"].append(event.arguments)
+
+    def calls(self) -> list[ToolCall]:
+        return [
+            ToolCall(id=call["id"] or f"call_{index}", name=call["name"], arguments="".join(call["arguments"]) or "{}")
+            for index, call in sorted(self._calls.items())
+        ]
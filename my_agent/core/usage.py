@@ -0,0 +1,183 @@
+"""Token用量与成本统计: 按Agent(名称与实例)、Agent类型、模型与运行聚合"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from .runtime import current_run
+
+
+@dataclass
+class Usage:
+    """累计用量"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    requests: int = 0
+    estimated_requests: int = 0  # 用量为估算值的请求数(流提前结束, 服务端没有返回usage)
+    duration: float = 0.0  # 请求耗时之和(秒)
+    cost: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """平均输出速度"""
+        return self.completion_tokens / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def avg_prompt_tokens(self) -> float:
+        """平均每次请求的提示词token数, 用于发现提示词膨胀"""
+        return self.prompt_tokens / self.requests if self.requests else 0.0
+
+    def add(self, other: "Usage") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.requests += other.requests
+        self.estimated_requests += other.estimated_requests
+        self.duration += other.duration
+        self.cost += other.cost
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "requests": self.requests,
+            "estimated_requests": self.estimated_requests,
+            "duration": round(self.duration, 3),
+            "tokens_per_sec": round(self.tokens_per_sec, 2),
+            "avg_prompt_tokens": round(self.avg_prompt_tokens, 1),
+            "cost": round(self.cost, 6),
+        }
+
+
+class PriceTable:
+    """
+    模型价格表, 单位为每百万token的价格。
+    查找时先精确匹配模型名, 再按最长前缀匹配(如"gpt-4o"可匹配"gpt-4o-2024-08-06")。
+    """
+
+    def __init__(self, prices: Optional[dict[str, tuple[float, float]]] = None):
+        """
+        Args:
+            prices: {模型名: (输入价格, 输出价格)}
+        """
+        self.prices = dict(prices or {})
+
+    def set_price(self, model: str, input_price: float, output_price: float) -> None:
+        self.prices[model] = (input_price, output_price)
+
+    def lookup(self, model: str) -> Optional[tuple[float, float]]:
+        if model in self.prices:
+            return self.prices[model]
+        matches = [name for name in self.prices if model.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.lookup(model)
+        if price is None:
+            return 0.0
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+class UsageTracker:
+    """线程安全的用量聚合器"""
+
+    # agent按名称聚合, 同名的多个实例会合并; agent_id按实例聚合
+    DIMENSIONS = ("agent", "agent_id", "agent_type", "model", "run")
+    # 取值随运行次数或Agent实例数增长的维度, 按max_runs淘汰
+    BOUNDED = ("agent_id", "run")
+
+    def __init__(self, price_table: Optional[PriceTable] = None, max_runs: int = 1000):
+        """
+        Args:
+            price_table: 价格表, 为None时成本记为0
+            max_runs: 按运行与按Agent实例各自最多保留的记录数, 超出后淘汰最久未更新的
+                (每次运行、每个Agent实例各占一条, 不限制会随短生命周期的Agent无限增长)
+        """
+        self.price_table = price_table or PriceTable()
+        self.max_runs = max_runs
+        self._total = Usage()
+        self._groups: dict[str, "OrderedDict[str, Usage]"] = {name: OrderedDict() for name in self.DIMENSIONS}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        duration: float = 0.0,
+        estimated: bool = False,
+    ) -> Usage:
+        """
+        记录一次请求的用量, Agent与运行信息取自当前运行上下文。
+
+        Args:
+            model: 模型名
+            prompt_tokens: 提示词token数
+            completion_tokens: 输出token数
+            duration: 请求耗时(秒)
+            estimated: token数是否为客户端估算值
+
+        Returns:
+            Usage: 本次请求的用量(含成本)
+        """
+        usage = Usage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            requests=1,
+            estimated_requests=int(estimated),
+            duration=duration,
+            cost=self.price_table.cost(model, prompt_tokens, completion_tokens),
+        )
+        run = current_run()
+        labels = {"agent": run.agent, "agent_id": run.agent_id, "agent_type": run.agent_type, "model": model, "run": run.run_id}
+        with self._lock:
+            self._total.add(usage)
+            for dimension, key in labels.items():
+                if key is None:
+                    continue
+                group = self._groups[dimension]
+                group.setdefault(key, Usage()).add(usage)
+                group.move_to_end(key)
+            for dimension in self.BOUNDED:
+                group = self._groups[dimension]
+                while len(group) > self.max_runs:
+                    group.popitem(last=False)
+        return usage
+
+    def total(self) -> Usage:
+        with self._lock:
+            usage = Usage()
+            usage.add(self._total)
+            return usage
+
+    def by(self, dimension: str) -> dict[str, Usage]:
+        """按维度(agent/agent_id/agent_type/model/run)返回用量快照"""
+        with self._lock:
+            snapshot = {}
+            for key, value in self._groups[dimension].items():
+                snapshot[key] = Usage()
+                snapshot[key].add(value)
+            return snapshot
+
+    def summary(self) -> dict[str, Any]:
+        """所有维度的用量汇总, 便于打印或导出"""
+        return {
+            "total": self.total().to_dict(),
+            **{dimension: {k: v.to_dict() for k, v in self.by(dimension).items()} for dimension in self.DIMENSIONS},
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._total = Usage()
+            for group in self._groups.values():
+                group.clear()
+
+
+# 进程级默认统计器, AgentsLLM未指定usage_tracker时使用
+default_tracker = UsageTracker()
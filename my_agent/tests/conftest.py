@@ -0,0 +1,39 @@
+"""测试公用的fixture: 在后台线程的事件循环中运行桩服务(my_agent.bench.stub_server)"""
+
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from my_agent.bench.stub_server import StubServer, StubSettings
+
+
+@contextmanager
+def _serve():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = StubServer(StubSettings(latency=0.01, token_rate=0, tokens=8), port=0)
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+@pytest.fixture
+def stub():
+    """启动一个监听随机端口的桩服务, 可在测试中修改stub.settings调整行为"""
+    with _serve() as server:
+        yield server
+
+
+@pytest.fixture
+def other_stub():
+    """第二个独立的桩服务, 用于故障转移与对冲等需要两个端点的测试"""
+    with _serve() as server:
+        yield server
@@ -0,0 +1,67 @@
+"""自适应并发(AIMD): 出错或延迟突增时收紧上限, 名额用满且正常时放宽"""
+
+import time
+
+from my_agent.core.adaptive import AdaptiveLimiter, get_adaptive_limiter
+from my_agent.core.exceptions import LLMException
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.metrics import MetricsRegistry
+from my_agent.core.retry import RetryPolicy
+
+
+def _limiter(**kwargs) -> AdaptiveLimiter:
+    return AdaptiveLimiter(metrics=MetricsRegistry(), **kwargs)
+
+
+def test_retryable_error_halves_limit_once_per_cooldown():
+    limiter = _limiter(initial=8, cooldown=10)
+    for _ in range(3):
+        assert limiter.acquire(0)
+    for _ in range(3):
+        limiter.release(error=LLMException("overloaded", retryable=True, status_code=503))
+    assert limiter.limit == 4
+    assert limiter.inflight == 0
+
+
+def test_client_error_does_not_shrink():
+    limiter = _limiter(initial=8)
+    limiter.acquire(0)
+    limiter.release(error=LLMException("bad request", retryable=False, status_code=400))
+    assert limiter.limit == 8
+
+
+def test_latency_spike_shrinks_and_saturation_grows():
+    limiter = _limiter(initial=2, cooldown=0)
+    limiter.acquire(0)
+    limiter.release(0.1)
+    # 两个名额都被占用时的正常延迟才会放宽
+    limiter.acquire(0)
+    limiter.acquire(0)
+    limiter.release(0.1)
+    assert limiter.limit > 2
+    limiter.release(1.0)
+    assert limiter.limit < 2
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = _limiter(initial=1)
+    assert limiter.acquire(0)
+    start = time.monotonic()
+    assert not limiter.acquire(0.05)
+    assert time.monotonic() - start >= 0.05
+    limiter.release(0.1)
+    assert limiter.acquire(0)
+
+
+def test_server_errors_shrink_the_endpoint_limit(stub):
+    stub.settings.error_rate = 1.0
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null",
+                    adaptive_concurrency=True, retry_policy=RetryPolicy(max_retries=0))
+    limiter = get_adaptive_limiter(f"{llm.provider}:{stub.base_url}")
+    before = limiter.limit
+    try:
+        llm.invoke([{"role": "user", "content": "hello"}])
+    except LLMException:
+        pass
+    assert limiter.limit < before
+    assert limiter.inflight == 0
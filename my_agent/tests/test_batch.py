@@ -0,0 +1,63 @@
+"""批量调用: 有界并发、按输入顺序返回、单条失败不影响其他请求"""
+
+import asyncio
+import time
+
+from my_agent.core.batch import run_batch
+from my_agent.core.llm import AgentsLLM
+
+
+def _llm(stub) -> AgentsLLM:
+    return AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null")
+
+
+def _messages(n: int) -> list:
+    return [[{"role": "user", "content": f"q{i}"}] for i in range(n)]
+
+
+def test_results_keep_input_order_and_errors_stay_per_item():
+    def fn(i: int) -> int:
+        # 越靠前的越晚完成
+        time.sleep(0.01 * (5 - i))
+        if i == 2:
+            raise ValueError("bad item")
+        return i * 10
+
+    results = run_batch(fn, range(5), max_concurrency=5)
+    assert [r.index for r in results] == [0, 1, 2, 3, 4]
+    assert [r.output for r in results] == [0, 10, None, 30, 40]
+    assert isinstance(results[2].error, ValueError)
+    assert [r.ok for r in results] == [True, True, False, True, True]
+
+
+def test_invoke_many_runs_concurrently(stub):
+    stub.settings.latency = 0.2
+    llm = _llm(stub)
+    # 首次调用导入SDK并创建共享客户端, 不计入并发耗时
+    llm.invoke(_messages(1)[0], max_tokens=1)
+    start = time.monotonic()
+    results = llm.invoke_many(_messages(5), max_concurrency=5, max_tokens=2)
+    assert time.monotonic() - start < 0.8
+    assert [r.output for r in results] == ["tok0 tok1 "] * 5
+    assert stub.stats["requests"] == 6
+
+
+def test_stream_invoke_many_marks_each_request_done(stub):
+    llm = _llm(stub)
+    texts = {}
+    done = []
+    for chunk in llm.stream_invoke_many(_messages(3), max_concurrency=3, max_tokens=3):
+        if chunk.done:
+            assert chunk.error is None
+            done.append(chunk.index)
+        else:
+            texts[chunk.index] = texts.get(chunk.index, "") + chunk.content
+    assert sorted(done) == [0, 1, 2]
+    assert texts == {i: "tok0 tok1 tok2 " for i in range(3)}
+
+
+def test_ainvoke_many_keeps_order(stub):
+    llm = _llm(stub)
+    results = asyncio.run(llm.ainvoke_many(_messages(4), max_concurrency=2, max_tokens=1))
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert all(r.ok and r.output == "tok0 " for r in results)
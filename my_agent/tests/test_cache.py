@@ -0,0 +1,60 @@
+"""响应缓存: 内存/磁盘两级命中, 只缓存正常结束的完整输出"""
+
+import time
+
+from my_agent.core.cache import ResponseCache
+from my_agent.core.llm import AgentsLLM
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _llm(stub, cache: ResponseCache) -> AgentsLLM:
+    return AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null", cache=cache)
+
+
+def test_memory_lru_and_ttl():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    assert cache.get("a") is None
+    cache.set("a", ["1"])
+    cache.set("b", ["2"])
+    assert cache.get("a") == ["1"]
+    cache.set("c", ["3"])
+    # b最久未使用, 被淘汰
+    assert cache.get("b") is None
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path)
+    cache.set("k", ["a", "b"])
+    cache.close()
+    reopened = ResponseCache(path=path)
+    assert reopened.get("k") == ["a", "b"]
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+
+def test_identical_requests_hit_cache_across_stream_and_invoke(stub):
+    llm = _llm(stub, ResponseCache())
+    streamed = "".join(llm.think(MESSAGES))
+    assert llm.invoke(MESSAGES) == streamed
+    assert "".join(llm.think(MESSAGES)) == streamed
+    assert stub.stats["requests"] == 1
+
+
+def test_truncated_output_is_not_cached(stub):
+    llm = _llm(stub, ResponseCache())
+    # 被max_tokens截断(finish_reason=length)
+    llm.invoke(MESSAGES, max_tokens=2)
+    llm.invoke(MESSAGES, max_tokens=2)
+    "".join(llm.think(MESSAGES, max_tokens=2))
+    assert stub.stats["requests"] == 3
+    # 调用方提前停止读取
+    for _chunk in llm.think([{"role": "user", "content": "other"}]):
+        break
+    llm.invoke([{"role": "user", "content": "other"}])
+    assert stub.stats["requests"] == 5
@@ -0,0 +1,20 @@
+"""录制/回放: 多个AgentsLLM共用同一个磁带文件"""
+
+from my_agent.core.cassette import get_cassette
+from my_agent.core.llm import AgentsLLM
+
+
+def test_llms_share_one_recording(stub, tmp_path, monkeypatch):
+    path = str(tmp_path / "session.jsonl")
+    monkeypatch.setenv("LLM_CASSETTE_MODE", "record")
+    first = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null", cassette=path)
+    second = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null", cassette=path)
+    assert first.cassette is second.cassette
+    first.invoke([{"role": "user", "content": "first"}])
+    second.invoke([{"role": "user", "content": "second"}])
+    "".join(first.think([{"role": "user", "content": "third"}]))
+    first.cassette.close()
+
+    replay = get_cassette(path, "replay")
+    assert sum(len(entries) for entries in replay._entries.values()) == 3
+    replay.close()
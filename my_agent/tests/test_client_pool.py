@@ -0,0 +1,41 @@
+"""共享客户端连接池: 经由真实的openai SDK与桩服务完成请求"""
+
+import asyncio
+
+from my_agent.core.client_pool import configure_pool, get_client
+from my_agent.core.llm import AgentsLLM
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def make_llm(stub) -> AgentsLLM:
+    return AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null")
+
+
+def test_invoke_through_pooled_client(stub):
+    llm = make_llm(stub)
+    assert llm.invoke(MESSAGES)
+    assert "".join(llm.think(MESSAGES))
+    assert stub.stats["requests"] == 2
+
+
+def test_ainvoke_through_pooled_client(stub):
+    llm = make_llm(stub)
+    assert asyncio.run(llm.ainvoke(MESSAGES))
+    assert stub.stats["requests"] == 1
+
+
+def test_pool_limits_use_sdk_limits_type(stub):
+    import openai
+
+    limits = configure_pool().limits()
+    assert type(limits) is type(openai.DEFAULT_CONNECTION_LIMITS)
+    assert get_client(stub.base_url, "local", 5.0) is get_client(stub.base_url, "local", 5.0)
+
+
+def test_sdk_transport_errors_are_retryable():
+    import openai
+    from my_agent.core.retry import is_retryable
+
+    http = __import__(type(openai.DEFAULT_CONNECTION_LIMITS).__module__.split(".")[0])
+    assert is_retryable(http.ConnectError("connection refused"))
@@ -0,0 +1,73 @@
+"""上下文窗口裁剪: 工具调用组整体保留或丢弃"""
+
+import pytest
+
+from my_agent.core.context_window import ContextWindowManager, TokenCounter
+from my_agent.core.exceptions import LLMException
+
+
+def tool_call(call_id: str) -> dict:
+    return {"role": "assistant", "content": None,
+            "tool_calls": [{"id": call_id, "type": "function", "function": {"name": "search", "arguments": "{}"}}]}
+
+
+def assert_no_orphans(messages: list[dict]) -> None:
+    open_calls: set[str] = set()
+    for message in messages:
+        if message.get("tool_calls"):
+            open_calls = {call["id"] for call in message["tool_calls"]}
+        elif message["role"] == "tool":
+            assert message["tool_call_id"] in open_calls, f"孤立的tool消息: {message}"
+        else:
+            open_calls = set()
+
+
+def make_manager(messages: list[dict], keep: int) -> ContextWindowManager:
+    """预算恰好只够保留最后keep条消息(外加system)"""
+    counter = TokenCounter()
+    manager = ContextWindowManager("gpt-4o", max_context_tokens=10**6, reserve_tokens=0, counter=counter)
+    needed = counter.count_messages([messages[0]] + messages[-keep:])
+    manager.max_context_tokens = needed
+    return manager
+
+
+def test_pinned_tool_result_keeps_its_assistant_message():
+    messages = [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "old question " * 50},
+        {"role": "assistant", "content": "old answer " * 50},
+        {"role": "user", "content": "new question"},
+        tool_call("a"),
+        {"role": "tool", "tool_call_id": "a", "content": "result " * 20},
+    ]
+    fitted = make_manager(messages, keep=2).fit(messages)
+    assert_no_orphans(fitted)
+    assert fitted[-2:] == messages[-2:]
+    assert fitted[0]["role"] == "system"
+
+
+def test_parallel_tool_results_dropped_with_assistant():
+    messages = [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "q " * 30},
+        {**tool_call("a"), "tool_calls": tool_call("a")["tool_calls"] + tool_call("b")["tool_calls"]},
+        {"role": "tool", "tool_call_id": "a", "content": "ra " * 30},
+        {"role": "tool", "tool_call_id": "b", "content": "rb " * 30},
+        {"role": "assistant", "content": "answer"},
+        {"role": "user", "content": "next"},
+    ]
+    fitted = make_manager(messages, keep=2).fit(messages)
+    assert_no_orphans(fitted)
+    assert fitted[-2:] == messages[-2:]
+
+
+def test_tool_group_too_large_raises_instead_of_orphaning():
+    messages = [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "question"},
+        tool_call("a"),
+        {"role": "tool", "tool_call_id": "a", "content": "result " * 20},
+    ]
+    manager = make_manager(messages, keep=1)
+    with pytest.raises(LLMException):
+        manager.fit(messages)
@@ -0,0 +1,74 @@
+"""运行截止时间: LLM调用、重试与流式输出都以剩余时间为上限, 超时带回部分结果"""
+
+import time
+
+import pytest
+
+from my_agent.core.agent import Agent
+from my_agent.core.config import Config
+from my_agent.core.exceptions import DeadlineExceeded
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.retry import RetryPolicy
+from my_agent.core.runtime import call_with_deadline, deadline, remaining
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _llm(stub, **kwargs) -> AgentsLLM:
+    return AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null", **kwargs)
+
+
+class StreamingAgent(Agent):
+    def run(self, input_text: str, **kwargs) -> str:
+        return "".join(self.llm.think([{"role": "user", "content": input_text}]))
+
+
+def test_nested_deadline_only_tightens():
+    with deadline(5):
+        with deadline(10):
+            assert remaining() <= 5
+        with deadline(0.5):
+            assert remaining() <= 0.5
+
+
+def test_slow_request_is_cut_at_deadline(stub):
+    stub.settings.latency = 2.0
+    llm = _llm(stub, timeout=30)
+    start = time.monotonic()
+    with deadline(0.2), pytest.raises(DeadlineExceeded):
+        llm.invoke(MESSAGES)
+    assert time.monotonic() - start < 1.0
+
+
+def test_retries_stop_at_deadline(stub):
+    stub.settings.error_rate = 1.0
+    stub.settings.retry_after = 1.0
+    llm = _llm(stub, retry_policy=RetryPolicy(max_retries=5, base_delay=0.5))
+    start = time.monotonic()
+    with deadline(0.3), pytest.raises(DeadlineExceeded):
+        llm.invoke(MESSAGES)
+    # 退避等待会越过截止时间, 不再重试
+    assert stub.stats["requests"] == 1
+    assert time.monotonic() - start < 0.3
+
+
+def test_stream_deadline_carries_partial_output(stub):
+    stub.settings.tokens = 100
+    stub.settings.token_rate = 50
+    llm = _llm(stub)
+    with deadline(0.3), pytest.raises(DeadlineExceeded) as info:
+        "".join(llm.think(MESSAGES))
+    assert info.value.partial and info.value.partial.startswith("tok0 ")
+
+
+def test_agent_run_timeout_returns_partial_result(stub):
+    stub.settings.tokens = 100
+    stub.settings.token_rate = 50
+    agent = StreamingAgent("slow", _llm(stub), config=Config(run_timeout=0.3))
+    result = agent.run("hello")
+    assert result.startswith("tok0 ") and len(result) < len("tok0 ") * 100
+
+
+def test_tool_call_is_bounded():
+    with deadline(0.1), pytest.raises(DeadlineExceeded):
+        call_with_deadline(time.sleep, 1)
@@ -0,0 +1,62 @@
+"""嵌入微批处理: 运行上下文与截止时间"""
+
+import asyncio
+import time
+
+import pytest
+
+from my_agent.core.embeddings import EmbeddingBatcher
+from my_agent.core.exceptions import DeadlineExceeded
+from my_agent.core.runtime import current_run, deadline, remaining, run_scope
+
+
+def test_batch_runs_in_caller_context():
+    seen = []
+
+    def embed_fn(texts):
+        seen.append((current_run().agent, remaining()))
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(embed_fn, max_wait=0.01)
+    with run_scope(agent="researcher"), deadline(5):
+        assert [list(v) for v in batcher.embed(["a", "bb"])] == [[1.0], [2.0]]
+    # 用量归属随上下文传递, 截止时间不传递(只限制调用方自己的等待)
+    assert seen == [("researcher", None)]
+    batcher.close()
+
+
+def test_shared_batch_ignores_caller_deadlines():
+    seen = []
+
+    def embed_fn(texts):
+        seen.append((current_run().agent, remaining()))
+        time.sleep(0.2)
+        return [[0.0]] * len(texts)
+
+    batcher = EmbeddingBatcher(embed_fn, max_wait=0.05)
+    with run_scope(agent="patient"):
+        patient = batcher.submit(["x"])
+    with deadline(0.05):
+        impatient = batcher.submit(["y"])
+        with pytest.raises(DeadlineExceeded):
+            batcher.embed(["x"])
+    # 最急的调用方超时, 共享同一批次(含去重后共享Future)的其他调用方照常拿到结果
+    assert [list(future.result(1)) for future in patient + impatient] == [[0.0], [0.0]]
+    assert seen == [("patient", None)]
+    batcher.close()
+
+
+def test_embed_wait_is_bounded_by_deadline():
+    batcher = EmbeddingBatcher(lambda texts: time.sleep(1) or [[0.0]] * len(texts), max_wait=0)
+    start = time.monotonic()
+    with deadline(0.1), pytest.raises(DeadlineExceeded):
+        batcher.embed(["slow"])
+
+    async def run():
+        with deadline(0.1):
+            await batcher.aembed(["slower"])
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert time.monotonic() - start < 0.8
+    batcher.close()
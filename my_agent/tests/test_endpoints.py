@@ -0,0 +1,49 @@
+"""端点池: 相同端点组的AgentsLLM共享在途统计与健康检查线程"""
+
+import threading
+
+from my_agent.core.llm import AgentsLLM
+
+
+def test_instances_share_pool_and_health_thread(stub):
+    urls = [stub.base_url, stub.base_url.replace("127.0.0.1", "localhost")]
+    llms = [AgentsLLM(provider="local", base_url=urls, model="stub-model", sink="null", health_check_interval=60)
+            for _ in range(3)]
+    pool = llms[0].endpoint_pool
+    try:
+        assert all(llm.endpoint_pool is pool for llm in llms)
+        health_threads = [t for t in threading.enumerate() if t is pool._health_thread]
+        assert len(health_threads) == 1
+
+        # 一个实例的在途请求会影响其他实例的选路
+        first = pool.acquire()
+        second = llms[1].endpoint_pool.acquire()
+        assert first is not second
+        pool.release(first)
+        pool.release(second)
+        assert llms[2].invoke([{"role": "user", "content": "hello"}])
+    finally:
+        for llm in llms:
+            llm.close()
+    assert AgentsLLM(provider="local", base_url=urls, model="stub-model", sink="null").endpoint_pool is not pool
+
+
+def test_pool_stops_only_when_last_user_closes(stub):
+    urls = [stub.base_url, stub.base_url.replace("127.0.0.1", "localhost")]
+    first, second = [AgentsLLM(provider="local", base_url=urls, model="stub-model", sink="null",
+                               health_check_interval=60) for _ in range(2)]
+    pool = first.endpoint_pool
+
+    first.close()
+    first.close()  # 重复关闭不会替其他实例释放引用
+    assert not pool._stop.is_set()
+    third = AgentsLLM(provider="local", base_url=urls, model="stub-model", sink="null")
+    assert third.endpoint_pool is pool
+    assert second.invoke([{"role": "user", "content": "hello"}])
+
+    second.close()
+    third.close()
+    assert pool._stop.is_set()
+    fresh = AgentsLLM(provider="local", base_url=urls, model="stub-model", sink="null")
+    assert fresh.endpoint_pool is not pool
+    fresh.close()
@@ -0,0 +1,54 @@
+"""错误分类: 超时、限流与连接错误映射为LLMException(仍是AgentException), 并标明是否可重试"""
+
+import socket
+
+import pytest
+
+from my_agent.core.exceptions import AgentException, LLMException
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.retry import RetryPolicy
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _llm(base_url: str, **kwargs) -> AgentsLLM:
+    return AgentsLLM(provider="local", base_url=base_url, model="stub-model", sink="null",
+                     retry_policy=RetryPolicy(max_retries=0), **kwargs)
+
+
+def _invoke_error(llm: AgentsLLM) -> LLMException:
+    with pytest.raises(AgentException) as info:
+        llm.invoke(MESSAGES)
+    assert isinstance(info.value, LLMException)
+    return info.value
+
+
+def test_rate_limit_is_retryable_with_status(stub):
+    stub.settings.error_rate = 1.0
+    stub.settings.error_status = 429
+    error = _invoke_error(_llm(stub.base_url))
+    assert error.retryable
+    assert error.status_code == 429
+
+
+def test_client_error_is_not_retryable(stub):
+    stub.settings.error_rate = 1.0
+    stub.settings.error_status = 400
+    error = _invoke_error(_llm(stub.base_url))
+    assert not error.retryable
+    assert error.status_code == 400
+
+
+def test_timeout_is_retryable(stub):
+    stub.settings.latency = 1.0
+    error = _invoke_error(_llm(stub.base_url, timeout=0.1))
+    assert error.retryable
+
+
+def test_connection_error_is_retryable():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    error = _invoke_error(_llm(f"http://127.0.0.1:{port}/v1"))
+    assert error.retryable
+    assert error.status_code is None
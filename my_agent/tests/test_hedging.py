@@ -0,0 +1,101 @@
+"""对冲请求: 落败分支的清理与延迟样本"""
+
+import time
+import asyncio
+import threading
+
+from my_agent.core.hedging import HedgePolicy, LatencyHistogram, hedged_call, track_stream
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.usage import UsageTracker
+
+
+class BlockingStream:
+    """读取首个token时一直阻塞, 直到被close()"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+    def read_first_token(self):
+        self.closed.wait(5)
+        raise ConnectionError("stream closed")
+
+
+def test_losing_stream_is_closed_as_soon_as_other_branch_wins():
+    slow = BlockingStream()
+
+    def primary():
+        track_stream(slow)
+        return slow.read_first_token()
+
+    histograms = [LatencyHistogram(), LatencyHistogram()]
+    start = time.monotonic()
+    assert hedged_call([primary, lambda: "hedge"], 0.05, lambda value: None, histograms) == "hedge"
+    assert slow.closed.wait(1)
+    assert time.monotonic() - start < 1
+
+
+def test_losing_primary_latency_is_recorded():
+    histograms = [LatencyHistogram(), LatencyHistogram()]
+
+    def primary():
+        time.sleep(0.5)
+        return "primary"
+
+    assert hedged_call([primary, lambda: "hedge"], 0.1, lambda value: None, histograms) == "hedge"
+    assert len(histograms[1]) == 1
+    # 主请求在对冲胜出时已经等了至少delay秒, 这个截尾样本必须进入它的直方图
+    assert len(histograms[0]) == 1 and histograms[0].percentile(0.5) >= 0.1
+
+
+def test_no_hedge_without_fallback_or_pool(stub):
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null",
+                    hedge=HedgePolicy(default_delay=0.001, min_delay=0.001))
+    assert llm.invoke([{"role": "user", "content": "hello"}])
+    assert stub.stats["requests"] == 1
+
+
+def _hedged_pair(stub, other_stub):
+    """主请求打到慢的stub, 对冲请求打到快的other_stub"""
+    stub.settings.latency = 0.4
+    fallback = AgentsLLM(provider="local", base_url=other_stub.base_url, model="stub-hedge-fallback", sink="null")
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-hedge", sink="null",
+                    usage_tracker=UsageTracker(), hedge=HedgePolicy(min_samples=1000, default_delay=0.05, min_delay=0.05, fallback=fallback))
+    return llm, fallback
+
+
+def test_losing_request_usage_is_recorded(stub, other_stub):
+    llm, _ = _hedged_pair(stub, other_stub)
+    start = time.monotonic()
+    assert llm.invoke([{"role": "user", "content": "hello"}])
+    assert time.monotonic() - start < 0.4
+    assert llm.usage_tracker.total().requests == 1
+
+    # 落败的主请求跑完后同样计入用量, 与胜出的请求一起共两次
+    deadline = time.monotonic() + 2
+    while llm.usage_tracker.total().requests < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    usage = llm.usage_tracker.total()
+    assert usage.requests == 2
+    assert usage.completion_tokens == 2 * stub.settings.tokens
+    assert (stub.stats["requests"], other_stub.stats["requests"]) == (1, 1)
+
+
+def test_losing_async_request_is_cancelled_and_refunded(stub, other_stub):
+    hedged, _ = _hedged_pair(stub, other_stub)
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-hedge-async", sink="null",
+                    usage_tracker=UsageTracker(), tpm=100_000, hedge=hedged.hedge)
+    tokens = llm.rate_limiter.tokens
+
+    async def main():
+        result = await llm.ainvoke([{"role": "user", "content": "hello"}])
+        await asyncio.sleep(0.5)
+        return result
+
+    assert asyncio.run(main())
+    assert llm.usage_tracker.total().requests == 1
+    # 被取消的主请求退还了全部预估配额
+    tokens.refill(time.monotonic())
+    assert tokens.level >= tokens.capacity - 1
@@ -0,0 +1,38 @@
+"""延迟导入: 导入框架不加载openai SDK, provider与凭据解析按参数和环境变量缓存"""
+
+import uuid
+
+from my_agent.bench.import_time import measure
+from my_agent.core.llm import AgentsLLM
+
+
+def test_importing_llm_does_not_load_openai():
+    report = measure("my_agent.core.llm")
+    assert "my_agent.core.llm" in report.modules
+    assert "openai" not in report.modules
+
+
+def test_importing_agent_does_not_load_llm():
+    report = measure("my_agent.core.agent")
+    assert "openai" not in report.modules
+    assert "my_agent.core.llm" not in report.modules
+
+
+def test_endpoint_resolution_is_memoized_per_env(monkeypatch):
+    calls = []
+    original = AgentsLLM._auto_detect_provider
+
+    def counting(self, api_key, base_url):
+        calls.append(base_url)
+        return original(self, api_key, base_url)
+
+    monkeypatch.setattr(AgentsLLM, "_auto_detect_provider", counting)
+    monkeypatch.delenv("LLM_API_KEY", raising=False)
+    base_url = f"http://{uuid.uuid4().hex[:8]}.invalid/v1"
+    AgentsLLM(base_url=base_url, api_key="k", model="m", sink="null")
+    AgentsLLM(base_url=base_url, api_key="k", model="m", sink="null")
+    assert len(calls) == 1
+    # 相关环境变量变化后重新解析
+    monkeypatch.setenv("LLM_API_KEY", "other")
+    AgentsLLM(base_url=base_url, api_key="k", model="m", sink="null")
+    assert len(calls) == 2
@@ -0,0 +1,106 @@
+"""进程内本地模型: 用假的分词器与模型代替transformers, 验证请求到OpenAI形状响应的转换"""
+
+import sys
+import asyncio
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from my_agent.core import local_model
+from my_agent.core.exceptions import LLMException
+from my_agent.core.llm import AgentsLLM
+
+
+class FakeIds(list):
+    @property
+    def shape(self):
+        return (1, len(self))
+
+
+class FakeInputs(dict):
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    """按空格分词, 每个词一个token"""
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return " ".join(message["content"] for message in messages)
+
+    def __call__(self, texts, return_tensors=None):
+        return FakeInputs(input_ids=FakeIds(texts[0].split()))
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(ids)
+
+
+class FakeModel:
+    """把提示原样接上若干个tokN, 不超过max_new_tokens"""
+
+    def __init__(self, reply_tokens: int = 3):
+        self.reply_tokens = reply_tokens
+        self.calls = []
+
+    def generate(self, input_ids, **kwargs):
+        self.calls.append(kwargs)
+        count = min(self.reply_tokens, kwargs["max_new_tokens"])
+        return [list(input_ids) + [f"tok{i}" for i in range(count)]]
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeModel()
+    loaded = SimpleNamespace(tokenizer=FakeTokenizer(), model=model, device="cpu",
+                             torch=SimpleNamespace(inference_mode=contextlib.nullcontext),
+                             lock=contextlib.nullcontext())
+    monkeypatch.setattr(local_model, "_models", {("fake-model", None): loaded})
+    return model
+
+
+def test_completion_has_openai_shape(fake_model):
+    client = local_model.LocalModelClient("fake-model")
+    response = client.chat.completions.create(model="fake-model",
+                                              messages=[{"role": "user", "content": "hello there"}])
+    assert response.choices[0].message.content == "tok0 tok1 tok2"
+    assert response.choices[0].finish_reason == "stop"
+    assert (response.usage.prompt_tokens, response.usage.completion_tokens) == (2, 3)
+    assert fake_model.calls[0]["do_sample"] is False
+    assert fake_model.calls[0]["max_new_tokens"] == local_model.DEFAULT_MAX_NEW_TOKENS
+
+
+def test_max_tokens_and_sampling_are_passed_to_generate(fake_model):
+    client = local_model.LocalModelClient("fake-model")
+    response = client.create(messages=[{"role": "user", "content": "hi"}],
+                             max_tokens=2, temperature=0.7, timeout=5)
+    assert response.choices[0].finish_reason == "length"
+    assert response.usage.completion_tokens == 2
+    assert fake_model.calls[0] == {"max_new_tokens": 2, "do_sample": True, "temperature": 0.7, "max_time": 5.0}
+
+
+def test_tools_are_rejected(fake_model):
+    client = local_model.LocalModelClient("fake-model")
+    with pytest.raises(LLMException):
+        client.create(messages=[{"role": "user", "content": "hi"}], tools=[{"type": "function"}])
+    assert fake_model.calls == []
+
+
+def test_async_client_runs_in_thread(fake_model):
+    client = local_model.AsyncLocalModelClient("fake-model")
+    response = asyncio.run(client.chat.completions.create(messages=[{"role": "user", "content": "hi"}]))
+    assert response.choices[0].message.content == "tok0 tok1 tok2"
+
+
+def test_agents_llm_uses_in_process_model(fake_model):
+    llm = AgentsLLM(provider="transformers", model="fake-model", sink="null")
+    assert llm.invoke([{"role": "user", "content": "hello"}]) == "tok0 tok1 tok2"
+    assert len(fake_model.calls) == 1
+
+
+def test_missing_dependencies_raise_llm_exception(monkeypatch):
+    monkeypatch.setattr(local_model, "_models", {})
+    monkeypatch.setitem(sys.modules, "torch", None)
+    with pytest.raises(LLMException):
+        local_model.load_model("fake-model")
+    assert local_model._models == {}
@@ -0,0 +1,88 @@
+"""RPM/TPM限流: 先到先得, 每次尝试按实际扣减的配额结算"""
+
+import threading
+import time
+import uuid
+
+from my_agent.core.cassette import get_cassette
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.rate_limit import RateLimiter
+from my_agent.core.retry import RetryPolicy
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _level(limiter: RateLimiter) -> float:
+    with limiter._cond:
+        limiter.tokens.refill(time.monotonic())
+        return limiter.tokens.level
+
+
+def _llm(stub, tpm: float, **kwargs) -> AgentsLLM:
+    # 限流器按provider+模型共享, 每个测试用不同的模型名
+    kwargs.setdefault("model", f"stub-{uuid.uuid4().hex[:8]}")
+    return AgentsLLM(provider="local", base_url=stub.base_url, sink="null", tpm=tpm, **kwargs)
+
+
+def test_waiters_are_served_in_arrival_order():
+    limiter = RateLimiter(tpm=60_000)
+    limiter.acquire(60_000)
+    order = []
+
+    def take(name: str, tokens: int) -> None:
+        limiter.acquire(tokens)
+        order.append(name)
+
+    big = threading.Thread(target=take, args=("big", 200))
+    big.start()
+    time.sleep(0.02)
+    # 小请求的配额更早就够了, 但排在大请求之后, 不能插队
+    small = threading.Thread(target=take, args=("small", 1))
+    small.start()
+    big.join(2)
+    small.join(2)
+    assert order == ["big", "small"]
+
+
+def test_reconcile_refunds_only_what_was_charged():
+    limiter = RateLimiter(tpm=600)
+    limiter.acquire(10_000)
+    assert _level(limiter) < 10
+    limiter.reconcile(10_000, 100)
+    assert 490 <= _level(limiter) < 520
+
+
+def test_failed_attempts_refund_their_estimate(stub):
+    stub.settings.error_rate = 1.0
+    llm = _llm(stub, tpm=6000, retry_policy=RetryPolicy(max_retries=2, base_delay=0.0))
+    capacity = llm.rate_limiter.tokens.capacity
+    try:
+        llm.invoke(MESSAGES)
+    except Exception:
+        pass
+    assert stub.stats["requests"] == 3
+    assert _level(llm.rate_limiter) >= capacity - 50
+
+
+def test_successful_call_is_charged_its_actual_usage(stub):
+    llm = _llm(stub, tpm=6000)
+    capacity = llm.rate_limiter.tokens.capacity
+    llm.invoke(MESSAGES, max_tokens=4)
+    "".join(llm.think(MESSAGES, max_tokens=4))
+    # 每次约十几个token, 而不是按max_tokens/默认值估算的数量
+    assert capacity - 60 <= _level(llm.rate_limiter) <= capacity
+
+
+def test_cassette_replay_does_not_refund(stub, tmp_path):
+    path = str(tmp_path / "tape.jsonl")
+    model = f"stub-{uuid.uuid4().hex[:8]}"
+    recorder = _llm(stub, tpm=6000, model=model, cassette=get_cassette(path, "record"))
+    recorder.invoke(MESSAGES)
+    recorder.cassette.close()
+
+    player = _llm(stub, tpm=6000, model=model, cassette=get_cassette(path, "replay"))
+    limiter = player.rate_limiter
+    limiter.acquire(limiter.tokens.capacity)
+    player.invoke(MESSAGES)
+    # 回放没有取过配额, 也就不应退还(之前会按估算与实际之差退还约500个token)
+    assert _level(limiter) < 100
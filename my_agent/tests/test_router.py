@@ -0,0 +1,57 @@
+"""模型路由: 按档位、成本、错误率与(与调用方式对应的)延迟选择模型"""
+
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.router import ModelRoute, ModelRouter
+
+SHORT = [{"role": "user", "content": "hi"}]
+
+
+def _route(stub, name: str, tier: int = 0, cost: float = 1.0) -> ModelRoute:
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model=name, sink="null")
+    return ModelRoute(llm, tier=tier, cost=cost)
+
+
+def test_difficulty_and_prompt_length_pick_tier(stub):
+    small, large = _route(stub, "small", tier=0), _route(stub, "large", tier=2, cost=10.0)
+    router = ModelRouter([small, large], long_prompt_tokens=50)
+    assert router.select(SHORT).name == "small"
+    assert router.select(SHORT, difficulty="hard").name == "large"
+    long_prompt = [{"role": "user", "content": "word " * 400}]
+    assert router.select(long_prompt).name == "large"
+    # 没有满足档位的模型时退回最强的
+    assert router.select(SHORT, difficulty=5).name == "large"
+
+
+def test_cheaper_model_wins_within_tier(stub):
+    router = ModelRouter([_route(stub, "pricey", cost=5.0), _route(stub, "cheap", cost=1.0)])
+    assert router.select(SHORT).name == "cheap"
+
+
+def test_error_prone_model_is_avoided(stub):
+    cheap, backup = _route(stub, "cheap", cost=1.0), _route(stub, "backup", cost=2.0)
+    router = ModelRouter([cheap, backup], max_error_rate=0.5)
+    for _ in range(5):
+        cheap.record(None, True, alpha=0.5)
+    assert router.select(SHORT).name == "backup"
+
+
+def test_latency_is_compared_per_call_type(stub):
+    # a首token快但总耗时长, b反之
+    a, b = _route(stub, "a"), _route(stub, "b")
+    a.record(0.05, False, alpha=1.0, stream=True)
+    a.record(5.0, False, alpha=1.0)
+    b.record(1.0, False, alpha=1.0, stream=True)
+    b.record(1.5, False, alpha=1.0)
+    router = ModelRouter([a, b], cost_weight=0.0)
+    assert router.select(SHORT).name == "b"
+    assert router.select(SHORT, stream=True).name == "a"
+
+
+def test_calls_record_matching_latency(stub):
+    route = _route(stub, "only")
+    router = ModelRouter([route])
+    router.invoke(SHORT, max_tokens=2)
+    assert route.ewma_latency is not None and route.ewma_ttft is None
+    assert "".join(router.stream_invoke(SHORT, max_tokens=2)) == "tok0 tok1 "
+    assert route.ewma_ttft is not None
+    assert route.requests == 2
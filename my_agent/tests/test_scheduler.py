@@ -0,0 +1,111 @@
+"""优先级调度: 交互请求插队到积压的批量请求前面, 租户在途上限与排队超时"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from my_agent.core.exceptions import DeadlineExceeded
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.metrics import MetricsRegistry
+from my_agent.core.runtime import run_scope
+from my_agent.core.scheduler import PriorityScheduler
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+def _queue(scheduler, order, lane, tenant=None):
+    def work():
+        with scheduler.slot(priority=lane, tenant=tenant):
+            order.append((lane, tenant))
+    thread = threading.Thread(target=work)
+    thread.start()
+    return thread
+
+
+def test_interactive_jumps_ahead_of_batch_backlog():
+    scheduler = PriorityScheduler(capacity=1, metrics=MetricsRegistry())
+    order = []
+    held = scheduler.acquire(priority="batch")
+    threads = []
+    for i in range(4):
+        threads.append(_queue(scheduler, order, "batch"))
+        _wait_until(lambda: scheduler.queue_depth("batch") == i + 1)
+    threads.append(_queue(scheduler, order, "interactive"))
+    _wait_until(lambda: scheduler.queue_depth() == 5)
+
+    scheduler.release(held)
+    for thread in threads:
+        thread.join(2)
+    assert order[0] == ("interactive", None)
+    assert len(order) == 5
+    assert scheduler.inflight == 0
+
+
+def test_tenant_limit_yields_to_other_tenants():
+    scheduler = PriorityScheduler(capacity=2, tenant_limits={"noisy": 1}, metrics=MetricsRegistry())
+    order = []
+    held = [scheduler.acquire(tenant="noisy"), scheduler.acquire(tenant="quiet")]
+    first = _queue(scheduler, order, "interactive", "noisy")
+    _wait_until(lambda: scheduler.queue_depth() == 1)
+    second = _queue(scheduler, order, "interactive", "quiet")
+    _wait_until(lambda: scheduler.queue_depth() == 2)
+
+    # 空出的名额属于quiet, noisy仍有一个在途请求, 排在前面也不能放行
+    scheduler.release(held[1])
+    second.join(2)
+    assert order == [("interactive", "quiet")]
+    assert scheduler.queue_depth() == 1
+    scheduler.release(held[0])
+    first.join(2)
+    assert order[-1] == ("interactive", "noisy")
+
+
+def test_queue_timeout_leaves_the_queue():
+    scheduler = PriorityScheduler(capacity=1, metrics=MetricsRegistry())
+    held = scheduler.acquire()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.acquire(timeout=0.05)
+    assert scheduler.queue_depth() == 0
+
+    async def waiter():
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.aacquire(timeout=0.05)
+    asyncio.run(waiter())
+    assert scheduler.queue_depth() == 0
+    scheduler.release(held)
+    assert scheduler.inflight == 0
+
+
+def test_unknown_lane_is_rejected():
+    scheduler = PriorityScheduler(metrics=MetricsRegistry())
+    with pytest.raises(ValueError):
+        scheduler.acquire(priority="urgent")
+
+
+def test_llm_interactive_call_overtakes_batch(stub):
+    stub.settings.latency = 0.05
+    scheduler = PriorityScheduler(capacity=1, metrics=MetricsRegistry())
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-scheduler", sink="null",
+                    scheduler=scheduler)
+    llm.invoke([{"role": "user", "content": "warm up"}])
+    finished = []
+
+    def batch():
+        llm.invoke_many([[{"role": "user", "content": f"batch {i}"}] for i in range(4)], max_concurrency=4)
+        finished.append("batch")
+
+    thread = threading.Thread(target=batch)
+    thread.start()
+    _wait_until(lambda: scheduler.queue_depth("batch") >= 2)
+    with run_scope(priority="interactive"):
+        llm.invoke([{"role": "user", "content": "interactive"}])
+    finished.append("interactive")
+    thread.join(5)
+    assert finished == ["interactive", "batch"]
@@ -0,0 +1,120 @@
+"""请求合并: 相同请求共享一次上游调用, 被所有订阅者放弃的流不能再被新请求加入"""
+
+import asyncio
+import threading
+import time
+
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.singleflight import AsyncSingleFlight, SingleFlight
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+class SlowSource:
+    """逐个产出元素的上游流, close()较慢, 模拟关闭HTTP连接的耗时"""
+
+    def __init__(self, items, interval=0.05, close_delay=0.3):
+        self.items = items
+        self.interval = interval
+        self.close_delay = close_delay
+        self.closed = False
+
+    def __iter__(self):
+        for item in self.items:
+            time.sleep(self.interval)
+            yield item
+
+    def close(self):
+        time.sleep(self.close_delay)
+        self.closed = True
+
+
+class AsyncSlowSource(SlowSource):
+    async def __aiter__(self):
+        for item in self.items:
+            await asyncio.sleep(self.interval)
+            yield item
+
+    async def aclose(self):
+        await asyncio.sleep(self.close_delay)
+        self.closed = True
+
+
+def test_identical_calls_share_one_request():
+    flight = SingleFlight()
+    calls = []
+    gate = threading.Event()
+
+    def fn():
+        calls.append(1)
+        gate.wait(1)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    gate.set()
+    for thread in threads:
+        thread.join(2)
+    assert len(calls) == 1
+    assert sorted(leader for _, leader in results) == [False, False, True]
+    assert {result for result, _ in results} == {"result"}
+
+
+def test_late_call_does_not_join_abandoned_stream():
+    flight = SingleFlight()
+    first = SlowSource([1, 2, 3])
+    iterator, leader = flight.stream("k", lambda: first)
+    assert leader
+    assert next(iterator) == 1
+    iterator.close()
+    # 生产者读到下一个元素后发现没有订阅者, 正在关闭上游
+    time.sleep(0.15)
+    assert not first.closed
+
+    iterator, leader = flight.stream("k", lambda: SlowSource([1, 2, 3]))
+    assert leader
+    assert list(iterator) == [1, 2, 3]
+
+
+def test_late_async_call_does_not_join_abandoned_stream():
+    async def run():
+        flight = AsyncSlowSource([1, 2, 3])
+        group = AsyncSingleFlight()
+
+        async def first():
+            return flight
+
+        async def second():
+            return AsyncSlowSource([1, 2, 3])
+
+        iterator, leader = group.stream("k", first)
+        assert leader
+        assert await iterator.__anext__() == 1
+        await iterator.aclose()
+        await asyncio.sleep(0.15)
+        assert not flight.closed
+
+        iterator, leader = group.stream("k", second)
+        return leader, [item async for item in iterator]
+
+    assert asyncio.run(run()) == (True, [1, 2, 3])
+
+
+def test_coalesced_streams_send_one_request(stub):
+    stub.settings.token_rate = 50
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null", coalesce=True)
+    outputs = []
+
+    def read():
+        outputs.append("".join(llm.think(MESSAGES)))
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert stub.stats["requests"] == 1
+    assert len(set(outputs)) == 1 and outputs[0]
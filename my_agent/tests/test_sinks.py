@@ -0,0 +1,52 @@
+"""输出sink: 按名称创建, 以及库内部诊断信息的去向"""
+
+import asyncio
+
+import pytest
+
+from my_agent.core.config import Config
+from my_agent.core.exceptions import LLMException
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.retry import RetryPolicy
+from my_agent.core.sinks import AsyncQueueSink, StreamSink, diagnostic, diagnostics_to, sink_from_config
+
+
+class RecordingSink(StreamSink):
+    def __init__(self):
+        self.infos: list[str] = []
+
+    def info(self, text: str) -> None:
+        self.infos.append(text)
+
+
+def test_config_selects_async_queue_sink():
+    sink = sink_from_config(Config(stream_sink="async_queue"))
+    assert isinstance(sink, AsyncQueueSink)
+
+    async def run():
+        sink.write("hello")
+        sink.end()
+        return [await sink.queue.get(), await sink.queue.get()]
+
+    assert asyncio.run(run()) == ["hello", None]
+
+
+def test_retry_diagnostics_go_to_llm_sink(stub, capsys):
+    stub.settings.error_rate = 1.0
+    sink = RecordingSink()
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink=sink,
+                    retry_policy=RetryPolicy(max_retries=1, base_delay=0))
+    with pytest.raises(LLMException):
+        llm.invoke([{"role": "user", "content": "hello"}])
+    assert any("重试" in text for text in sink.infos)
+    assert "重试" not in capsys.readouterr().out
+
+
+def test_diagnostic_outside_llm_goes_to_stderr(capsys):
+    diagnostic("outside")
+    sink = RecordingSink()
+    with diagnostics_to(sink):
+        diagnostic("inside")
+    captured = capsys.readouterr()
+    assert "outside" in captured.err and "outside" not in captured.out
+    assert sink.infos == ["inside"]
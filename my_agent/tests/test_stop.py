@@ -0,0 +1,38 @@
+"""客户端停止序列: 跨片段匹配, 命中后提前断开流并记录省下的输出"""
+
+from my_agent.core.events import ContentEvent
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.metrics import MetricsRegistry
+from my_agent.core.rate_limit import DEFAULT_COMPLETION_ESTIMATE
+from my_agent.core.stop import StopMatcher
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_pattern_split_across_chunks_is_held_back():
+    matcher = StopMatcher(["Observation:"])
+    assert matcher.feed("Action: x[1]\nObs") == "Action: x[1]\n"
+    assert matcher.feed("ervation: 42") == ""
+    assert matcher.stopped
+    assert matcher.discarded == len("Observation: 42")
+
+
+def test_tokens_saved_without_max_tokens_uses_default_estimate():
+    matcher = StopMatcher("stop")
+    matcher.feed("a")
+    matcher.feed("b stop")
+    assert matcher.tokens_saved(None) == DEFAULT_COMPLETION_ESTIMATE - 2
+    assert matcher.tokens_saved(10) == 8
+
+
+def test_stream_closes_early_on_stop(stub):
+    stub.settings.tokens = 200
+    metrics = MetricsRegistry()
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null", metrics=metrics)
+    events = llm.think_events(MESSAGES, stop=["tok3"])
+    text = "".join(event.text for event in events if isinstance(event, ContentEvent))
+    assert text == "tok0 tok1 tok2 "
+    labels = {"provider": llm.provider, "model": "stub-model"}
+    assert metrics.get("llm_stop_early_total", **labels) == 1
+    assert metrics.get("llm_stop_tokens_saved_total", **labels) > 0
+    assert metrics.get("llm_stop_chars_discarded_total", **labels) == len("tok3 ")
@@ -0,0 +1,55 @@
+"""流式响应的生命周期: 调用方提前停止读取时必须关闭响应并归还连接"""
+
+import asyncio
+
+import pytest
+
+from my_agent.core.client_pool import configure_pool
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.retry import RetryPolicy
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+POOL_SIZE = 2
+
+
+@pytest.fixture
+def small_pool(stub):
+    """只有POOL_SIZE个连接的客户端, 桩服务慢速输出, 未关闭的流会一直占着连接"""
+    stub.settings.token_rate = 20
+    stub.settings.tokens = 200
+    original = configure_pool().max_connections
+    configure_pool(max_connections=POOL_SIZE)
+    try:
+        yield AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null",
+                        timeout=3, retry_policy=RetryPolicy(max_retries=0))
+    finally:
+        configure_pool(max_connections=original)
+
+
+def test_breaking_out_of_think_releases_connection(small_pool):
+    for _ in range(POOL_SIZE + 1):
+        for _chunk in small_pool.think(MESSAGES):
+            break
+    assert small_pool.invoke(MESSAGES, max_tokens=2)
+
+
+def test_breaking_out_of_athink_releases_connection(small_pool):
+    async def run() -> str:
+        for _ in range(POOL_SIZE + 1):
+            stream = small_pool.athink(MESSAGES)
+            async for _chunk in stream:
+                break
+            await stream.aclose()
+        return await small_pool.ainvoke(MESSAGES, max_tokens=2)
+
+    assert asyncio.run(run())
+
+
+def test_stream_invoke_forwards_request_kwargs(stub):
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null")
+    assert "".join(llm.stream_invoke(MESSAGES, max_tokens=3)) == "tok0 tok1 tok2 "
+
+    async def run() -> str:
+        return "".join([chunk async for chunk in llm.astream_invoke(MESSAGES, max_tokens=2, temperature=0)])
+
+    assert asyncio.run(run()) == "tok0 tok1 "
@@ -0,0 +1,16 @@
+"""原生工具调用接口的返回类型"""
+
+import asyncio
+
+from my_agent.core.llm import AgentsLLM
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_empty_tools_still_returns_chat_response(stub):
+    llm = AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null")
+    response = llm.invoke(MESSAGES, tools=[])
+    assert response.tool_calls == [] and response.content
+    response = asyncio.run(llm.ainvoke(MESSAGES, tools=[]))
+    assert response.tool_calls == [] and response.content
+    assert isinstance(llm.invoke(MESSAGES), str)
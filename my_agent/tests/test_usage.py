@@ -0,0 +1,65 @@
+"""用量统计: 提前结束的流按估算记录, Agent按实例而不是按名称统计"""
+
+from my_agent.core.agent import Agent
+from my_agent.core.llm import AgentsLLM
+from my_agent.core.usage import UsageTracker
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _llm(stub, tracker: UsageTracker) -> AgentsLLM:
+    return AgentsLLM(provider="local", base_url=stub.base_url, model="stub-model", sink="null",
+                     usage_tracker=tracker, include_usage=True)
+
+
+class EchoAgent(Agent):
+    def run(self, input_text: str, **kwargs) -> str:
+        return self.llm.invoke([{"role": "user", "content": input_text}], max_tokens=4)
+
+
+def test_abandoned_stream_records_estimated_usage(stub):
+    stub.settings.tokens = 50
+    tracker = UsageTracker()
+    llm = _llm(stub, tracker)
+    for _chunk in llm.think(MESSAGES):
+        break
+    total = tracker.total()
+    assert total.requests == 1
+    assert total.estimated_requests == 1
+    assert total.prompt_tokens > 0
+
+
+def test_complete_stream_records_reported_usage(stub):
+    tracker = UsageTracker()
+    llm = _llm(stub, tracker)
+    list(llm.think(MESSAGES))
+    total = tracker.total()
+    assert total.requests == 1
+    assert total.estimated_requests == 0
+    assert total.completion_tokens == stub.settings.tokens
+
+
+def test_agents_with_same_name_keep_separate_usage(stub):
+    tracker = UsageTracker()
+    first = EchoAgent("helper", _llm(stub, tracker))
+    second = EchoAgent("helper", _llm(stub, tracker))
+    first.run("hello")
+    first.run("hello")
+    second.run("hello")
+    assert first.get_usage().requests == 2
+    assert second.get_usage().requests == 1
+    assert tracker.by("agent")["helper"].requests == 3
+
+
+def test_per_instance_usage_is_bounded(stub):
+    tracker = UsageTracker(max_runs=3)
+    llm = _llm(stub, tracker)
+    agents = [EchoAgent("helper", llm) for _ in range(5)]
+    for agent in agents:
+        agent.run("hello")
+    assert len(tracker.by("agent_id")) == 3
+    assert len(tracker.by("run")) == 3
+    # 淘汰最早的实例, 最近的实例仍可查询
+    assert agents[0].get_usage().requests == 0
+    assert agents[-1].get_usage().requests == 1
+    assert tracker.total().requests == 5
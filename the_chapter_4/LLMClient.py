@@ -1,7 +1,7 @@
 import os
 from openai import OpenAI
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Optional
 from serpapi import SerpApiClient
 from typing import Dict, Any
 import re
@@ -28,22 +28,28 @@ class HelloAgentsLLM:
 
         self.client = OpenAI(api_key=apiKey, base_url=baseUrl, timeout=timeout)
 
-    def think(self, messages: List[Dict[str, str]], temperature: float = 0) -> str:
+    def think(self, messages: List[Dict[str, str]], temperature: float = 0, stop: Optional[List[str]] = None) -> str:
         """
         调用大语言模型进行思考，并返回其响应。
+        stop: 停止序列。除了传给服务端, 客户端也会检查, 出现时立即断开流(有的服务会忽略stop参数)。
         """
         print(f"正在调用 {self.model} 模型...")
         try:    # 这行代码就是“秘书拿起电话，开始拨号并交流”的那一瞬间。
+            extra = {"stop": stop} if stop else {}
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temperature,
                 stream=True,
+                **extra,
             )
             
             # 处理流式响应
             print("大语言模型响应成功:")
             collected_content = []
+            # 停止序列可能跨两个片段: 末尾最多保留(最长停止序列长度-1)个字符暂不打印, 确认不是停止序列的开头后再输出
+            hold = max(len(p) for p in stop) - 1 if stop else 0
+            printed = 0  # 已打印的字符数
             for chunk in response:
                 if not chunk.choices:
                     continue
@@ -53,8 +59,21 @@ class HelloAgentsLLM:
                 # 检查是否有内容 (content)
                 if delta.content:
                     content = delta.content
-                    print(content, end="", flush=True)
                     collected_content.append(content)
+                    received = "".join(collected_content)
+                    if stop:
+                        # 在累计文本中查找停止序列
+                        hits = [i for i in (received.find(p) for p in stop) if i >= 0]
+                        if hits:
+                            kept = received[:min(hits)]
+                            print(kept[printed:], end="", flush=True)
+                            printed = len(kept)
+                            collected_content = [kept]
+                            response.close()  # 不再接收之后的输出
+                            break
+                    safe = max(printed, len(received) - hold)
+                    print(received[printed:safe], end="", flush=True)
+                    printed = safe
                 
                 # 调试: 如果没有内容，也没有refusal，打印一下delta看看是什么 (可能是tool_calls)
                 elif not (hasattr(delta, 'refusal') and delta.refusal):
@@ -73,9 +92,8 @@ class HelloAgentsLLM:
                     print(f"\n[模型拒绝响应]: {delta.refusal}")
                     return delta.refusal
 
-            print()  # 在流式输出结束后换行
-            
             full_response = "".join(collected_content)
+            print(full_response[printed:])  # 输出暂存的末尾部分, 并在流式输出结束后换行
             
             # 如果是工具调用导致的空内容，我们给一个友好的提示（虽然ReAct框架里我们希望它直接输出Action文本）
             if not full_response:
@@ -215,7 +233,8 @@ class ReActAgent:
                 {"role": "system", "content": system_content},
                 {"role": "user", "content": user_content}
             ]
-            response_text = self.llm_client.think(messages=messages)
+            # 模型会接着编造Observation, 这部分反正要丢弃, 用stop让它在这里停下
+            response_text = self.llm_client.think(messages=messages, stop=["Observation:"])
             
             if not response_text:
                 print("错误:LLM未能返回有效响应。")